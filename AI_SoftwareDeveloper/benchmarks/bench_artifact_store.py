@@ -0,0 +1,73 @@
+"""
+Benchmark of the cross-run artifact store (src/vectorstore/artifacts.py).
+
+Runs a workload of requirements in which every topic comes back in a few variants ("snake
+game", "Snake game", "snake game in python") through the whole graph with FakeChatModel,
+without and with an ArtifactStore, and counts the model calls and the simulated generation
+time. The variants above the similarity threshold reuse the approved user stories, design
+documents and project of the first one and only go through the reviews.
+
+    cd AI_SoftwareDeveloper
+    python -m benchmarks.bench_artifact_store --topics 5 --variants 4 --threshold 0.8
+"""
+import argparse
+import contextlib
+import io
+import tempfile
+import time
+from langchain_core.messages import HumanMessage
+from src.graph.graph_builder import GraphBuilder
+from src.vectorstore.artifacts import ArtifactStore
+from benchmarks.fake_llm import FakeChatModel
+
+TOPICS = ["snake game", "todo list app", "weather dashboard", "chat server", "expense tracker",
+          "url shortener", "markdown editor", "pomodoro timer"]
+VARIANTS = ["Create code for {}", "create code for a {}", "Create code for {} in python", "Create the code of a simple {}",
+            "Create code for {}, please"]
+
+
+def workload(topics: int, variants: int) -> list:
+    return [variant.format(topic) for variant in VARIANTS[:variants] for topic in TOPICS[:topics]]
+
+
+def run(requirements: list, args, store=None) -> dict:
+    model = FakeChatModel(n_files=args.files, file_lines=args.file_lines, seconds_per_kchar=args.seconds_per_kchar)
+    graph = GraphBuilder(model, human_input=lambda *_: "Accepted", artifact_store=store).test_code_builder().compile()
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for requirement in requirements:
+            graph.invoke({"requirement": HumanMessage(content=requirement)}, {"recursion_limit": 100})
+            if store is not None:
+                # The next requirement sees what this one approved, as a later run would
+                store.executor.submit(lambda: None).result()
+    elapsed = time.perf_counter() - started
+    output = sum(call.output_chars for call in model.calls)
+    return {"calls": len(model.calls), "output_kb": output / 1024, "wall_s": elapsed}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cross-run artifact store benchmark.")
+    parser.add_argument("--topics", type=int, default=5)
+    parser.add_argument("--variants", type=int, default=4, help="Phrasings of every topic in the workload.")
+    parser.add_argument("--threshold", type=float, default=0.8)
+    parser.add_argument("--files", type=int, default=5)
+    parser.add_argument("--file-lines", type=int, default=40)
+    parser.add_argument("--seconds-per-kchar", type=float, default=0.002, help="Simulated generation latency.")
+    args = parser.parse_args()
+
+    requirements = workload(args.topics, args.variants)
+    results = {"no store": run(requirements, args)}
+    with tempfile.TemporaryDirectory() as root:
+        store = ArtifactStore(root, threshold=args.threshold)
+        results[f"store, threshold {args.threshold}"] = run(requirements, args, store)
+        store.close()
+
+    print(f"{len(requirements)} requirements, {args.topics} topics x {args.variants} variants")
+    print(f"{'mode':<22} {'model calls':>12} {'output KB':>10} {'wall s':>8}")
+    for mode, r in results.items():
+        print(f"{mode:<22} {r['calls']:>12} {r['output_kb']:>10.1f} {r['wall_s']:>8.2f}")
+    print(store.report())
+
+
+if __name__ == "__main__":
+    main()
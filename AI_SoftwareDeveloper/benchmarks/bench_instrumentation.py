@@ -0,0 +1,77 @@
+"""
+Overhead of the per-node instrumentation, and a sample of its output.
+
+Runs the whole graph against FakeChatModel with and without Instrumentation (events file
+and Prometheus file on), reports the wall time of both, then prints the profile report and
+the first lines of the metrics file of the instrumented run.
+
+    cd AI_SoftwareDeveloper
+    python -m benchmarks.bench_instrumentation --files 50 --repeat 3
+"""
+import argparse
+import asyncio
+import contextlib
+import os
+import statistics
+import tempfile
+import time
+from langchain_core.messages import HumanMessage
+from langgraph.checkpoint.memory import MemorySaver
+from src.graph.graph_builder import GraphBuilder
+from src.graph.instrumentation import Instrumentation
+from benchmarks.fake_llm import FakeChatModel
+
+
+def run(files: int, seconds_per_kchar: float, instrumentation=None, use_async=False) -> float:
+    model = FakeChatModel(n_files=files, seconds_per_kchar=seconds_per_kchar)
+    graph = GraphBuilder(
+        model, human_input=lambda *_: "Accepted", instrumentation=instrumentation
+    ).test_code_builder().compile(checkpointer=MemorySaver())
+    config = {"recursion_limit": 100, "configurable": {"thread_id": f"bench_{files}"}}
+    initial_input = {"requirement": HumanMessage(content="Create code for snake game")}
+    started = time.perf_counter()
+    if use_async:
+        asyncio.run(graph.ainvoke(initial_input, config))
+    else:
+        graph.invoke(initial_input, config)
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Instrumentation overhead benchmark.")
+    parser.add_argument("--files", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seconds-per-kchar", type=float, default=0.0, help="Simulated model latency.")
+    parser.add_argument("--async", dest="use_async", action="store_true", help="Run the graph with ainvoke.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir, open(os.devnull, "w") as devnull:
+        cwd = os.getcwd()
+        os.chdir(workdir)
+        try:
+            plain, instrumented = [], []
+            for _ in range(args.repeat):
+                with contextlib.redirect_stdout(devnull):
+                    plain.append(run(args.files, args.seconds_per_kchar, use_async=args.use_async))
+                    instrumentation = Instrumentation("events.jsonl", "metrics.prom")
+                    instrumented.append(run(args.files, args.seconds_per_kchar, instrumentation, args.use_async))
+                    instrumentation.close()
+            with open("events.jsonl", encoding="utf-8") as f:
+                events = sum(1 for _ in f) // args.repeat
+            with open("metrics.prom", encoding="utf-8") as f:
+                metrics = f.read().splitlines()
+        finally:
+            os.chdir(cwd)
+
+    base, measured = statistics.median(plain), statistics.median(instrumented)
+    print(f"{args.files} generated files, median of {args.repeat} runs")
+    print(f"  without instrumentation  {base * 1000:>9.1f} ms")
+    print(f"  with instrumentation     {measured * 1000:>9.1f} ms  ({(measured - base) / base:+.1%}, {events} events per run)")
+    print()
+    print(instrumentation.report())
+    print()
+    print("\n".join(metrics[:12]))
+
+
+if __name__ == "__main__":
+    main()
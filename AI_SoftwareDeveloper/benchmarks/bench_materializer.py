@@ -0,0 +1,84 @@
+"""
+Benchmark of ProjectMaterializer against the former serial create_project loop.
+
+Writes a synthetic project of --files files three times into the same root: a first run,
+a rerun with no change and a rerun in which --changed of the files differ, and checks the
+tree on disk after every run.
+
+    cd AI_SoftwareDeveloper
+    python -m benchmarks.bench_materializer --files 10000 --changed 0.01
+"""
+import argparse
+import os
+import tempfile
+import time
+from src.tools.materializer import MANIFEST, ProjectMaterializer
+from benchmarks.fake_llm import FakeChatModel
+from src.state.state import GeneratedProject
+
+
+def serial_write(items, root: str) -> None:
+    """The former create_project: one file after the other, every run."""
+    for item in items:
+        full_path = os.path.join(root, item.parent_folder, item.file_path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        with open(full_path, 'w', encoding='utf-8') as f:
+            f.write(item.generated_code)
+
+
+def change(items, fraction: float) -> list:
+    step = max(1, round(1 / fraction)) if fraction else 0
+    return [
+        item.model_copy(update={"generated_code": item.generated_code + "\n# changed"}) if step and index % step == 0 else item
+        for index, item in enumerate(items)
+    ]
+
+
+def check(items, root: str) -> None:
+    on_disk = {
+        os.path.relpath(os.path.join(folder, entry), root).replace(os.sep, "/")
+        for folder, _, entries in os.walk(root) for entry in entries if entry != MANIFEST
+    }
+    expected = {f"{item.parent_folder}/{item.file_path}" for item in items}
+    assert on_disk == expected, f"{len(on_disk ^ expected)} files differ"
+    for item in items[::max(1, len(items) // 100)]:
+        with open(os.path.join(root, item.parent_folder, item.file_path), encoding="utf-8") as f:
+            assert f.read() == item.generated_code
+
+
+def run(files: int, changed: float, file_lines: int, workers: int) -> list:
+    project = FakeChatModel(n_files=files, file_lines=file_lines).fake_value(
+        GeneratedProject, "generated_project", 0
+    ).generated_project
+    runs = [("first run", project), ("no change", project), (f"{changed:.0%} changed", change(project, changed))]
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        serial_root, root = os.path.join(tmp, "serial"), os.path.join(tmp, "materialized")
+        materializer = ProjectMaterializer(max_workers=workers)
+        for label, items in runs:
+            started = time.perf_counter()
+            serial_write(items, serial_root)
+            serial_s = time.perf_counter() - started
+            result = materializer.materialize(items, root)
+            check(items, root)
+            rows.append((label, serial_s, result))
+        materializer.close()
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Project materializer benchmark.")
+    parser.add_argument("--files", type=int, default=10000)
+    parser.add_argument("--file-lines", type=int, default=40)
+    parser.add_argument("--changed", type=float, default=0.01, help="Fraction of the files changed in the last run.")
+    parser.add_argument("--workers", type=int, default=16)
+    args = parser.parse_args()
+
+    print(f"{args.files} files, {args.workers} writer threads (tree checked after every run)")
+    print(f"{'run':<12} {'serial s':>9} {'materializer s':>15} {'written':>8} {'unchanged':>10}")
+    for label, serial_s, result in run(args.files, args.changed, args.file_lines, args.workers):
+        print(f"{label:<12} {serial_s:>9.2f} {result.seconds:>15.2f} {result.written:>8} {result.unchanged:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Offline benchmark of the full GraphBuilder pipeline.
+
+Runs `GraphBuilder(model).test_code_builder()` against FakeChatModel, answers every
+human review with 'Accepted' and reports wall time, prompt characters and output
+size per node for synthetic projects of growing size.
+
+    cd AI_SoftwareDeveloper
+    python -m benchmarks.bench_pipeline --sizes 1 10 100 1000
+"""
+import argparse
+import contextlib
+import json
+import os
+import tempfile
+import time
+from collections import defaultdict
+from langchain_core.messages import HumanMessage
+from langgraph.checkpoint.memory import MemorySaver
+from src.graph.graph_builder import GraphBuilder
+from src.tools.createproject import create_project
+from src.vectorstore.index import ProjectRetriever, load_embeddings
+from benchmarks.fake_llm import FakeChatModel
+
+
+def run_pipeline(n_files: int, file_lines: int = 40, human_review: str = "Accepted",
+                 code_fan_out: bool = False, seconds_per_kchar: float = 0.0, retrieval: str = "") -> dict:
+    """Runs the whole graph once and returns per-node totals keyed by node name."""
+    model = FakeChatModel(n_files=n_files, file_lines=file_lines, seconds_per_kchar=seconds_per_kchar)
+    retriever = ProjectRetriever(load_embeddings(retrieval)) if retrieval else None
+    graph = GraphBuilder(
+        model, code_fan_out=code_fan_out, human_input=lambda *_: human_review, retriever=retriever
+    ).test_code_builder().compile(checkpointer=MemorySaver())
+    config = {"recursion_limit": 100, "configurable": {"thread_id": f"bench_{n_files}"}}
+    initial_input = {"requirement": HumanMessage(content="Create code for snake game")}
+
+    nodes = defaultdict(lambda: {"runs": 0, "wall_s": 0.0, "model_calls": 0, "prompt_chars": 0, "output_chars": 0})
+    with tempfile.TemporaryDirectory() as workdir, open(os.devnull, "w") as devnull:
+        cwd = os.getcwd()
+        os.chdir(workdir)
+        try:
+            with contextlib.redirect_stdout(devnull):
+                seen_calls = 0
+                started = time.perf_counter()
+                for event in graph.stream(initial_input, config=config, stream_mode="updates"):
+                    finished = time.perf_counter()
+                    calls = model.calls[seen_calls:]
+                    seen_calls = len(model.calls)
+                    for node, update in event.items():
+                        stats = nodes[node]
+                        stats["runs"] += 1
+                        stats["wall_s"] += finished - started
+                        stats["model_calls"] += len(calls)
+                        stats["prompt_chars"] += sum(call.prompt_chars for call in calls)
+                        stats["output_chars"] += len(repr(update))
+                    started = time.perf_counter()
+
+                final_state = graph.get_state(config).values
+                started = time.perf_counter()
+                create_project(final_state)
+                stats = nodes["create_project"]
+                stats["runs"] += 1
+                stats["wall_s"] += time.perf_counter() - started
+        finally:
+            os.chdir(cwd)
+    return dict(nodes)
+
+
+def print_report(size: int, nodes: dict) -> None:
+    print(f"\n=== {size} generated files ===")
+    print(f"{'node':<32}{'runs':>6}{'wall ms':>12}{'calls':>7}{'prompt chars':>16}{'output chars':>16}")
+    for node, stats in nodes.items():
+        print(f"{node:<32}{stats['runs']:>6}{stats['wall_s'] * 1000:>12.1f}{stats['model_calls']:>7}"
+              f"{stats['prompt_chars']:>16}{stats['output_chars']:>16}")
+    total = sum(stats["wall_s"] for stats in nodes.values())
+    calls = sum(stats["model_calls"] for stats in nodes.values())
+    print(f"{'total':<32}{'':>6}{total * 1000:>12.1f}{calls:>7}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline fake-LLM benchmark of the code builder graph.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 10, 100, 1000])
+    parser.add_argument("--file-lines", type=int, default=40)
+    parser.add_argument("--fan-out", action="store_true", help="Generate code with the plan-then-fan-out mode.")
+    parser.add_argument("--seconds-per-kchar", type=float, default=0.0,
+                        help="Simulated model latency per 1000 output characters.")
+    parser.add_argument("--retrieval", default="", choices=["", "hash", "huggingface"],
+                        help="Give the review and fix nodes a retrieval index with this embedding backend.")
+    parser.add_argument("--human-review", default="Accepted",
+                        help="Answer given to every human review; free text leaves the decisions to the model.")
+    parser.add_argument("--json", help="Write the raw results to this file for regression comparisons.")
+    args = parser.parse_args()
+
+    results = {}
+    for size in args.sizes:
+        results[size] = run_pipeline(size, file_lines=args.file_lines, human_review=args.human_review,
+                                     code_fan_out=args.fan_out,
+                                     seconds_per_kchar=args.seconds_per_kchar, retrieval=args.retrieval)
+        print_report(size, results[size])
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+How much of the per-file prompts of a code fan-out a provider prefix cache can serve.
+
+Builds the prompt of every planned file of a synthetic project twice: with the former
+layout (one system message, the file to write before the manifest and the design documents)
+and with the registry layout (static instructions, then the shared inputs, the file last).
+A call can be served from the cache for the prefix it shares with an earlier call, counted
+the way OpenAI does: nothing under 1024 tokens, then in steps of 128 tokens.
+
+    cd AI_SoftwareDeveloper
+    python -m benchmarks.bench_prompts --files 10 50
+"""
+import argparse
+import os
+from langchain_core.messages import SystemMessage
+from src.nodes.generate_code import CodeGenerator
+from src.nodes.prompts import PROMPTS
+from src.state.render import count_tokens, render_items
+from src.state.state import DesignDocuments, ProjectManifest
+from benchmarks.fake_llm import FakeChatModel
+
+FORMER_FILE_PROMPT = (
+    "You are an expert AI Software Engineer specializing in full-stack development. Write the complete content of "
+    "**one file** of a project whose full file manifest is given below. Follow best practices, include inline comments, "
+    "and make sure the file integrates with the other files of the manifest (imports, names, APIs).\n\n"
+    "### File to write:\n"
+    "- **Parent folder:** {parent_folder}\n"
+    "- **Path:** {file_path}\n"
+    "- **Purpose:** {purpose}\n\n"
+    "### Project manifest:\n{manifest}\n\n"
+    "### Provided Inputs:\n"
+    "- **Functional & Technical Design Documents:** {design_documents}\n"
+    "- **Code Review Feedback:** {code_review_feedback}\n"
+    "- **Human Review Feedback:** {human_code_review}\n\n"
+    "Return only this file, ready for execution."
+)
+
+
+def prompt_text(messages) -> str:
+    return "".join(message.content for message in messages)
+
+
+def cacheable_tokens(prompts: list) -> tuple:
+    """(total input tokens, tokens that repeat the longest prefix shared with an earlier prompt)."""
+    total = cached = 0
+    for n, prompt in enumerate(prompts):
+        total += count_tokens(prompt)
+        shared = max((len(os.path.commonprefix([prompt, earlier])) for earlier in prompts[:n]), default=0)
+        tokens = count_tokens(prompt[:shared])
+        cached += tokens // 128 * 128 if tokens >= 1024 else 0
+    return total, cached
+
+
+def run(files: int, design_items: int) -> dict:
+    model = FakeChatModel(n_files=files, list_items=design_items)
+    design_docs = render_items(model.fake_value(DesignDocuments, "design_documents", 0).design_documents,
+                               CodeGenerator.CONTEXT_BUDGET // 2)
+    planned_files = CodeGenerator.unique_files(model.fake_value(ProjectManifest, "files", 0))
+    manifest = CodeGenerator.manifest_text(planned_files)
+    generator = CodeGenerator(model)
+    inputs = (design_docs, "No critical issues found.", "Accepted")
+
+    former = [
+        prompt_text([SystemMessage(content=FORMER_FILE_PROMPT.format(
+            parent_folder=planned.parent_folder, file_path=planned.file_path, purpose=planned.purpose,
+            manifest=manifest, design_documents=inputs[0], code_review_feedback=inputs[1], human_code_review=inputs[2],
+        ))])
+        for planned in planned_files
+    ]
+    registry = [prompt_text(generator.file_messages(planned, manifest, *inputs)) for planned in planned_files]
+    return {"former": cacheable_tokens(former), "registry": cacheable_tokens(registry)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prompt prefix cache benchmark of the code fan-out.")
+    parser.add_argument("--files", type=int, nargs="+", default=[10, 50])
+    parser.add_argument("--design-items", type=int, default=40, help="Sections of the synthetic design documents.")
+    args = parser.parse_args()
+
+    print(f"{'files':>6} {'layout':>9} {'input tok':>10} {'cacheable tok':>14} {'cached ratio':>13}")
+    for files in args.files:
+        for layout, (total, cached) in run(files, args.design_items).items():
+            print(f"{files:>6} {layout:>9} {total:>10} {cached:>14} {cached / total:>13.0%}")
+    print(f"Static instruction tokens per prompt: {PROMPTS.static_tokens()['code_file']} (code_file)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Benchmark of the static security pre-scan.
+
+Builds a synthetic project in which --vulnerable of the files contain one of the patterns
+the rules look for, scans it inline, in a process pool and again from the scan cache (the
+next review loop, or files scanned while they streamed in), and compares the size of the
+security audit prompts: the former one (the whole project within the review budget) and
+the pre-scanned one (findings and flagged files only).
+
+    cd AI_SoftwareDeveloper
+    python -m benchmarks.bench_security_scan --files 100 1000 --vulnerable 0.05
+"""
+import argparse
+import time
+from src.nodes.security_review import SecurityReviewer
+from src.state.render import count_tokens, render_project
+from src.state.state import GeneratedProject
+from src.tools.security_scan import SecurityScanner, clear_scan_cache, scan_report
+from benchmarks.fake_llm import FakeChatModel
+
+VULNERABILITIES = (
+    "import subprocess\ndef run(cmd):\n    return subprocess.run(cmd, shell=True)\n",
+    "def query(cursor, name):\n    cursor.execute(f\"SELECT * FROM users WHERE name = '{name}'\")\n",
+    "import hashlib\ndef digest(password):\n    return hashlib.md5(password.encode()).hexdigest()\n",
+    "import pickle\ndef restore(blob):\n    return pickle.loads(blob)\n",
+    "API_KEY = \"sk-live-0123456789abcdef\"\n",
+    "def calculate(expression):\n    return eval(expression)\n",
+)
+
+
+def make_project(files: int, vulnerable: float, file_lines: int) -> list:
+    model = FakeChatModel(n_files=files, file_lines=file_lines)
+    project = model.fake_value(GeneratedProject, "generated_project", 0).generated_project
+    step = max(1, round(1 / vulnerable)) if vulnerable else 0
+    return [
+        item.model_copy(update={"generated_code": f"{VULNERABILITIES[index % len(VULNERABILITIES)]}{item.generated_code}"})
+        if step and index % step == 0 else item
+        for index, item in enumerate(project)
+    ]
+
+
+def run(files: int, vulnerable: float, file_lines: int, workers: int) -> dict:
+    project = make_project(files, vulnerable, file_lines)
+    state = {"generated_project": project}
+    results = {}
+    for label, scanner in (("inline", SecurityScanner(max_workers=1)),
+                           ("pool", SecurityScanner(max_workers=workers, min_parallel_files=0)),
+                           ("cached", SecurityScanner(max_workers=1))):
+        if label != "cached":
+            clear_scan_cache()
+        started = time.perf_counter()
+        report = scan_report(scanner.scan(project))
+        results[f"{label}_ms"] = (time.perf_counter() - started) * 1000
+
+    reviewer = SecurityReviewer(FakeChatModel(), ask=None)
+    flagged = reviewer.flagged_project(state, report)
+    prompt = "\n".join(message.content for message in reviewer.security_review_messages(state, report, flagged))
+    results.update(
+        findings=len(report["findings"]),
+        flagged=len(flagged),
+        legacy_tokens=count_tokens(render_project(project, SecurityReviewer.REVIEW_BUDGET)),
+        prompt_tokens=count_tokens(prompt),
+        project_tokens=sum(count_tokens(item.generated_code) for item in project),
+    )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Static security pre-scan benchmark.")
+    parser.add_argument("--files", type=int, nargs="+", default=[100, 1000])
+    parser.add_argument("--file-lines", type=int, default=40)
+    parser.add_argument("--vulnerable", type=float, default=0.05, help="Fraction of the files with a vulnerability.")
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    print(f"{'files':>6} {'findings':>9} {'flagged':>8} {'inline ms':>10} {'pool ms':>8} {'cached ms':>10} "
+          f"{'project tok':>12} {'former audit tok':>17} {'pre-scanned tok':>16}")
+    for files in args.files:
+        r = run(files, args.vulnerable, args.file_lines, args.workers)
+        print(f"{files:>6} {r['findings']:>9} {r['flagged']:>8} {r['inline_ms']:>10.1f} {r['pool_ms']:>8.1f} {r['cached_ms']:>10.1f} "
+              f"{r['project_tokens']:>12} {r['legacy_tokens']:>17} {r['prompt_tokens']:>16}")
+    print("The former audit prompt is capped at the review budget: past it, files are summarized or omitted.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Startup benchmark: import time and time to a compiled graph, each in a fresh interpreter.
+
+Every case runs --repeat times in a new `python` process and the median wall time is
+reported, so module caches of one case do not help the next one. The 'former' rows import
+both provider packages and build the client as src/LLMS/llm.py used to.
+
+    cd AI_SoftwareDeveloper
+    python -m benchmarks.bench_startup --repeat 5
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+CASES = {
+    "python": "pass",
+    "review CLI (list)": "import sys; sys.argv = ['main_review', '--checkpoint', {checkpoint!r}, 'list']\n"
+                         "from src.main_review import main; main()",
+    "import src.LLMS.llm": "import src.LLMS.llm",
+    "import src.LLMS.llm (former)": "import langchain_groq, langchain_openai, src.LLMS.llm",
+    "import graph_builder": "import src.graph.graph_builder",
+    "worker: compiled graph": "from benchmarks.fake_llm import FakeChatModel\n"
+                              "from src.graph.graph_builder import GraphBuilder\n"
+                              "GraphBuilder(FakeChatModel()).test_code_builder().compile()",
+    "worker: openai model + graph": "from src.LLMS.llm import load_model\n"
+                                    "from src.graph.graph_builder import GraphBuilder\n"
+                                    "GraphBuilder(load_model('openai')).test_code_builder().compile()",
+    "worker: openai model + graph (former)": "import langchain_groq\n"
+                                             "from langchain_openai import ChatOpenAI\n"
+                                             "ChatOpenAI(model='gpt-4o', max_retries=0)\n"
+                                             "from src.LLMS.llm import load_model\n"
+                                             "from src.graph.graph_builder import GraphBuilder\n"
+                                             "GraphBuilder(load_model('openai')).test_code_builder().compile()",
+    "worker + mermaid diagram": "from benchmarks.fake_llm import FakeChatModel\n"
+                                "from src.graph.graph_builder import GraphBuilder\n"
+                                "from src.graph.diagram import draw_graph\n"
+                                "draw_graph(GraphBuilder(FakeChatModel()).test_code_builder().compile(), {stem!r})",
+}
+
+
+def time_case(code: str, repeat: int, env: dict) -> float:
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, "-W", "ignore", "-c", code], check=True, env=env,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        times.append(time.perf_counter() - started)
+    return statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Startup time benchmark.")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    env = {**os.environ, "PYTHONPATH": os.getcwd(), "OPENAI_API_KEY": os.getenv("OPENAI_API_KEY") or "sk-benchmark"}
+    with tempfile.TemporaryDirectory() as tmp:
+        values = {"checkpoint": os.path.join(tmp, "reviews.sqlite"), "stem": os.path.join(tmp, "graph")}
+        # Warm the bytecode caches and the diagram stamp first
+        for code in CASES.values():
+            subprocess.run([sys.executable, "-W", "ignore", "-c", code.format(**values)], env=env,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        print(f"median of {args.repeat} runs, each in a new interpreter")
+        for name, code in CASES.items():
+            print(f"{name:<40} {time_case(code.format(**values), args.repeat, env) * 1000:>8.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
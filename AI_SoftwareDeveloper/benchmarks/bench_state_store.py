@@ -0,0 +1,100 @@
+"""
+Benchmark of StateStore snapshots against the former json.dump(state, default=str).
+
+Saves one snapshot per iteration of a synthetic project in which a fraction of the files
+changes every iteration, checks that every snapshot loads back equal to the saved state,
+and reports bytes on disk and load times (lazy: only a small key is read).
+
+    cd AI_SoftwareDeveloper
+    python -m benchmarks.bench_state_store --files 1000 --iterations 10 --changed 0.05
+"""
+import argparse
+import json
+import tempfile
+import time
+from langchain_core.messages import AIMessage, HumanMessage
+from src.state.serializer import StateStore
+from src.state.state import GeneratedProject, TestCasesCodes, UserStories
+from benchmarks.fake_llm import FakeChatModel
+
+
+def make_state(model: FakeChatModel) -> dict:
+    return {
+        "requirement": HumanMessage(content="Create code for snake game"),
+        "user_stories": model.fake_value(UserStories, "user_stories", 0).user_stories,
+        "generated_project": model.fake_value(GeneratedProject, "generated_project", 0).generated_project,
+        "test_cases_codes": model.fake_value(TestCasesCodes, "test_cases_codes", 0).test_cases_codes,
+        "code_review_feedback": AIMessage(content=model.text_response().content * 20),
+        "decision_code_review_feedback": "Accepted",
+        "times_reject_code": 0,
+    }
+
+
+def next_iteration(state: dict, iteration: int, changed: float) -> dict:
+    """A copy of `state` in which every 1/changed-th file got one more line."""
+    step = max(1, round(1 / changed)) if changed else 0
+    files = []
+    for index, item in enumerate(state["generated_project"]):
+        if step and index % step == iteration % step:
+            item = item.model_copy(update={"generated_code": item.generated_code + f"\n# revision {iteration}"})
+        files.append(item)
+    return {**state, "generated_project": files, "times_reject_code": iteration}
+
+
+def run(files: int, iterations: int, changed: float, file_lines: int) -> dict:
+    state = make_state(FakeChatModel(n_files=files, file_lines=file_lines))
+    results = {"legacy_bytes": 0, "save_s": 0.0}
+    with tempfile.TemporaryDirectory() as root:
+        store = StateStore(root)
+        states = []
+        for iteration in range(iterations):
+            state = next_iteration(state, iteration, changed)
+            states.append(state)
+            results["legacy_bytes"] += len(json.dumps(state, indent=2, default=str).encode("utf-8"))
+            started = time.perf_counter()
+            store.save(state, f"iteration_{iteration:03d}")
+            results["save_s"] += time.perf_counter() - started
+
+        for iteration, expected in enumerate(states):
+            assert dict(store.load(f"iteration_{iteration:03d}")) == expected, f"iteration {iteration} differs"
+
+        last = f"iteration_{iterations - 1:03d}"
+        cold = StateStore(root)
+        started = time.perf_counter()
+        cold.load(last)["decision_code_review_feedback"]
+        results["lazy_load_ms"] = (time.perf_counter() - started) * 1000
+        started = time.perf_counter()
+        cold.load(last, lazy=False)
+        results["full_load_ms"] = (time.perf_counter() - started) * 1000
+        results.update(store.size())
+
+    unique_chars = sum(len(item.generated_code) for item in states[0]["generated_project"])
+    unique_chars += sum(len(item.generated_code) - len(previous.generated_code)
+                        for before, after in zip(states, states[1:])
+                        for previous, item in zip(before["generated_project"], after["generated_project"])
+                        if item is not previous)
+    results["unique_code_chars"] = unique_chars
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="StateStore snapshot size and load time benchmark.")
+    parser.add_argument("--files", type=int, default=1000)
+    parser.add_argument("--file-lines", type=int, default=40)
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--changed", type=float, default=0.05, help="Fraction of the files changed per iteration.")
+    args = parser.parse_args()
+
+    results = run(args.files, args.iterations, args.changed, args.file_lines)
+    store_bytes = results["snapshots"] + results["blobs"]
+    print(f"{args.iterations} snapshots of {args.files} files, {args.changed:.0%} changed per iteration (round trip OK)")
+    print(f"json.dump(default=str):  {results['legacy_bytes'] / 1e6:>9.2f} MB")
+    print(f"StateStore:              {store_bytes / 1e6:>9.2f} MB "
+          f"(snapshots {results['snapshots'] / 1e6:.2f} MB, {results['blob_count']} blobs {results['blobs'] / 1e6:.2f} MB)")
+    print(f"unique code content:     {results['unique_code_chars'] / 1e6:>9.2f} MB uncompressed")
+    print(f"save {results['save_s'] * 1000 / args.iterations:.1f} ms/snapshot, "
+          f"lazy load {results['lazy_load_ms']:.1f} ms, full load {results['full_load_ms']:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
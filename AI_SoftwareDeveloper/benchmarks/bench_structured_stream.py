@@ -0,0 +1,84 @@
+"""
+Benchmark of the streamed project output (src/LLMS/structured_stream.py).
+
+Generates a synthetic project with FakeChatModel, whose latency is proportional to the
+size of its answer, three ways: with_structured_output (nothing is usable until the whole
+answer is in), streamed (every file is usable as soon as its object closes) and streamed
+with an output limit smaller than the project (every cut answer is resumed after its last
+complete file; the one-shot call would fail and lose everything it generated). It also checks
+that a fix answer with nothing to change, {"generated_project": []}, is taken as complete.
+
+    cd AI_SoftwareDeveloper
+    python -m benchmarks.bench_structured_stream --files 10 50 --output-limit 16000
+"""
+import argparse
+import asyncio
+import time
+from langchain_core.messages import HumanMessage
+from src.LLMS.structured_stream import astream_project, stream_project
+from src.state.state import GeneratedProject
+from benchmarks.fake_llm import FakeChatModel
+
+MESSAGES = [HumanMessage(content="Write the project.")]
+
+
+def timed_stream(model, max_resumes) -> dict:
+    started = time.perf_counter()
+    ready = []
+    project = stream_project(model, MESSAGES, on_file=lambda item: ready.append(time.perf_counter() - started),
+                             max_resumes=max_resumes)
+    return {
+        "first_s": ready[0], "median_s": ready[len(ready) // 2], "total_s": time.perf_counter() - started,
+        "files": len(project), "calls": len(model.calls), "output_kb": sum(call.output_chars for call in model.calls) / 1024,
+    }
+
+
+def run(files: int, file_lines: int, seconds_per_kchar: float, output_limit: int) -> dict:
+    results = {}
+
+    model = FakeChatModel(n_files=files, file_lines=file_lines, seconds_per_kchar=seconds_per_kchar)
+    started = time.perf_counter()
+    project = model.with_structured_output(GeneratedProject).invoke(MESSAGES).generated_project
+    total = time.perf_counter() - started
+    results["structured output"] = {
+        "first_s": total, "median_s": total, "total_s": total, "files": len(project),
+        "calls": len(model.calls), "output_kb": model.calls[0].output_chars / 1024,
+    }
+
+    model = FakeChatModel(n_files=files, file_lines=file_lines, seconds_per_kchar=seconds_per_kchar)
+    results["streamed"] = timed_stream(model, max_resumes=0)
+
+    model = FakeChatModel(n_files=files, file_lines=file_lines, seconds_per_kchar=seconds_per_kchar,
+                          max_output_chars=output_limit)
+    results[f"streamed, {output_limit // 1000}k limit"] = timed_stream(model, max_resumes=files)
+    return results
+
+
+def check_empty_answer() -> None:
+    """An empty list of fixes is a complete answer: no fallback call, no error."""
+    model = FakeChatModel(n_files=0)
+    assert stream_project(model, MESSAGES, allow_empty=True) == []
+    assert asyncio.run(astream_project(model, MESSAGES, allow_empty=True)) == []
+    assert [call.schema for call in model.calls] == ["GeneratedProject", "GeneratedProject"], model.calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Streamed project output benchmark.")
+    parser.add_argument("--files", type=int, nargs="+", default=[10, 50])
+    parser.add_argument("--file-lines", type=int, default=40)
+    parser.add_argument("--seconds-per-kchar", type=float, default=0.02, help="Simulated generation latency.")
+    parser.add_argument("--output-limit", type=int, default=16000, help="Characters the model can answer in one call.")
+    args = parser.parse_args()
+
+    check_empty_answer()
+    print(f"{'files':>6} {'mode':<24} {'first file s':>13} {'half files s':>13} {'all files s':>12} "
+          f"{'files':>6} {'calls':>6} {'output KB':>10}")
+    for files in args.files:
+        for mode, r in run(files, args.file_lines, args.seconds_per_kchar, args.output_limit).items():
+            print(f"{files:>6} {mode:<24} {r['first_s']:>13.2f} {r['median_s']:>13.2f} {r['total_s']:>12.2f} "
+                  f"{r['files']:>6} {r['calls']:>6} {r['output_kb']:>10.1f}")
+    print("With the limit, the one-shot call cannot return a project at all: every retry is cut at the same point.")
+
+
+if __name__ == "__main__":
+    main()
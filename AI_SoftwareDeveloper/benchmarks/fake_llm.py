@@ -0,0 +1,157 @@
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import get_args, get_origin, get_type_hints, Literal
+from typing_extensions import is_typeddict
+from pydantic import BaseModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from src.LLMS.structured_stream import PROJECT_FORMAT
+from src.state.state import GeneratedCode, GeneratedProject, PlannedFile, TestCaseCode
+
+
+@dataclass
+class FakeCall:
+    schema: str
+    prompt_chars: int
+    output_chars: int
+
+
+class FakeChatModel:
+    """
+    Deterministic in-process stand-in for ChatOpenAI / ChatGroq.
+    Answers `invoke` with a fixed text and `with_structured_output` with a synthetic
+    instance of the requested schema, so the whole graph runs offline. `stream` answers the
+    requests of src/LLMS/structured_stream.py with the JSON of a synthetic project, cut after
+    `max_output_chars` like a response hitting the output token limit, and continues after
+    the files already present in the conversation.
+    """
+    def __init__(self, n_files=1, file_lines=40, list_items=3, decisions=None, seconds_per_kchar=0.0,
+                 max_output_chars=None, chunk_chars=64):
+        self.n_files = n_files
+        self.file_lines = file_lines
+        self.list_items = list_items
+        # Simulated generation latency, proportional to the size of each response
+        self.seconds_per_kchar = seconds_per_kchar
+        # field name -> list of scripted values, e.g. {"decision_code_review": ["Rejected"]}
+        self.decisions = {field: list(values) for field, values in (decisions or {}).items()}
+        self.max_output_chars = max_output_chars
+        self.chunk_chars = chunk_chars
+        self.calls = []
+
+    @staticmethod
+    def prompt_chars(messages) -> int:
+        if isinstance(messages, str):
+            return len(messages)
+        return sum(len(str(getattr(m, "content", m))) for m in messages)
+
+    def record(self, schema, messages, output) -> float:
+        """Records the call and returns the simulated latency in seconds."""
+        output_chars = len(str(output))
+        self.calls.append(FakeCall(schema, self.prompt_chars(messages), output_chars))
+        return self.seconds_per_kchar * output_chars / 1000
+
+    @staticmethod
+    def text_response() -> AIMessage:
+        return AIMessage(content=(
+            "Review summary:\n"
+            "- No critical issues found.\n"
+            "- Consider adding input validation and logging.\n"
+        ))
+
+    def invoke(self, messages, config=None, **kwargs) -> AIMessage:
+        response = self.text_response()
+        time.sleep(self.record("text", messages, response.content))
+        return response
+
+    async def ainvoke(self, messages, config=None, **kwargs) -> AIMessage:
+        response = self.text_response()
+        await asyncio.sleep(self.record("text", messages, response.content))
+        return response
+
+    def stream_text(self, messages) -> tuple:
+        """(schema name, text) of a streamed answer."""
+        if not any(message.content == PROJECT_FORMAT for message in messages):
+            return "text", self.text_response().content
+        answered = "".join(str(message.content) for message in messages if isinstance(message, AIMessage))
+        project = self.fake_value(GeneratedProject, "generated_project", 0).generated_project
+        remaining = [item for item in project if f'"file_path":"{item.file_path}"' not in answered]
+        text = GeneratedProject(generated_project=remaining).model_dump_json()
+        return "GeneratedProject", text[:self.max_output_chars]
+
+    def stream(self, messages, config=None, **kwargs):
+        schema, text = self.stream_text(messages)
+        delay = self.record(schema, messages, text) / max(1, len(text) / self.chunk_chars)
+        for start in range(0, len(text), self.chunk_chars):
+            time.sleep(delay)
+            yield AIMessageChunk(content=text[start:start + self.chunk_chars])
+
+    async def astream(self, messages, config=None, **kwargs):
+        schema, text = self.stream_text(messages)
+        delay = self.record(schema, messages, text) / max(1, len(text) / self.chunk_chars)
+        for start in range(0, len(text), self.chunk_chars):
+            await asyncio.sleep(delay)
+            yield AIMessageChunk(content=text[start:start + self.chunk_chars])
+
+    def with_structured_output(self, schema, **kwargs):
+        return FakeStructuredOutput(self, schema)
+
+    def fake_code(self, index: int) -> str:
+        lines = [f"# module_{index}.py"]
+        for line in range(self.file_lines - 1):
+            lines.append(f"def function_{index}_{line}(value):  return value + {line}")
+        return "\n".join(lines)
+
+    def fake_test(self, index: int) -> str:
+        """A pytest file that passes against the module of `fake_code`."""
+        module = index % max(1, self.n_files)
+        return (
+            f"from module_{module} import function_{module}_0\n\n"
+            f"def test_function_{module}_0():\n"
+            f"    assert function_{module}_0(1) == 1\n"
+        )
+
+    def fake_value(self, annotation, name: str, index: int):
+        """Builds a deterministic value for `annotation`; `name` is the field being filled."""
+        if annotation is TestCaseCode:
+            return TestCaseCode(file_name=f"test_module_{index}.py", generated_code=self.fake_test(index))
+        origin = get_origin(annotation)
+        if origin is Literal:
+            scripted = self.decisions.get(name)
+            return scripted.pop(0) if scripted else get_args(annotation)[0]
+        if origin is list:
+            item = get_args(annotation)[0]
+            count = self.n_files if item in (GeneratedCode, PlannedFile) else self.list_items
+            return [self.fake_value(item, name, i) for i in range(count)]
+        if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+            return annotation(**{
+                field: self.fake_value(info.annotation, field, index)
+                for field, info in annotation.model_fields.items()
+            })
+        if is_typeddict(annotation):
+            return {field: self.fake_value(hint, field, index) for field, hint in get_type_hints(annotation).items()}
+        if annotation is int:
+            return index
+        if name == "file_path":
+            return f"module_{index}/module_{index}.py"
+        if name == "file_name":
+            return f"test_module_{index}.py"
+        if name == "generated_code":
+            return self.fake_code(index)
+        return f"{name} {index}: deterministic text produced by the fake model."
+
+
+class FakeStructuredOutput:
+    """Runnable returned by `FakeChatModel.with_structured_output`."""
+    def __init__(self, model: FakeChatModel, schema):
+        self.model = model
+        self.schema = schema
+
+    def invoke(self, messages, config=None, **kwargs):
+        response = self.model.fake_value(self.schema, self.schema.__name__, 0)
+        time.sleep(self.model.record(self.schema.__name__, messages, response.model_dump_json()))
+        return response
+
+    async def ainvoke(self, messages, config=None, **kwargs):
+        response = self.model.fake_value(self.schema, self.schema.__name__, 0)
+        await asyncio.sleep(self.model.record(self.schema.__name__, messages, response.model_dump_json()))
+        return response
@@ -0,0 +1,284 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from langchain_core.messages import AIMessageChunk, convert_to_messages, message_to_dict, messages_from_dict, messages_to_dict
+from langchain_core.messages.utils import message_chunk_to_message
+from src.LLMS.telemetry import note_cache_hit
+
+
+class _Pending:
+    """A call that is already being computed by another thread."""
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class LLMCache:
+    """
+    Content-addressed, on-disk SQLite store of LLM responses.
+    Entries expire after `max_age_s` and the least recently used ones are evicted
+    once the store grows past `max_bytes`. Identical calls that are in flight at the
+    same time are collapsed into a single request.
+    """
+    def __init__(self, path=".llm_cache.sqlite", max_bytes=512 * 1024 * 1024, max_age_s=30 * 24 * 3600):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age_s = max_age_s
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.in_flight = {}
+        self.async_in_flight = {}
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+            "created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_accessed ON llm_cache(accessed)")
+
+    @staticmethod
+    def make_key(provider: str, model: str, messages, schema=None, **options) -> str:
+        """Hashes everything that determines the response of a call."""
+        payload = {
+            "provider": provider,
+            "model": model,
+            "messages": messages_to_dict(convert_to_messages(messages)),
+            "schema": None if schema is None else {
+                "name": f"{schema.__module__}.{schema.__qualname__}",
+                "json_schema": schema.model_json_schema(),
+            },
+            "options": options,
+        }
+        serialized = json.dumps(payload, sort_keys=True, default=str)
+        return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+
+    def get(self, key: str):
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute("SELECT value, created FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if now - row[1] > self.max_age_s:
+                self.conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                return None
+            self.conn.execute("UPDATE llm_cache SET accessed = ? WHERE key = ?", (now, key))
+        return row[0]
+
+    def put(self, key: str, value: str) -> None:
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value.encode("utf-8")), now, now),
+            )
+            self.evict(now)
+
+    def evict(self, now=None) -> None:
+        """Drops expired entries, then least recently used ones until under `max_bytes`."""
+        now = now or time.time()
+        self.conn.execute("DELETE FROM llm_cache WHERE created < ?", (now - self.max_age_s,))
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM llm_cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self.conn.execute("SELECT key, size FROM llm_cache ORDER BY accessed").fetchall():
+            self.conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def count(self, hit: bool) -> None:
+        """Counts a hit or a miss; callers run in several threads, so under the lock."""
+        with self.lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if hit:
+            note_cache_hit()
+
+    def clear(self) -> None:
+        with self.lock:
+            self.conn.execute("DELETE FROM llm_cache")
+
+    def get_or_compute(self, key: str, compute, dump, load):
+        """Returns the cached response for `key`, or runs `compute` once for all concurrent callers."""
+        cached = self.get(key)
+        if cached is not None:
+            self.count(hit=True)
+            return load(cached)
+
+        with self.lock:
+            pending = self.in_flight.get(key)
+            owner = pending is None
+            if owner:
+                pending = self.in_flight[key] = _Pending()
+
+        if not owner:
+            pending.done.wait()
+            if pending.error is not None:
+                raise pending.error
+            self.count(hit=True)
+            return load(pending.value)
+
+        try:
+            self.count(hit=False)
+            pending.value = dump(compute())
+            self.put(key, pending.value)
+            return load(pending.value)
+        except Exception as e:
+            pending.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.in_flight[key]
+            pending.done.set()
+
+    async def aget_or_compute(self, key: str, acompute, dump, load):
+        """Async counterpart of `get_or_compute`; concurrent coroutines share one request."""
+        cached = self.get(key)
+        if cached is not None:
+            self.count(hit=True)
+            return load(cached)
+
+        pending = self.async_in_flight.get(key)
+        if pending is not None:
+            value = await asyncio.shield(pending)
+            self.count(hit=True)
+            return load(value)
+
+        pending = self.async_in_flight[key] = asyncio.get_running_loop().create_future()
+        try:
+            self.count(hit=False)
+            value = dump(await acompute())
+            self.put(key, value)
+            pending.set_result(value)
+            return load(value)
+        except asyncio.CancelledError:
+            pending.cancel()
+            raise
+        except Exception as e:
+            pending.set_exception(e)
+            # Mark the exception as retrieved when nobody else was waiting on it.
+            pending.exception()
+            raise
+        finally:
+            del self.async_in_flight[key]
+
+
+def dump_message(message) -> str:
+    return json.dumps(message_to_dict(message))
+
+
+def load_message(value: str):
+    return messages_from_dict([json.loads(value)])[0]
+
+
+class CachedChatModel:
+    """
+    Wraps a chat model so `invoke` and `with_structured_output(...).invoke` are
+    answered from an LLMCache when the same call was already made. `stream` shares the
+    entries of `invoke`: a hit comes back as a single chunk, and a stream that ran to its
+    end is stored; streams in flight are not collapsed.
+    """
+    def __init__(self, llm, provider: str, model_name: str, cache: LLMCache):
+        self.llm = llm
+        self.provider = provider
+        self.model_name = model_name
+        self.cache = cache
+
+    def invoke(self, messages, config=None, **kwargs):
+        key = self.cache.make_key(self.provider, self.model_name, messages, **kwargs)
+        return self.cache.get_or_compute(
+            key, lambda: self.llm.invoke(messages, config, **kwargs), dump_message, load_message
+        )
+
+    async def ainvoke(self, messages, config=None, **kwargs):
+        key = self.cache.make_key(self.provider, self.model_name, messages, **kwargs)
+        return await self.cache.aget_or_compute(
+            key, lambda: self.llm.ainvoke(messages, config, **kwargs), dump_message, load_message
+        )
+
+    def cached_chunk(self, key: str):
+        """The cached response of `key` as a stream chunk, or None."""
+        cached = self.cache.get(key)
+        if cached is None:
+            self.cache.count(hit=False)
+            return None
+        self.cache.count(hit=True)
+        message = load_message(cached)
+        return AIMessageChunk(content=message.content, response_metadata=message.response_metadata)
+
+    def stream(self, messages, config=None, **kwargs):
+        key = self.cache.make_key(self.provider, self.model_name, messages, **kwargs)
+        chunk = self.cached_chunk(key)
+        if chunk is not None:
+            yield chunk
+            return
+        response = None
+        for chunk in self.llm.stream(messages, config, **kwargs):
+            response = chunk if response is None else response + chunk
+            yield chunk
+        if response is not None:
+            self.cache.put(key, dump_message(message_chunk_to_message(response)))
+
+    async def astream(self, messages, config=None, **kwargs):
+        key = self.cache.make_key(self.provider, self.model_name, messages, **kwargs)
+        chunk = self.cached_chunk(key)
+        if chunk is not None:
+            yield chunk
+            return
+        response = None
+        async for chunk in self.llm.astream(messages, config, **kwargs):
+            response = chunk if response is None else response + chunk
+            yield chunk
+        if response is not None:
+            self.cache.put(key, dump_message(message_chunk_to_message(response)))
+
+    def with_structured_output(self, schema, **kwargs):
+        return CachedStructuredOutput(self, schema, self.llm.with_structured_output(schema, **kwargs), kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.llm, name)
+
+
+class CachedStructuredOutput:
+    """Runnable returned by `CachedChatModel.with_structured_output`."""
+    def __init__(self, model: CachedChatModel, schema, runnable, options: dict):
+        self.model = model
+        self.schema = schema
+        self.runnable = runnable
+        self.options = options
+
+    def key(self, messages, kwargs) -> str:
+        return self.model.cache.make_key(
+            self.model.provider, self.model.model_name, messages, self.schema, **self.options, **kwargs
+        )
+
+    def invoke(self, messages, config=None, **kwargs):
+        return self.model.cache.get_or_compute(
+            self.key(messages, kwargs),
+            lambda: self.runnable.invoke(messages, config, **kwargs),
+            lambda response: response.model_dump_json(),
+            self.schema.model_validate_json,
+        )
+
+    async def ainvoke(self, messages, config=None, **kwargs):
+        return await self.model.cache.aget_or_compute(
+            self.key(messages, kwargs),
+            lambda: self.runnable.ainvoke(messages, config, **kwargs),
+            lambda response: response.model_dump_json(),
+            self.schema.model_validate_json,
+        )
+
+    def __getattr__(self, name):
+        return getattr(self.runnable, name)
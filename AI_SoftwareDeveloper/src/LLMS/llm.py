@@ -1,7 +1,86 @@
 import os
+import threading
+from functools import partial
 # import streamlit as st
-from langchain_groq import ChatGroq
-from langchain_openai import ChatOpenAI
+from src.LLMS.cache import CachedChatModel, LLMCache
+from src.LLMS.rate_limit import RateLimitedChatModel, get_limiter
+
+
+class LazyChatModel:
+    """
+    Builds a chat model with `factory` on its first call. Importing a provider package and
+    building its client takes seconds, so it is only paid by runs that reach the provider:
+    commands that never call a model, and runs answered by the response cache, skip it.
+    """
+    def __init__(self, factory):
+        self.factory = factory
+        self.lock = threading.Lock()
+        self.model = None
+
+    def get(self):
+        if self.model is None:
+            with self.lock:
+                if self.model is None:
+                    self.model = self.factory()
+        return self.model
+
+    def invoke(self, messages, config=None, **kwargs):
+        return self.get().invoke(messages, config, **kwargs)
+
+    async def ainvoke(self, messages, config=None, **kwargs):
+        return await self.get().ainvoke(messages, config, **kwargs)
+
+    def stream(self, messages, config=None, **kwargs):
+        return self.get().stream(messages, config, **kwargs)
+
+    def astream(self, messages, config=None, **kwargs):
+        return self.get().astream(messages, config, **kwargs)
+
+    def with_structured_output(self, schema, **kwargs):
+        return LazyChatModel(lambda: self.get().with_structured_output(schema, **kwargs))
+
+    def __getattr__(self, name):
+        if name in ("factory", "lock", "model"):
+            raise AttributeError(name)
+        return getattr(self.get(), name)
+
+
+def chat_groq(selected_model):
+    from langchain_groq import ChatGroq
+    # Retries are handled by the shared rate limiter, not by the client
+    return ChatGroq(model=selected_model, max_retries=0)
+
+
+def chat_openai(selected_model):
+    from langchain_openai import ChatOpenAI
+    return ChatOpenAI(model=selected_model, max_retries=0)
+
+
+def with_cache(llm, provider, user_controls_input):
+    """Wraps `llm` with the on-disk response cache when a `cache_path` is configured."""
+    cache_path = user_controls_input.get('cache_path')
+    if not cache_path:
+        return llm
+    cache = LLMCache(
+        cache_path,
+        max_bytes=user_controls_input.get('cache_max_bytes', 512 * 1024 * 1024),
+        max_age_s=user_controls_input.get('cache_max_age_s', 30 * 24 * 3600),
+    )
+    return CachedChatModel(llm, provider, user_controls_input['selected_model'], cache)
+
+def with_rate_limit(llm, provider, user_controls_input):
+    """
+    Sends every call through the rate limiter shared by this provider/model. Quotas come from
+    `rpm` / `tpm` (unset means no quota, only retries and adaptive concurrency).
+    """
+    limiter = get_limiter(
+        provider, user_controls_input['selected_model'],
+        rpm=user_controls_input.get('rpm'),
+        tpm=user_controls_input.get('tpm'),
+        max_concurrency=user_controls_input.get('max_concurrency', 16),
+        max_retries=user_controls_input.get('max_retries', 6),
+    )
+    return RateLimitedChatModel(llm, limiter)
 
 class GroqLLM:
     def __init__(self,user_controls_input):
@@ -14,7 +93,8 @@ class GroqLLM:
             if api_key=='' and selected_model =='':
                 st.error("Please Enter the Groq API KEY")
             os.environ["GROQ_API_KEY"] = api_key
-            llm = ChatGroq(model=selected_model)
+            llm = with_rate_limit(LazyChatModel(partial(chat_groq, selected_model)), "groq", self.user_controls_input)
+            llm = with_cache(llm, "groq", self.user_controls_input)
 
         except Exception as e:
             raise ValueError(f"Error Occurred with Exception : {e}")
@@ -31,8 +111,33 @@ class OpenAILLM:
             if api_key=='' and selected_model =='':
                 st.error("Please Enter the api key and model")
             os.environ["OPENAI_API_KEY"] = api_key
-            llm = ChatOpenAI(model=selected_model)
+            llm = with_rate_limit(LazyChatModel(partial(chat_openai, selected_model)), "openai", self.user_controls_input)
+            llm = with_cache(llm, "openai", self.user_controls_input)
         except Exception as e:
             raise ValueError(f"Error Occurred with Exception : {e}")
         return llm
-    
\ No newline at end of file
+
+
+# Provider name -> (model loader class, API key environment variable, default model)
+PROVIDERS = {
+    'groq': (GroqLLM, "GROQ_API_KEY", "qwen-2.5-32b"),
+    'openai': (OpenAILLM, "OPENAI_API_KEY", "gpt-4o"),
+}
+
+def rate_limits_from_env() -> dict:
+    """Provider quotas from LLM_RPM / LLM_TPM / LLM_MAX_CONCURRENCY, for `load_model`."""
+    limits = {}
+    for key, env in (('rpm', "LLM_RPM"), ('tpm', "LLM_TPM"), ('max_concurrency', "LLM_MAX_CONCURRENCY")):
+        if os.getenv(env):
+            limits[key] = int(os.getenv(env))
+    return limits
+
+def load_model(provider, selected_model=None, **user_controls_input):
+    """Builds the chat model of `provider`, reading its API key from the environment."""
+    llm_class, api_key_env, default_model = PROVIDERS[provider]
+    user_input = {
+        'api_key': os.getenv(api_key_env),
+        'selected_model': selected_model or default_model,
+        **user_controls_input
+    }
+    return llm_class(user_controls_input=user_input).get_llm_model()
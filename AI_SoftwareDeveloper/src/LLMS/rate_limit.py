@@ -0,0 +1,413 @@
+import asyncio
+import random
+import re
+import threading
+import time
+from langchain_core.messages import convert_to_messages
+from src.state.render import count_tokens
+from src.LLMS.telemetry import note_retry, note_wait
+
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously at `per_minute` / 60 per second, holding at most
+    `burst_s` seconds of refill. Reservations may drive the level negative; the caller then
+    waits until the debt has been refilled, so large requests are paced instead of rejected.
+    """
+    def __init__(self, per_minute: float, burst_s: float = 1.0):
+        self.rate = per_minute / 60.0
+        self.capacity = max(1.0, self.rate * burst_s)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def reserve(self, amount: float, now: float) -> float:
+        """Takes `amount` from the bucket and returns how many seconds to wait before using it."""
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+        self.level -= amount
+        return max(0.0, -self.level / self.rate)
+
+    def adjust(self, amount: float) -> None:
+        """Corrects a reservation once the real usage is known (negative refunds)."""
+        self.level = min(self.capacity, self.level - amount)
+
+
+def status_code(error):
+    code = getattr(error, "status_code", None)
+    if code is None:
+        code = getattr(getattr(error, "response", None), "status_code", None)
+    return code
+
+
+def is_rate_limit(error) -> bool:
+    return status_code(error) == 429 or "RateLimit" in type(error).__name__
+
+
+def is_retryable(error) -> bool:
+    """Rate limits, overloaded or failing servers and dropped connections are worth retrying."""
+    if is_rate_limit(error):
+        return True
+    if status_code(error) in (408, 409, 500, 502, 503, 504, 529):
+        return True
+    return any(name in type(error).__name__ for name in ("Timeout", "APIConnectionError"))
+
+
+def parse_duration(value: str):
+    """Seconds in a header value: '2', '0.5', '250ms' or OpenAI's reset format '1m30.5s'."""
+    value = value.strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = re.findall(r"(\d+(?:\.\d+)?)(ms|h|m|s)", value)
+    if not parts:
+        return None
+    scale = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+    return sum(float(number) * scale[unit] for number, unit in parts)
+
+
+def retry_after(error):
+    """Delay asked for by the server, from Retry-After style headers, if any."""
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    if headers.get("retry-after-ms"):
+        return float(headers["retry-after-ms"]) / 1000
+    for header in ("retry-after", "x-ratelimit-reset-requests", "x-ratelimit-reset-tokens"):
+        if headers.get(header):
+            delay = parse_duration(headers[header])
+            if delay is not None:
+                return delay
+    return None
+
+
+class RateLimiter:
+    """
+    Shared limiter of one provider/model: RPM and TPM token buckets, jittered exponential
+    backoff that honors Retry-After, and an additive-increase / multiplicative-decrease
+    limit on concurrent requests.
+
+    The buckets run at `headroom` of the quota and only allow `burst_s` seconds of burst
+    (providers enforce per-minute quotas over shorter windows), so sustained throughput
+    stays just under the quota. `rpm` / `tpm` of None disable that bucket; retries and
+    adaptive concurrency still apply.
+    """
+    def __init__(self, rpm=None, tpm=None, max_concurrency=16, min_concurrency=1, headroom=0.9, burst_s=1.0,
+                 max_retries=6, base_delay=1.0, max_delay=60.0, expected_output_tokens=1000):
+        self.requests = TokenBucket(rpm * headroom, burst_s) if rpm else None
+        self.tokens = TokenBucket(tpm * headroom, burst_s) if tpm else None
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.expected_output_tokens = expected_output_tokens
+
+        self.lock = threading.Lock()
+        self.slot_freed = threading.Condition(self.lock)
+        # (loop, future) of the coroutines waiting for a slot, woken with the threads on every release
+        self.async_waiters = []
+        self.active = 0
+        self.successes = 0
+        # Every caller waits after a 429, not only the one that received it
+        self.blocked_until = 0.0
+
+        self.calls = 0
+        self.retries = 0
+        self.rate_limited = 0
+
+    def estimate_tokens(self, messages) -> int:
+        """Prompt tokens plus the expected completion, reserved before the request is sent."""
+        prompt = sum(count_tokens(str(message.content)) for message in convert_to_messages(messages))
+        return prompt + self.expected_output_tokens
+
+    def reserve(self, tokens: int) -> float:
+        """Reserves one request and `tokens` tokens; returns the seconds to wait before sending it."""
+        now = time.monotonic()
+        wait = max(0.0, self.blocked_until - now)
+        if self.requests:
+            wait = max(wait, self.requests.reserve(1, now))
+        if self.tokens:
+            wait = max(wait, self.tokens.reserve(tokens, now))
+        return wait
+
+    def acquire(self, tokens: int) -> None:
+        started = time.perf_counter()
+        with self.slot_freed:
+            while self.active >= self.concurrency:
+                self.slot_freed.wait()
+            self.active += 1
+            wait = self.reserve(tokens)
+        if wait:
+            try:
+                time.sleep(wait)
+            except BaseException:
+                self.abandon(tokens)
+                raise
+        note_wait(time.perf_counter() - started)
+
+    async def aacquire(self, tokens: int) -> None:
+        started = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        while True:
+            with self.lock:
+                if self.active < self.concurrency:
+                    self.active += 1
+                    wait = self.reserve(tokens)
+                    break
+                waiter = (loop, loop.create_future())
+                self.async_waiters.append(waiter)
+            try:
+                await waiter[1]
+            except asyncio.CancelledError:
+                with self.lock:
+                    if waiter in self.async_waiters:
+                        self.async_waiters.remove(waiter)
+                raise
+        if wait:
+            try:
+                await asyncio.sleep(wait)
+            except asyncio.CancelledError:
+                # e.g. a discarded speculation: the slot must not stay taken
+                self.abandon(tokens)
+                raise
+        note_wait(time.perf_counter() - started)
+
+    def abandon(self, tokens: int) -> None:
+        """Frees the slot and gives back the reservation of a request that was never sent."""
+        with self.slot_freed:
+            self.active -= 1
+            if self.requests:
+                self.requests.adjust(-1)
+            if self.tokens:
+                self.tokens.adjust(-tokens)
+            self.notify_waiters()
+
+    def notify_waiters(self) -> None:
+        """Wakes the threads and the coroutines waiting for a slot; called with the lock held."""
+        self.slot_freed.notify_all()
+        waiters, self.async_waiters = self.async_waiters, []
+        for loop, future in waiters:
+            try:
+                loop.call_soon_threadsafe(wake, future)
+            except RuntimeError:
+                # Its event loop is closed
+                pass
+
+    def release(self, error=None, estimated=0, used=None) -> None:
+        """Frees the slot and adapts the concurrency limit to the outcome of the request."""
+        with self.slot_freed:
+            self.active -= 1
+            self.calls += 1
+            if self.tokens and used is not None:
+                self.tokens.adjust(used - estimated)
+            if error is not None and is_rate_limit(error):
+                self.rate_limited += 1
+                self.successes = 0
+                self.concurrency = max(self.min_concurrency, self.concurrency // 2)
+            elif error is None:
+                self.successes += 1
+                # One more slot after a full window of successful requests
+                if self.successes >= self.concurrency and self.concurrency < self.max_concurrency:
+                    self.concurrency += 1
+                    self.successes = 0
+            self.notify_waiters()
+
+    def backoff(self, error, attempt: int) -> float:
+        """Delay before the next attempt: the server's Retry-After, else full-jitter exponential."""
+        delay = retry_after(error)
+        if delay is None:
+            delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        with self.lock:
+            self.retries += 1
+            if is_rate_limit(error):
+                self.blocked_until = max(self.blocked_until, time.monotonic() + delay)
+        return delay
+
+    @staticmethod
+    def used_tokens(response):
+        if isinstance(response, dict) and "raw" in response:
+            # Structured output asked with include_raw: the usage is on the raw message
+            response = response["raw"]
+        usage = getattr(response, "usage_metadata", None)
+        return usage.get("total_tokens") if usage else None
+
+    def call(self, messages, compute):
+        """Runs `compute()` under the limits, retrying retryable failures."""
+        estimated = self.estimate_tokens(messages)
+        for attempt in range(self.max_retries + 1):
+            self.acquire(estimated)
+            try:
+                response = compute()
+            except Exception as e:
+                # Failed requests do not use tokens, give the reservation back
+                self.release(e, estimated, used=0)
+                if attempt == self.max_retries or not is_retryable(e):
+                    raise
+                note_retry()
+                delay = self.backoff(e, attempt)
+                time.sleep(delay)
+                note_wait(delay)
+                continue
+            self.release(None, estimated, self.used_tokens(response))
+            return response
+
+    async def acall(self, messages, acompute):
+        """Async variant of `call`; `acompute` returns a new awaitable on every attempt."""
+        estimated = self.estimate_tokens(messages)
+        for attempt in range(self.max_retries + 1):
+            await self.aacquire(estimated)
+            try:
+                response = await acompute()
+            except asyncio.CancelledError as e:
+                # The request may have been sent: its reservation is kept
+                self.release(e, estimated)
+                raise
+            except Exception as e:
+                self.release(e, estimated, used=0)
+                if attempt == self.max_retries or not is_retryable(e):
+                    raise
+                note_retry()
+                delay = self.backoff(e, attempt)
+                await asyncio.sleep(delay)
+                note_wait(delay)
+                continue
+            self.release(None, estimated, self.used_tokens(response))
+            return response
+
+    def stream(self, messages, open_stream):
+        """
+        Generator variant of `call` for streamed responses; `open_stream()` starts a new stream
+        on every attempt. Only failures before the first chunk are retried: after that the
+        chunks are the caller's, and so is the failure.
+        """
+        estimated = self.estimate_tokens(messages)
+        for attempt in range(self.max_retries + 1):
+            self.acquire(estimated)
+            received, used = False, None
+            try:
+                for chunk in open_stream():
+                    received = True
+                    used = self.used_tokens(chunk) or used
+                    yield chunk
+            except Exception as e:
+                self.release(e, estimated, used=used if received else 0)
+                if received or attempt == self.max_retries or not is_retryable(e):
+                    raise
+                note_retry()
+                delay = self.backoff(e, attempt)
+                time.sleep(delay)
+                note_wait(delay)
+                continue
+            except BaseException:
+                # The consumer closed the stream early
+                self.release(None, estimated, used)
+                raise
+            self.release(None, estimated, used)
+            return
+
+    async def astream(self, messages, open_stream):
+        """Async variant of `stream`; `open_stream()` returns a new async iterator on every attempt."""
+        estimated = self.estimate_tokens(messages)
+        for attempt in range(self.max_retries + 1):
+            await self.aacquire(estimated)
+            received, used = False, None
+            try:
+                async for chunk in open_stream():
+                    received = True
+                    used = self.used_tokens(chunk) or used
+                    yield chunk
+            except Exception as e:
+                self.release(e, estimated, used=used if received else 0)
+                if received or attempt == self.max_retries or not is_retryable(e):
+                    raise
+                note_retry()
+                delay = self.backoff(e, attempt)
+                await asyncio.sleep(delay)
+                note_wait(delay)
+                continue
+            except asyncio.CancelledError as e:
+                self.release(e, estimated, used)
+                raise
+            except BaseException:
+                self.release(None, estimated, used)
+                raise
+            self.release(None, estimated, used)
+            return
+
+
+def wake(future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(provider: str, model_name: str, **limits) -> RateLimiter:
+    """The process-wide limiter of a provider/model, created with `limits` on first use."""
+    with _limiters_lock:
+        key = (provider, model_name)
+        if key not in _limiters:
+            _limiters[key] = RateLimiter(**limits)
+        return _limiters[key]
+
+
+class RateLimitedChatModel:
+    """
+    Wraps a chat model so `invoke`, `stream` and `with_structured_output(...).invoke` go through
+    the RateLimiter shared by every model of the same provider/model.
+    """
+    def __init__(self, llm, limiter: RateLimiter):
+        self.llm = llm
+        self.limiter = limiter
+
+    def invoke(self, messages, config=None, **kwargs):
+        return self.limiter.call(messages, lambda: self.llm.invoke(messages, config, **kwargs))
+
+    async def ainvoke(self, messages, config=None, **kwargs):
+        return await self.limiter.acall(messages, lambda: self.llm.ainvoke(messages, config, **kwargs))
+
+    def stream(self, messages, config=None, **kwargs):
+        return self.limiter.stream(messages, lambda: self.llm.stream(messages, config, **kwargs))
+
+    def astream(self, messages, config=None, **kwargs):
+        return self.limiter.astream(messages, lambda: self.llm.astream(messages, config, **kwargs))
+
+    def with_structured_output(self, schema, include_raw=False, **kwargs):
+        # The raw message carries the token usage that corrects the TPM reservation
+        runnable = self.llm.with_structured_output(schema, include_raw=True, **kwargs)
+        return RateLimitedStructuredOutput(self.limiter, runnable, include_raw)
+
+    def __getattr__(self, name):
+        return getattr(self.llm, name)
+
+
+class RateLimitedStructuredOutput:
+    """
+    Runnable returned by `RateLimitedChatModel.with_structured_output`. Its runnable always
+    returns the raw message too; the parsed object alone is returned unless the caller asked
+    for `include_raw`.
+    """
+    def __init__(self, limiter: RateLimiter, runnable, include_raw=False):
+        self.limiter = limiter
+        self.runnable = runnable
+        self.include_raw = include_raw
+
+    def result(self, response):
+        if self.include_raw or not (isinstance(response, dict) and "parsed" in response):
+            return response
+        if response.get("parsing_error") is not None:
+            raise response["parsing_error"]
+        return response["parsed"]
+
+    def invoke(self, messages, config=None, **kwargs):
+        return self.result(self.limiter.call(messages, lambda: self.runnable.invoke(messages, config, **kwargs)))
+
+    async def ainvoke(self, messages, config=None, **kwargs):
+        return self.result(
+            await self.limiter.acall(messages, lambda: self.runnable.ainvoke(messages, config, **kwargs))
+        )
+
+    def __getattr__(self, name):
+        return getattr(self.runnable, name)
@@ -0,0 +1,76 @@
+import json
+import os
+from fnmatch import fnmatchcase
+from src.LLMS.llm import PROVIDERS, load_model
+
+
+def parse_spec(spec: str) -> tuple:
+    """'provider:model' or 'provider' (its default model) -> (provider, model or None)."""
+    provider, _, model_name = spec.strip().partition(":")
+    if provider not in PROVIDERS:
+        raise ValueError(f"Unknown provider in model spec '{spec}', expected one of {sorted(PROVIDERS)}")
+    return provider, model_name or None
+
+
+class ModelRouter:
+    """
+    Picks the model of each graph node. `routes` maps node names, or glob patterns such
+    as 'decision_*', to a model spec ('provider:model') or to a model object; nodes that
+    match no route use `default`. Exact names win over patterns, patterns are tried in order.
+    Models are loaded once per spec with `load_options` (cache path, rate limits, ...).
+    """
+    def __init__(self, default, routes=None, loader=load_model, **load_options):
+        self.default = default
+        self.routes = dict(routes or {})
+        self.loader = loader
+        self.load_options = load_options
+        self.models = {}
+
+    def route_for(self, node: str):
+        if node in self.routes:
+            return self.routes[node]
+        for pattern, route in self.routes.items():
+            if fnmatchcase(node, pattern):
+                return route
+        return self.default
+
+    def load(self, route):
+        if not isinstance(route, str):
+            return route
+        if route not in self.models:
+            self.models[route] = self.loader(*parse_spec(route), **self.load_options)
+        return self.models[route]
+
+    def model_for(self, node: str):
+        """The model the node `node` should call."""
+        return self.load(self.route_for(node))
+
+    @staticmethod
+    def parse_routes(config: str) -> dict:
+        """
+        Routes from a JSON file, a JSON object or 'pattern=spec' pairs separated by commas,
+        e.g. 'decision_*=groq:llama-3.1-8b-instant,generate_code=openai:gpt-4o'.
+        """
+        config = (config or "").strip()
+        if not config:
+            return {}
+        if os.path.isfile(config):
+            with open(config, encoding="utf-8") as f:
+                return json.load(f)
+        if config.startswith("{"):
+            return json.loads(config)
+        routes = {}
+        for pair in config.split(","):
+            pattern, _, spec = pair.partition("=")
+            if not spec:
+                raise ValueError(f"Invalid model route '{pair}', expected 'node=provider:model'")
+            routes[pattern.strip()] = spec.strip()
+        return routes
+
+    @classmethod
+    def from_config(cls, default: str, config: str = "", **load_options) -> "ModelRouter":
+        """Router with the `default` spec and the routes of `config` (see `parse_routes`)."""
+        routes = cls.parse_routes(config)
+        for spec in [default, *routes.values()]:
+            parse_spec(spec)
+        return cls(default, routes, **load_options)
@@ -0,0 +1,253 @@
+"""
+Streamed structured output for whole projects.
+
+`with_structured_output(GeneratedProject)` returns nothing until the last file has been
+generated, and a response cut off by the output token limit or a dropped connection fails
+as a whole. `stream_project` asks for the same JSON as plain text and streams it through the
+usual model wrappers (instrumentation, cache, rate limiter). ProjectStreamParser parses the
+text as it arrives: every GeneratedCode is validated and passed to `on_file` as soon as its
+object closes. When the stream ends before the list of files does, the model is asked to
+continue after the last complete file, up to `max_resumes` times. The conversation grows
+with each attempt, so every request shares the previous one's prefix, and files that were
+already received are kept instead of generated again.
+
+A partial project is never returned: where a project replaces the previous one, a missing
+file reads as a deleted one. When the answers stay incomplete, hold no file, or some files do
+not validate, the project is asked once more with `with_structured_output` and that answer is
+returned instead. Callers whose answer lists only the files to change (the fix nodes) pass
+`allow_empty`, so a complete empty list means "nothing to change".
+"""
+import json
+import re
+from typing import get_args
+from langchain_core.messages import AIMessage, HumanMessage
+from src.LLMS.rate_limit import is_retryable
+from src.state.render import file_key
+from src.state.state import GeneratedCode, GeneratedProject
+
+# Tag of the streamed calls: src/stream_runner.py shows them as a character counter, not as text
+STREAM_CONFIG = {"tags": ["structured_output"]}
+MAX_RESUMES = 3
+
+PROJECT_FORMAT = (
+    "Answer with one JSON object and nothing else, in this format:\n"
+    '{{"generated_project": [{{"parent_folder": "...", "file_path": "...", "generated_code": "..."}}, ...]}}\n'
+    "parent_folder is one of {folders}; file_path is relative to it; generated_code is the complete content of the file."
+).format(folders=", ".join(get_args(GeneratedCode.model_fields["parent_folder"].annotation)))
+
+CONTINUE_PROJECT = (
+    "Your answer was cut off. These files are complete: {files}. Continue with the remaining files only, "
+    "as a new JSON object in the same format, without repeating the complete files."
+)
+
+STRUCTURE = re.compile(r'[{}\[\]"]')
+STRING_END = re.compile(r'["\\]')
+
+
+class IncompleteProjectError(ValueError):
+    """A streamed project that could not be received whole."""
+
+
+class ProjectStreamParser:
+    """
+    Incremental parser of {"generated_project": [{...}, ...]} (or of a bare list of files).
+    `feed` scans only the new text, jumping over string contents with a regex, and returns the
+    items its text completed. Text before the JSON, like a code fence, is ignored.
+    """
+    def __init__(self, schema=GeneratedCode):
+        self.schema = schema
+        # Containers open at the current position, '{' or '['
+        self.stack = []
+        self.in_string = False
+        self.escaped = False
+        # Depth of the list of items once it is open
+        self.items_depth = None
+        # Items started in that list; a bare list closed without any was prose, e.g. "the project [as JSON]:"
+        self.started = 0
+        # Text of the item being received, in pieces
+        self.item = None
+        # The list of items was closed
+        self.done = False
+        self.received = 0
+        # Characters fed up to the end of the last complete item
+        self.complete_end = 0
+        # Errors of the items that did not validate against `schema`
+        self.invalid = []
+
+    def parse(self, text: str):
+        try:
+            return self.schema.model_validate(json.loads(text))
+        except ValueError as e:
+            self.invalid.append(str(e).splitlines()[0])
+            return None
+
+    def feed(self, text: str) -> list:
+        items = []
+        start, pos, end = 0, 0, len(text)
+        while pos < end and not self.done:
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                    pos += 1
+                    continue
+                match = STRING_END.search(text, pos)
+                if match is None:
+                    break
+                pos = match.end()
+                if match.group() == "\\":
+                    self.escaped = True
+                else:
+                    self.in_string = False
+                continue
+            match = STRUCTURE.search(text, pos)
+            if match is None:
+                break
+            char, pos = match.group(), match.end()
+            if not self.stack and char not in "{[":
+                # Quotes and brackets around the JSON, e.g. in a sentence before it
+                continue
+            if char == '"':
+                self.in_string = True
+            elif char in "{[":
+                self.stack.append(char)
+                if char == "[" and self.items_depth is None and len(self.stack) <= 2:
+                    self.items_depth = len(self.stack)
+                elif char == "{" and self.items_depth is not None and self.item is None and len(self.stack) == self.items_depth + 1:
+                    self.item, start = [], match.start()
+                    self.started += 1
+            else:
+                self.stack.pop()
+                if self.item is not None and len(self.stack) == self.items_depth:
+                    self.item.append(text[start:pos])
+                    item = self.parse("".join(self.item))
+                    if item is not None:
+                        items.append(item)
+                    self.item = None
+                    self.complete_end = self.received + pos
+                elif self.items_depth is not None and len(self.stack) < self.items_depth:
+                    if self.started or self.stack == ["{"]:
+                        # Also {"generated_project": []}: an answer with nothing to change
+                        self.done = True
+                    else:
+                        self.items_depth = None
+        if self.item is not None:
+            self.item.append(text[start:])
+        self.received += end
+        return items
+
+
+def chunk_text(chunk) -> str:
+    content = getattr(chunk, "content", chunk)
+    if isinstance(content, str):
+        return content
+    # Content blocks of providers that stream lists
+    return "".join(block.get("text", "") if isinstance(block, dict) else str(block) for block in content)
+
+
+class ProjectCollector:
+    """Files received over the attempts of one streamed project; the first complete version of a path wins."""
+    def __init__(self, on_file=None, allow_empty=False):
+        self.on_file = on_file
+        # A complete answer without files is valid, e.g. fixes with nothing to fix
+        self.allow_empty = allow_empty
+        self.files = {}
+        # Validation errors of the files that had to be dropped
+        self.invalid = []
+
+    def add(self, items) -> None:
+        for item in items:
+            if file_key(item) not in self.files:
+                self.files[file_key(item)] = item
+                if self.on_file is not None:
+                    self.on_file(item)
+
+    def parsed(self, parser: ProjectStreamParser) -> bool:
+        """Keeps the validation errors of an attempt; True when its answer was complete."""
+        self.invalid.extend(parser.invalid)
+        return parser.done
+
+    def continuation(self, request: list, text: str, parser: ProjectStreamParser) -> list:
+        """`request` followed by the answer up to its last complete file and the request to go on."""
+        return request + [
+            AIMessage(content=text[:parser.complete_end]),
+            HumanMessage(content=CONTINUE_PROJECT.format(files=", ".join(self.files))),
+        ]
+
+    def result(self, done: bool, error) -> list:
+        """The files received, or IncompleteProjectError when the project is not whole."""
+        if not done:
+            raise IncompleteProjectError(
+                f"The streamed project ended after {len(self.files)} complete files"
+            ) from error
+        if not self.files and not self.allow_empty:
+            raise IncompleteProjectError("The streamed project has no file")
+        if self.invalid:
+            raise IncompleteProjectError(f"{len(self.invalid)} streamed files did not validate: {self.invalid[0]}")
+        return list(self.files.values())
+
+    def fallback(self, error: IncompleteProjectError, project) -> list:
+        """The files of the structured output answer that replaces an incomplete stream."""
+        print(f"⚠️ {error}; asking for the whole project as structured output.")
+        files = project.generated_project
+        if not files and not self.allow_empty:
+            raise IncompleteProjectError("The structured output project has no file") from error
+        for item in files:
+            if self.on_file is not None and file_key(item) not in self.files:
+                self.on_file(item)
+        return files
+
+
+def stream_project(llm, messages, on_file=None, max_resumes=MAX_RESUMES, allow_empty=False) -> list:
+    """
+    The GeneratedCode list of the project `messages` ask for, streamed; `on_file(item)` runs on
+    every file as soon as it is complete. Truncated answers are resumed from their last complete file;
+    a project that stays incomplete is asked again with structured output. With `allow_empty`, a
+    complete answer without files returns [].
+    """
+    collector = ProjectCollector(on_file, allow_empty)
+    request = list(messages) + [HumanMessage(content=PROJECT_FORMAT)]
+    for _ in range(max_resumes + 1):
+        parser, text, error = ProjectStreamParser(), [], None
+        received = len(collector.files)
+        try:
+            for chunk in llm.stream(request, STREAM_CONFIG):
+                text.append(chunk_text(chunk))
+                collector.add(parser.feed(text[-1]))
+        except Exception as e:
+            # Connection losses keep what arrived; anything else is not a truncation
+            if not is_retryable(e):
+                raise
+            error = e
+        done = collector.parsed(parser)
+        if done or len(collector.files) == received:
+            break
+        request = collector.continuation(request, "".join(text), parser)
+    try:
+        return collector.result(done, error)
+    except IncompleteProjectError as e:
+        return collector.fallback(e, llm.with_structured_output(GeneratedProject).invoke(list(messages)))
+
+
+async def astream_project(llm, messages, on_file=None, max_resumes=MAX_RESUMES, allow_empty=False) -> list:
+    """Async variant of `stream_project`."""
+    collector = ProjectCollector(on_file, allow_empty)
+    request = list(messages) + [HumanMessage(content=PROJECT_FORMAT)]
+    for _ in range(max_resumes + 1):
+        parser, text, error = ProjectStreamParser(), [], None
+        received = len(collector.files)
+        try:
+            async for chunk in llm.astream(request, STREAM_CONFIG):
+                text.append(chunk_text(chunk))
+                collector.add(parser.feed(text[-1]))
+        except Exception as e:
+            if not is_retryable(e):
+                raise
+            error = e
+        done = collector.parsed(parser)
+        if done or len(collector.files) == received:
+            break
+        request = collector.continuation(request, "".join(text), parser)
+    try:
+        return collector.result(done, error)
+    except IncompleteProjectError as e:
+        return collector.fallback(e, await llm.with_structured_output(GeneratedProject).ainvoke(list(messages)))
@@ -0,0 +1,192 @@
+"""
+Measurements of single model calls.
+
+`InstrumentedChatModel` is the outermost model wrapper (around the cache and the rate
+limiter). Every call gets a ModelCall record that the inner layers annotate through the
+`note_*` functions while the call is running: the rate limiter adds its queueing time and
+retries, the cache marks hits. Token usage is read from the provider's callbacks, which also
+covers `with_structured_output` calls whose return value carries no metadata; when the
+provider reports nothing (e.g. the offline fake model) tokens are estimated from the text.
+"""
+import contextvars
+import time
+from dataclasses import asdict, dataclass
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.messages import convert_to_messages
+from langchain_core.tracers.context import register_configure_hook
+from src.state.render import count_tokens
+
+
+@dataclass
+class ModelCall:
+    schema: str
+    started: float
+    prompt_chars: int = 0
+    wall_s: float = 0.0
+    # Time spent waiting for a rate limiter slot, quota or backoff
+    wait_s: float = 0.0
+    retries: int = 0
+    cache_hit: bool = False
+    input_tokens: int = 0
+    # Input tokens the provider served from its prompt prefix cache
+    cached_tokens: int = 0
+    output_tokens: int = 0
+    tokens_estimated: bool = False
+    error: str = None
+
+    def as_event(self) -> dict:
+        return {"event": "model_call", **asdict(self)}
+
+
+_current_call = contextvars.ContextVar("current_model_call", default=None)
+_usage_handler = contextvars.ContextVar("model_usage_handler", default=None)
+# Every callback manager configured while a call runs gets its usage handler
+register_configure_hook(_usage_handler, inheritable=True)
+# Also told about every call that finishes in its context, e.g. the calls of a speculation
+_call_listener = contextvars.ContextVar("model_call_listener", default=None)
+
+
+def observe_calls(listener) -> None:
+    """Hands every ModelCall that finishes in the current context to `listener(call)`, after `on_call`."""
+    _call_listener.set(listener)
+
+
+def note_wait(seconds: float) -> None:
+    call = _current_call.get()
+    if call is not None:
+        call.wait_s += seconds
+
+
+def note_retry() -> None:
+    call = _current_call.get()
+    if call is not None:
+        call.retries += 1
+
+
+def note_cache_hit() -> None:
+    call = _current_call.get()
+    if call is not None:
+        call.cache_hit = True
+
+
+class UsageHandler(BaseCallbackHandler):
+    """Adds the token usage the provider reports at the end of each generation to a ModelCall."""
+    run_inline = True
+
+    def __init__(self, call: ModelCall):
+        self.call = call
+        self.reported = False
+
+    def on_llm_end(self, response, **kwargs):
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                if usage:
+                    cached = (usage.get("input_token_details") or {}).get("cache_read", 0)
+                    self.add(usage.get("input_tokens", 0), usage.get("output_tokens", 0), cached)
+                    return
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        if usage:
+            cached = (usage.get("prompt_tokens_details") or {}).get("cached_tokens", 0)
+            self.add(usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0), cached)
+
+    def add(self, input_tokens: int, output_tokens: int, cached_tokens: int = 0) -> None:
+        self.reported = True
+        self.call.input_tokens += input_tokens or 0
+        self.call.output_tokens += output_tokens or 0
+        self.call.cached_tokens += cached_tokens or 0
+
+
+def prompt_text(messages) -> str:
+    if isinstance(messages, str):
+        return messages
+    return "\n".join(str(message.content) for message in convert_to_messages(messages))
+
+
+def output_text(response) -> str:
+    if hasattr(response, "model_dump_json"):
+        return response.model_dump_json()
+    return str(getattr(response, "content", response))
+
+
+class InstrumentedChatModel:
+    """
+    Wraps a chat model, or the runnable of its `with_structured_output`, and hands a ModelCall
+    to `on_call` after every `invoke` / `ainvoke` and at the end of every stream, failed calls included.
+    """
+    def __init__(self, llm, on_call, schema="text"):
+        self.llm = llm
+        self.on_call = on_call
+        self.schema = schema
+
+    def start(self, messages):
+        prompt = prompt_text(messages)
+        call = ModelCall(self.schema, time.time(), prompt_chars=len(prompt))
+        handler = UsageHandler(call)
+        tokens = (_current_call.set(call), _usage_handler.set(handler))
+        return call, handler, prompt, tokens, time.perf_counter()
+
+    def finish(self, call, handler, prompt, tokens, started, response=None, error=None) -> None:
+        _current_call.reset(tokens[0])
+        _usage_handler.reset(tokens[1])
+        call.wall_s = time.perf_counter() - started
+        if error is not None:
+            call.error = type(error).__name__
+        elif not call.cache_hit and not handler.reported:
+            call.tokens_estimated = True
+            call.input_tokens = count_tokens(prompt)
+            call.output_tokens = count_tokens(output_text(response))
+        self.on_call(call)
+        listener = _call_listener.get()
+        if listener is not None:
+            listener(call)
+
+    def invoke(self, messages, config=None, **kwargs):
+        state = self.start(messages)
+        try:
+            response = self.llm.invoke(messages, config, **kwargs)
+        except BaseException as e:
+            self.finish(*state, error=e)
+            raise
+        self.finish(*state, response=response)
+        return response
+
+    async def ainvoke(self, messages, config=None, **kwargs):
+        state = self.start(messages)
+        try:
+            response = await self.llm.ainvoke(messages, config, **kwargs)
+        except BaseException as e:
+            self.finish(*state, error=e)
+            raise
+        self.finish(*state, response=response)
+        return response
+
+    def stream(self, messages, config=None, **kwargs):
+        state = self.start(messages)
+        response = None
+        try:
+            for chunk in self.llm.stream(messages, config, **kwargs):
+                response = chunk if response is None else response + chunk
+                yield chunk
+        except BaseException as e:
+            self.finish(*state, error=e)
+            raise
+        self.finish(*state, response=response)
+
+    async def astream(self, messages, config=None, **kwargs):
+        state = self.start(messages)
+        response = None
+        try:
+            async for chunk in self.llm.astream(messages, config, **kwargs):
+                response = chunk if response is None else response + chunk
+                yield chunk
+        except BaseException as e:
+            self.finish(*state, error=e)
+            raise
+        self.finish(*state, response=response)
+
+    def with_structured_output(self, schema, **kwargs):
+        return InstrumentedChatModel(self.llm.with_structured_output(schema, **kwargs), self.on_call, schema.__name__)
+
+    def __getattr__(self, name):
+        return getattr(self.llm, name)
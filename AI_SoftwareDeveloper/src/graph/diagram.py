@@ -0,0 +1,67 @@
+"""
+Optional diagram of the compiled graph.
+
+`draw_mermaid_png()` renders through the mermaid.ink web service by default, which stalls or
+fails without network, so rendering is chosen explicitly (GRAPH_DIAGRAM in src/main.py):
+
+    none       no diagram
+    mermaid    the Mermaid source (.mmd), offline; paste it in any Mermaid viewer
+    ascii      a text drawing (.txt), offline; needs grandalf
+    png-local  a PNG rendered by a local headless browser, offline; needs pyppeteer
+    png        a PNG rendered by mermaid.ink (network)
+
+Every diagram is stored next to a stamp holding the hash of the graph's topology, and is only
+rendered again when a node or an edge changes.
+"""
+import hashlib
+import os
+from src.state.serializer import write_atomic
+
+EXTENSIONS = {"mermaid": ".mmd", "ascii": ".txt", "png-local": ".png", "png": ".png"}
+
+
+def topology_key(drawable) -> str:
+    """Hash of the nodes and edges of a drawable graph (`compiled.get_graph()`)."""
+    nodes = sorted(drawable.nodes)
+    edges = sorted((edge.source, edge.target, str(edge.data), edge.conditional) for edge in drawable.edges)
+    return hashlib.sha256(repr((nodes, edges)).encode("utf-8")).hexdigest()
+
+
+def render(drawable, renderer: str) -> bytes:
+    if renderer == "mermaid":
+        return drawable.draw_mermaid().encode("utf-8")
+    if renderer == "ascii":
+        return drawable.draw_ascii().encode("utf-8")
+    from langchain_core.runnables.graph import MermaidDrawMethod
+    method = MermaidDrawMethod.PYPPETEER if renderer == "png-local" else MermaidDrawMethod.API
+    return drawable.draw_mermaid_png(draw_method=method)
+
+
+def draw_graph(graph, stem="agentic_code_builder", renderer="mermaid"):
+    """
+    Writes the diagram of the compiled `graph` to `stem` + the renderer's extension and returns
+    its path, or None when rendering is off or failed. A diagram of the same topology is reused.
+    """
+    if not renderer or renderer == "none":
+        return None
+    if renderer not in EXTENSIONS:
+        raise ValueError(f"Unknown diagram renderer {renderer!r}, expected one of: none, {', '.join(EXTENSIONS)}")
+    drawable = graph.get_graph()
+    path = os.path.abspath(stem + EXTENSIONS[renderer])
+    stamp_path = f"{path}.topology"
+    key = f"{renderer}:{topology_key(drawable)}"
+    try:
+        with open(stamp_path, encoding="utf-8") as f:
+            if f.read() == key and os.path.exists(path):
+                return path
+    except OSError:
+        pass
+    try:
+        data = render(drawable, renderer)
+    except Exception as e:
+        # A diagram is never worth failing the run for (no network, renderer not installed)
+        print(f"Graph diagram not rendered with {renderer} ({type(e).__name__}: {e})")
+        return None
+    write_atomic(path, data)
+    write_atomic(stamp_path, key.encode("utf-8"))
+    return path
@@ -1,17 +1,95 @@
-from langgraph.graph import StateGraph, START,END, MessagesState
-from langgraph.prebuilt import tools_condition,ToolNode
-from langchain_core.prompts import ChatPromptTemplate
-from langgraph.checkpoint.memory import MemorySaver
-from src.state.state import State
+from langgraph.graph import StateGraph, START,END
+from langchain_core.runnables import RunnableLambda
+from src.state.state import State, SecurityBranchOutput
 from src.nodes.generate_user_stories import CreateUserStories, ProductOwnerReview, HumanLoopProductOwnerReview, DecisionProductOwnerReview, route_product_owner_review
 from src.nodes.create_desing_docs import DocumentsDesigner, DesignDocumentReview, HumanLoopDesignDocumentReview, DecisionDesignDocumentReview, route_document_review
-from src.nodes.generate_code import CodeGenerator, CodeReview, HumanCodeOwnerReview, DecisionCodeReview, route_code_review 
+from src.nodes.generate_code import CodeGenerator, CodeReview, HumanCodeOwnerReview, DecisionCodeReview
 from src.nodes.security_review import SecurityReviewer, route_test_cases_review
+from src.nodes.merge_review import PostReviewMerger, route_post_review
+from src.nodes.run_test_cases import TestCasesRunner
+from src.nodes.decision_policy import DecisionEngine
+from src.graph.speculation import Speculator
+from src.LLMS.router import ModelRouter
 
 class GraphBuilder:
-    def __init__(self, model):
-        self.llm = model
+    def __init__(self, model, code_fan_out=False, max_workers=8, human_input=input, retriever=None, decision_engine=None,
+                 speculate=False, test_runner=None, instrumentation=None, stream_projects=False, artifact_store=None):
+        # A chat model used by every node, or a ModelRouter choosing one per node
+        self.router = model if isinstance(model, ModelRouter) else None
+        self.llm = self.router.load(self.router.default) if self.router else model
+        self.code_fan_out = code_fan_out
+        self.max_workers = max_workers
+        # Stream the whole-project answers (generation, functional and security fixes) and parse them file by file
+        self.stream_projects = stream_projects
+        # Callable used by the human review nodes to collect the reviewer's answer
+        self.human_input = human_input
+        # Optional ProjectRetriever shared by the code review and fix nodes
+        self.retriever = retriever
+        # Rule based decision policies shared by the four decision nodes; its stats cover the whole graph
+        self.decision_engine = decision_engine or DecisionEngine()
+        # Optional ArtifactStore (src/vectorstore/artifacts.py): the decisions record the accepted artifacts,
+        # the planners reuse those of similar requirements
+        self.artifact_store = artifact_store
+        if artifact_store is not None:
+            self.decision_engine.artifacts = artifact_store
+        # Optional TestRunner (src/tools/test_runner.py) executing the generated test cases; a default one otherwise
+        self.test_runner = test_runner
+        # Opt-in: run the stage after a human review while the reviewer reads, commit it when accepted
+        self.speculator = Speculator(max_workers) if speculate else None
+        if self.speculator is not None:
+            self.speculator.add_stage("create_design_docs", after="human_loop_product_owner_review", inputs=("user_stories",))
+            self.speculator.add_stage(
+                "generate_code", after="human_loop_design_review",
+                inputs=("design_documents", "generated_project", "code_review_feedback", "human_code_review"),
+            )
+        # Optional Instrumentation (src/graph/instrumentation.py) timing every node and model call
+        self.instrumentation = instrumentation
         self.graph_builder = StateGraph(State)
+        self.security_reviewers = {}
+
+    def model_for(self, name):
+        """Model of the graph node `name`."""
+        model = self.router.model_for(name) if self.router else self.llm
+        if self.instrumentation is not None:
+            return self.instrumentation.wrap_model(model)
+        # The speculator charges the calls of discarded speculations, which needs them reported
+        return self.speculator.wrap_model(model) if self.speculator is not None else model
+
+    def security_reviewer(self, name):
+        """SecurityReviewer bound to the model of node `name`, one per distinct model."""
+        model = self.model_for(name)
+        if id(model) not in self.security_reviewers:
+            self.security_reviewers[id(model)] = SecurityReviewer(
+                model, ask=self.human_input, retriever=self.retriever, policy=self.decision_engine,
+                stream=self.stream_projects
+            )
+        return self.security_reviewers[id(model)]
+
+    def add_node(self, name, node, graph=None):
+        """
+        Registers a bound node method together with its `a`-prefixed async variant, so the
+        compiled graph runs the blocking one under invoke/stream and the async one under ainvoke/astream.
+        """
+        async_node = getattr(node.__self__, f"a{node.__name__}")
+        if self.speculator is not None:
+            node, async_node = self.speculator.wrap(name, node, async_node)
+        if self.instrumentation is not None:
+            node, async_node = self.instrumentation.wrap(name, node, async_node)
+        (graph or self.graph_builder).add_node(name, RunnableLambda(node, afunc=async_node, name=name))
+
+    def security_branch(self):
+        """
+        Security review followed by the security fixes, compiled as a subgraph so the whole chain
+        runs inside one step of the parent graph, concurrently with the other post-review branches.
+        Only the review and the fixed project are returned to the parent.
+        """
+        branch = StateGraph(State, output_schema=SecurityBranchOutput)
+        self.add_node("security_review", self.security_reviewer("security_review").make_security_review, branch)
+        self.add_node("fix_code_after_security", self.security_reviewer("fix_code_after_security").improve_security, branch)
+        branch.add_edge(START, "security_review")
+        branch.add_edge("security_review", "fix_code_after_security")
+        branch.add_edge("fix_code_after_security", END)
+        return branch.compile()
     
     def test_code_builder(self):
         """
@@ -22,47 +100,60 @@ class GraphBuilder:
         The chatbot node is set as the entry point.
         """
         # user stories nodes
-        self.user_story_node = CreateUserStories(self.llm)
-        self.po_review_node = ProductOwnerReview(self.llm)
-        self.humanloop_po_review_node = HumanLoopProductOwnerReview()
-        self.decision_po_review_node = DecisionProductOwnerReview(self.llm)
-        self.graph_builder.add_node("generate_user_stories", self.user_story_node.user_story_planner)
-        self.graph_builder.add_node("product_owner_review", self.po_review_node.review_user_stories)
-        self.graph_builder.add_node("human_loop_product_owner_review", self.humanloop_po_review_node.get_human_feedback)
-        self.graph_builder.add_node("decision_product_owner_review", self.decision_po_review_node.decision_review)
+        self.user_story_node = CreateUserStories(self.model_for("generate_user_stories"), artifacts=self.artifact_store)
+        self.po_review_node = ProductOwnerReview(self.model_for("product_owner_review"))
+        self.humanloop_po_review_node = HumanLoopProductOwnerReview(self.human_input)
+        self.decision_po_review_node = DecisionProductOwnerReview(
+            self.model_for("decision_product_owner_review"), policy=self.decision_engine
+        )
+        self.add_node("generate_user_stories", self.user_story_node.user_story_planner)
+        self.add_node("product_owner_review", self.po_review_node.review_user_stories)
+        self.add_node("human_loop_product_owner_review", self.humanloop_po_review_node.get_human_feedback)
+        self.add_node("decision_product_owner_review", self.decision_po_review_node.decision_review)
         
         # documents nodes
-        self.document_desing_node = DocumentsDesigner(self.llm)
+        self.document_desing_node = DocumentsDesigner(self.model_for("create_design_docs"), artifacts=self.artifact_store)
         # self.us_review_node = UserStoriesReview(self.llm)
-        self.dd_review_node = DesignDocumentReview(self.llm)
-        self.humanloop_dd_review_node = HumanLoopDesignDocumentReview()
-        self.decision_dd_review_node = DecisionDesignDocumentReview(self.llm)
-        self.graph_builder.add_node("create_design_docs", self.document_desing_node.design_document_planner)
-        # self.graph_builder.add_node("revise_user_stories", self.us_review_node.user_stories_reviewer)
-        self.graph_builder.add_node("desing_review", self.dd_review_node.design_document_reviewer)
-        self.graph_builder.add_node("human_loop_design_review", self.humanloop_dd_review_node.get_human_feedback)
-        self.graph_builder.add_node("decision_design_review", self.decision_dd_review_node.decision_review)
+        self.dd_review_node = DesignDocumentReview(self.model_for("desing_review"))
+        self.humanloop_dd_review_node = HumanLoopDesignDocumentReview(self.human_input)
+        self.decision_dd_review_node = DecisionDesignDocumentReview(
+            self.model_for("decision_design_review"), policy=self.decision_engine
+        )
+        self.add_node("create_design_docs", self.document_desing_node.design_document_planner)
+        # self.add_node("revise_user_stories", self.us_review_node.user_stories_reviewer)
+        self.add_node("desing_review", self.dd_review_node.design_document_reviewer)
+        self.add_node("human_loop_design_review", self.humanloop_dd_review_node.get_human_feedback)
+        self.add_node("decision_design_review", self.decision_dd_review_node.decision_review)
 
         # code project
-        self.generate_code_node = CodeGenerator(self.llm)
-        self.code_review_node = CodeReview(self.llm)
-        self.humanloop_code_review_node = HumanCodeOwnerReview()
-        self.decision_code_review_node = DecisionCodeReview(self.llm)
-        self.graph_builder.add_node("generate_code", self.generate_code_node.code_developer)
-        self.graph_builder.add_node("code_review", self.code_review_node.ai_code_reviewer)
-        self.graph_builder.add_node("human_loop_code_review", self.humanloop_code_review_node.get_human_feedback)
-        self.graph_builder.add_node("decision_code_review", self.decision_code_review_node.ai_decision_reviewer)
+        self.generate_code_node = CodeGenerator(
+            self.model_for("generate_code"), fan_out=self.code_fan_out, max_workers=self.max_workers, retriever=self.retriever,
+            stream=self.stream_projects, artifacts=self.artifact_store
+        )
+        self.code_review_node = CodeReview(self.model_for("code_review"), retriever=self.retriever)
+        self.humanloop_code_review_node = HumanCodeOwnerReview(self.human_input)
+        self.decision_code_review_node = DecisionCodeReview(
+            self.model_for("decision_code_review"), retriever=self.retriever, policy=self.decision_engine
+        )
+        self.add_node("generate_code", self.generate_code_node.code_developer)
+        self.add_node("code_review", self.code_review_node.ai_code_reviewer)
+        self.add_node("human_loop_code_review", self.humanloop_code_review_node.get_human_feedback)
+        self.add_node("decision_code_review", self.decision_code_review_node.ai_decision_reviewer)
 
         # fix security code
-        self.security_review_node = SecurityReviewer(self.llm)
-        self.graph_builder.add_node("security_review", self.security_review_node.make_security_review)
-        self.graph_builder.add_node("fix_code_after_code_review", self.security_review_node.improve_code_project)
-        self.graph_builder.add_node("fix_code_after_security", self.security_review_node.improve_security)
-        self.graph_builder.add_node("write_test_cases", self.security_review_node.write_test_cases)
-        self.graph_builder.add_node("test_cases_review", self.security_review_node.test_cases_review)
-        self.graph_builder.add_node("human_loop_test_cases_review", self.security_review_node.human_loop_test_cases_review)
-        self.graph_builder.add_node("decision_test_cases_review", self.security_review_node.decision_test_cases_review)
-        self.graph_builder.add_node("fix_test_cases", self.security_review_node.fix_test_cases)
+        self.security_review_node = self.security_reviewer("security_review")
+        self.graph_builder.add_node("security_branch", self.security_branch())
+        self.add_node("fix_code_after_code_review", self.security_reviewer("fix_code_after_code_review").improve_code_project)
+        self.add_node("write_test_cases", self.security_reviewer("write_test_cases").write_test_cases)
+        self.add_node("rewrite_test_cases", self.security_reviewer("rewrite_test_cases").write_test_cases)
+        self.merge_review_node = PostReviewMerger(self.model_for("merge_post_review"), max_workers=self.max_workers)
+        self.add_node("merge_post_review", self.merge_review_node.merge_post_review)
+        self.run_test_cases_node = TestCasesRunner(self.test_runner)
+        self.add_node("run_test_cases", self.run_test_cases_node.run_test_cases)
+        self.add_node("test_cases_review", self.security_reviewer("test_cases_review").test_cases_review)
+        self.add_node("human_loop_test_cases_review", self.security_review_node.human_loop_test_cases_review)
+        self.add_node("decision_test_cases_review", self.security_reviewer("decision_test_cases_review").decision_test_cases_review)
+        self.add_node("fix_test_cases", self.security_reviewer("fix_test_cases").fix_test_cases)
 
 
         # graph user stories part
@@ -95,19 +186,22 @@ class GraphBuilder:
         self.graph_builder.add_edge("generate_code","code_review")
         self.graph_builder.add_edge("code_review","human_loop_code_review")
         self.graph_builder.add_edge("human_loop_code_review","decision_code_review")
+        # the accepted code fans out to the independent branches, which join in merge_post_review
         self.graph_builder.add_conditional_edges(
             "decision_code_review",
-            route_code_review,
+            route_post_review,
             {
-            "Accepted": "security_review",
+            "Security review": "security_branch",
+            "Functional fixes": "fix_code_after_code_review",
+            "Test cases": "write_test_cases",
             "Rejected + Feedback": "generate_code",
             },
         )
         #security code part
-        self.graph_builder.add_edge("security_review","fix_code_after_code_review")
-        self.graph_builder.add_edge("fix_code_after_code_review","fix_code_after_security")
-        self.graph_builder.add_edge("fix_code_after_security","write_test_cases")
-        self.graph_builder.add_edge("write_test_cases",'test_cases_review')
+        self.graph_builder.add_edge(["security_branch", "fix_code_after_code_review", "write_test_cases"], "merge_post_review")
+        self.graph_builder.add_edge("merge_post_review",'run_test_cases')
+        self.graph_builder.add_edge("rewrite_test_cases",'run_test_cases')
+        self.graph_builder.add_edge("run_test_cases",'test_cases_review')
         self.graph_builder.add_edge("test_cases_review","human_loop_test_cases_review")
         self.graph_builder.add_edge("human_loop_test_cases_review","decision_test_cases_review")
         self.graph_builder.add_conditional_edges(
@@ -115,7 +209,7 @@ class GraphBuilder:
             route_test_cases_review,
             {
             "Accepted": "fix_test_cases",
-            "Rejected + Feedback": "write_test_cases",
+            "Rejected + Feedback": "rewrite_test_cases",
             },
         )
         self.graph_builder.add_edge("fix_test_cases",END)
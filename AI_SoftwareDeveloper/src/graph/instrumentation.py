@@ -0,0 +1,300 @@
+"""
+Per-node instrumentation of the code builder graph.
+
+GraphBuilder(instrumentation=Instrumentation(...)) wraps every node it registers and every
+model it hands to a node. Each node run becomes a NodeSpan (wall time, and the model calls
+made inside it: tokens, prompt characters, rate limiter waits, retries, cache hits) and each
+model call a ModelCall (src/LLMS/telemetry.py). They are written to:
+
+    events_path   JSON lines, one {"event": "node" | "model_call", ...} object per record
+    metrics_path  Prometheus text format, rewritten after every node (node_exporter's
+                  textfile collector picks it up)
+
+`report()` prints the per-node totals (the 'prefix' column is the share of input tokens the
+provider served from its prompt prefix cache) and the critical path of each run: the chain of node
+runs that ended last, each one starting after the previous one ended, so the time on it is
+the time a faster node would have saved. The report can also be built from an events file:
+
+    python -m src.graph.instrumentation events.jsonl
+"""
+import argparse
+import contextvars
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from dataclasses import asdict, dataclass
+from langgraph.errors import GraphBubbleUp
+from src.LLMS.telemetry import InstrumentedChatModel
+from src.graph.speculation import thread_id
+from src.state.serializer import write_atomic
+
+# Name, type and help of the exported metrics
+METRICS = {
+    "agentic_node_runs_total": ("counter", "Node runs by node and status."),
+    "agentic_node_seconds_total": ("counter", "Wall time spent in each node."),
+    "agentic_model_calls_total": ("counter", "Model calls by node and cache result."),
+    "agentic_model_tokens_total": ("counter", "Model tokens by node and direction (estimated when the provider reports none)."),
+    "agentic_model_cached_tokens_total": ("counter", "Input tokens the provider served from its prompt cache by node."),
+    "agentic_model_prompt_chars_total": ("counter", "Characters sent to the model by node."),
+    "agentic_model_retries_total": ("counter", "Retried model requests by node."),
+    "agentic_model_wait_seconds_total": ("counter", "Time model calls waited for the rate limiter by node."),
+}
+
+# Model calls made outside a node run, e.g. by a speculative stage
+NO_NODE = "-"
+
+_current_span = contextvars.ContextVar("current_node_span", default=None)
+
+
+@dataclass
+class NodeSpan:
+    run: str
+    node: str
+    started: float
+    wall_s: float = 0.0
+    # ok, error or interrupted (waiting for a human review)
+    status: str = "ok"
+    model_calls: int = 0
+    cache_hits: int = 0
+    input_tokens: int = 0
+    cached_tokens: int = 0
+    output_tokens: int = 0
+    prompt_chars: int = 0
+    retries: int = 0
+    wait_s: float = 0.0
+
+    @property
+    def finished(self) -> float:
+        return self.started + self.wall_s
+
+    def as_event(self) -> dict:
+        return {"event": "node", **asdict(self)}
+
+
+def label_text(labels: tuple) -> str:
+    def escape(value) -> str:
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{key}="{escape(value)}"' for key, value in labels) + "}"
+
+
+class Instrumentation:
+    """Records node spans and model calls, and exports them as events, metrics and a report."""
+    def __init__(self, events_path=None, metrics_path=None, keep_spans=True, max_spans=100_000):
+        self.metrics_path = metrics_path
+        # The last `max_spans` spans are kept in memory for `report()`; long batches can turn this
+        # off and build the report from the events file, which has all of them
+        self.keep_spans = keep_spans
+        self.spans = deque(maxlen=max_spans)
+        self.counters = defaultdict(float)
+        self.models = {}
+        self.lock = threading.Lock()
+        self.events = None
+        if events_path:
+            if os.path.dirname(events_path):
+                os.makedirs(os.path.dirname(events_path), exist_ok=True)
+            self.events = open(events_path, "a", encoding="utf-8", buffering=1)
+
+    def emit(self, event: dict) -> None:
+        if self.events is not None:
+            line = json.dumps(event, default=str)
+            with self.lock:
+                self.events.write(line + "\n")
+
+    def count(self, metric: str, value: float, **labels) -> None:
+        self.counters[(metric, tuple(sorted(labels.items())))] += value
+
+    def wrap_model(self, model):
+        """`model` reporting its calls here; one wrapper per model, so wrapped models stay comparable."""
+        if model is None:
+            return None
+        with self.lock:
+            if id(model) not in self.models:
+                self.models[id(model)] = (model, InstrumentedChatModel(model, self.record_call))
+            return self.models[id(model)][1]
+
+    def record_call(self, call) -> None:
+        span = _current_span.get()
+        node = span.node if span is not None else NO_NODE
+        self.emit({**call.as_event(), "run": span.run if span is not None else thread_id(), "node": node})
+        with self.lock:
+            if span is not None:
+                span.model_calls += 1
+                span.cache_hits += call.cache_hit
+                span.input_tokens += call.input_tokens
+                span.cached_tokens += call.cached_tokens
+                span.output_tokens += call.output_tokens
+                span.prompt_chars += call.prompt_chars
+                span.retries += call.retries
+                span.wait_s += call.wait_s
+            self.count("agentic_model_calls_total", 1, node=node, cache="hit" if call.cache_hit else "miss")
+            self.count("agentic_model_tokens_total", call.input_tokens, node=node, direction="input")
+            self.count("agentic_model_tokens_total", call.output_tokens, node=node, direction="output")
+            self.count("agentic_model_cached_tokens_total", call.cached_tokens, node=node)
+            self.count("agentic_model_prompt_chars_total", call.prompt_chars, node=node)
+            self.count("agentic_model_retries_total", call.retries, node=node)
+            self.count("agentic_model_wait_seconds_total", call.wait_s, node=node)
+
+    def start_span(self, name: str):
+        span = NodeSpan(thread_id(), name, time.time())
+        return span, _current_span.set(span), time.perf_counter()
+
+    def end_span(self, span: NodeSpan, token, started: float, error=None) -> None:
+        _current_span.reset(token)
+        span.wall_s = time.perf_counter() - started
+        if isinstance(error, GraphBubbleUp):
+            span.status = "interrupted"
+        elif error is not None:
+            span.status = "error"
+        self.emit(span.as_event())
+        with self.lock:
+            if self.keep_spans:
+                self.spans.append(span)
+            self.count("agentic_node_runs_total", 1, node=span.node, status=span.status)
+            self.count("agentic_node_seconds_total", span.wall_s, node=span.node)
+        self.write_metrics()
+
+    def wrap(self, name: str, node, anode) -> tuple:
+        """(sync, async) variants of the graph node `name` that record a NodeSpan per run."""
+        def instrumented(state):
+            span = self.start_span(name)
+            try:
+                result = node(state)
+            except BaseException as e:
+                self.end_span(*span, error=e)
+                raise
+            self.end_span(*span)
+            return result
+
+        async def ainstrumented(state):
+            span = self.start_span(name)
+            try:
+                result = await anode(state)
+            except BaseException as e:
+                self.end_span(*span, error=e)
+                raise
+            self.end_span(*span)
+            return result
+
+        return instrumented, ainstrumented
+
+    def prometheus_text(self) -> str:
+        with self.lock:
+            counters = sorted(self.counters.items())
+        lines = []
+        for metric, (kind, help_text) in METRICS.items():
+            samples = [(labels, value) for (name, labels), value in counters if name == metric]
+            if not samples:
+                continue
+            lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} {kind}"]
+            lines += [f"{metric}{label_text(labels)} {value:g}" for labels, value in samples]
+        return "\n".join(lines) + "\n"
+
+    def write_metrics(self) -> None:
+        if self.metrics_path:
+            write_atomic(os.path.abspath(self.metrics_path), self.prometheus_text().encode("utf-8"))
+
+    def report(self, max_runs=3) -> str:
+        with self.lock:
+            spans = list(self.spans)
+        return profile_report(spans, max_runs)
+
+    def close(self) -> None:
+        self.write_metrics()
+        if self.events is not None:
+            self.events.close()
+            self.events = None
+
+
+def critical_path(spans: list, slack=0.001) -> list:
+    """
+    The spans of one run that bound its duration: starting from the last one to finish, each
+    step goes back to the latest span that ended before the current one started.
+    """
+    remaining = sorted(spans, key=lambda span: span.finished)
+    path = []
+    current = remaining[-1] if remaining else None
+    while current is not None:
+        path.append(current)
+        earlier = [span for span in remaining if span.finished <= current.started + slack and span is not current]
+        current = earlier[-1] if earlier else None
+    return path[::-1]
+
+
+def node_totals(spans: list) -> dict:
+    totals = defaultdict(lambda: defaultdict(float))
+    for span in spans:
+        stats = totals[span.node]
+        stats["runs"] += 1
+        stats["errors"] += span.status == "error"
+        for field in ("wall_s", "model_calls", "cache_hits", "input_tokens", "cached_tokens", "output_tokens",
+                      "prompt_chars", "retries", "wait_s"):
+            stats[field] += getattr(span, field)
+    return totals
+
+
+def profile_report(spans: list, max_runs=3) -> str:
+    """Per-node totals over every span, and the critical path of the `max_runs` longest runs."""
+    if not spans:
+        return "Profile: no node ran"
+    totals = node_totals(spans)
+    node_time = sum(stats["wall_s"] for stats in totals.values()) or 1.0
+    lines = [
+        "Profile, per node:",
+        f"  {'node':<34}{'runs':>5}{'wall s':>9}{'share':>7}{'calls':>7}{'cached':>7}"
+        f"{'in tok':>9}{'prefix':>7}{'out tok':>9}{'prompt KB':>10}{'retries':>8}{'wait s':>8}",
+    ]
+    for node, stats in sorted(totals.items(), key=lambda item: -item[1]["wall_s"]):
+        lines.append(
+            f"  {node:<34}{stats['runs']:>5.0f}{stats['wall_s']:>9.2f}{stats['wall_s'] / node_time:>7.0%}"
+            f"{stats['model_calls']:>7.0f}{stats['cache_hits']:>7.0f}{stats['input_tokens']:>9.0f}"
+            f"{stats['cached_tokens'] / (stats['input_tokens'] or 1):>7.0%}{stats['output_tokens']:>9.0f}{stats['prompt_chars'] / 1024:>10.1f}{stats['retries']:>8.0f}"
+            f"{stats['wait_s']:>8.2f}"
+        )
+
+    runs = defaultdict(list)
+    for span in spans:
+        runs[span.run].append(span)
+    duration = {run: max(s.finished for s in items) - min(s.started for s in items) for run, items in runs.items()}
+    for run in sorted(runs, key=lambda run: -duration[run])[:max_runs]:
+        path = critical_path(runs[run])
+        on_path = sum(span.wall_s for span in path)
+        origin = min(span.started for span in runs[run])
+        lines.append(
+            f"Critical path of run {run or '-'}: {on_path:.2f} s in {len(path)} node runs, "
+            f"{duration[run]:.2f} s wall ({max(0.0, duration[run] - on_path):.2f} s between nodes)"
+        )
+        for span in path:
+            status = "" if span.status == "ok" else f"  [{span.status}]"
+            lines.append(
+                f"  {span.started - origin:>8.2f} s  {span.node:<34}{span.wall_s:>8.2f} s"
+                f"{span.wall_s / (on_path or 1.0):>6.0%}{status}"
+            )
+    if len(runs) > max_runs:
+        lines.append(f"({len(runs) - max_runs} shorter runs not shown)")
+    return "\n".join(lines)
+
+
+def load_spans(path: str) -> list:
+    """The node spans of an events file written by Instrumentation."""
+    spans = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                event = json.loads(line)
+                if event.pop("event", None) == "node":
+                    spans.append(NodeSpan(**event))
+    return spans
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Profile report of an instrumentation events file.")
+    parser.add_argument("events", help="JSON lines file written with --events.")
+    parser.add_argument("--runs", type=int, default=3, help="Number of runs whose critical path is shown.")
+    args = parser.parse_args()
+    print(profile_report(load_spans(args.events), args.runs))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+"""
+Queue of the human reviews that parked runs are waiting for.
+
+A graph built with `human_input=None` suspends each run at its human review nodes with a
+LangGraph interrupt, and the checkpointer keeps the run. The worker records the pending
+interrupt here, in the checkpoint SQLite file, and moves on: no thread or task waits for
+the reviewer. Reviewers answer from another process (src/main_review.py, src/ui/app.py).
+The worker then claims the answered reviews and resumes each run with Command(resume=...).
+
+A review goes pending -> answered -> resuming -> resumed. It is only marked resumed once the
+resume ran. A failed resume hands it back (answered) to be retried after a delay that doubles
+with every attempt; after `max_attempts` failures, which a deterministic error (a rejected
+request, a node bug) reaches quickly, it is marked failed and left for a person to look at
+(`main_review list` / `show`, then `retry`). A worker that finds a run still parked at a review
+claimed by a crashed worker hands that one back too, without counting an attempt.
+"""
+import json
+import threading
+import time
+from dataclasses import dataclass
+from src.graph.checkpoint import connect
+
+MAX_ATTEMPTS = 5
+# Seconds before the first retry of a failed resume, doubled after every further failure
+RETRY_DELAY = 30.0
+MAX_RETRY_DELAY = 3600.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS reviews (
+    thread_id TEXT NOT NULL,
+    interrupt_id TEXT NOT NULL,
+    review TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    answer TEXT,
+    created_at REAL NOT NULL,
+    answered_at REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    retry_at REAL,
+    error TEXT,
+    PRIMARY KEY (thread_id, interrupt_id)
+);
+CREATE INDEX IF NOT EXISTS reviews_status ON reviews (status, created_at);
+"""
+# Columns added after the first version of the table, added to older files on open
+ADDED_COLUMNS = {"attempts": "INTEGER NOT NULL DEFAULT 0", "retry_at": "REAL", "error": "TEXT"}
+COLUMNS = "thread_id, interrupt_id, review, payload, status, answer, created_at, answered_at, attempts, retry_at, error"
+
+
+@dataclass
+class Review:
+    thread_id: str
+    interrupt_id: str
+    review: str
+    payload: dict
+    status: str
+    answer: str
+    created_at: float
+    answered_at: float
+    # Failed resumes, when the next one may run, and the last error
+    attempts: int = 0
+    retry_at: float = None
+    error: str = None
+
+    @classmethod
+    def from_row(cls, row) -> "Review":
+        values = list(row)
+        values[3] = json.loads(values[3])
+        return cls(*values)
+
+
+class ReviewQueue:
+    """Pending, answered, resumed and failed reviews, in a table of the SQLite file at `path`."""
+    def __init__(self, path: str, max_attempts=MAX_ATTEMPTS, retry_delay=RETRY_DELAY, max_retry_delay=MAX_RETRY_DELAY):
+        self.conn = connect(path)
+        self.conn.executescript(SCHEMA)
+        existing = {row[1] for row in self.conn.execute("PRAGMA table_info(reviews)")}
+        for column, definition in ADDED_COLUMNS.items():
+            if column not in existing:
+                self.conn.execute(f"ALTER TABLE reviews ADD COLUMN {column} {definition}")
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.lock = threading.Lock()
+
+    def query(self, sql: str, params=()) -> list:
+        with self.lock:
+            return [Review.from_row(row) for row in self.conn.execute(f"SELECT {COLUMNS} FROM reviews {sql}", params)]
+
+    def add(self, thread_id: str, interrupts) -> int:
+        """
+        Records the interrupts a run stopped at; returns how many were new or handed back. A run
+        still parked at a review being resumed means its resume never happened, e.g. the worker died.
+        """
+        with self.lock, self.conn:
+            added = 0
+            for item in interrupts:
+                value = item.value if isinstance(item.value, dict) else {"prompt": str(item.value)}
+                cursor = self.conn.execute(
+                    "INSERT INTO reviews (thread_id, interrupt_id, review, payload, created_at) "
+                    "VALUES (?, ?, ?, ?, ?) "
+                    "ON CONFLICT (thread_id, interrupt_id) DO UPDATE SET status = 'answered' "
+                    "WHERE status = 'resuming'",
+                    (thread_id, item.id, value.get("review", "review"), json.dumps(value), time.time()),
+                )
+                added += cursor.rowcount
+            return added
+
+    def pending(self, thread_id=None) -> list:
+        """Reviews still waiting for an answer, oldest first."""
+        if thread_id is None:
+            return self.query("WHERE status = 'pending' ORDER BY created_at")
+        return self.query("WHERE status = 'pending' AND thread_id = ? ORDER BY created_at", (thread_id,))
+
+    def failed(self, thread_id=None) -> list:
+        """Reviews whose resume failed `max_attempts` times, oldest first."""
+        if thread_id is None:
+            return self.query("WHERE status = 'failed' ORDER BY created_at")
+        return self.query("WHERE status = 'failed' AND thread_id = ? ORDER BY created_at", (thread_id,))
+
+    def submit(self, thread_id: str, answer: str, interrupt_id=None) -> Review:
+        """Answers the oldest pending review of `thread_id` (or the one with `interrupt_id`)."""
+        reviews = [
+            review for review in self.pending(thread_id)
+            if interrupt_id is None or review.interrupt_id == interrupt_id
+        ]
+        if not reviews:
+            raise KeyError(f"No pending review for thread {thread_id}")
+        review = reviews[0]
+        with self.lock, self.conn:
+            cursor = self.conn.execute(
+                "UPDATE reviews SET status = 'answered', answer = ?, answered_at = ? "
+                "WHERE thread_id = ? AND interrupt_id = ? AND status = 'pending'",
+                (answer, time.time(), review.thread_id, review.interrupt_id),
+            )
+        if not cursor.rowcount:
+            raise KeyError(f"The review of thread {thread_id} was answered meanwhile")
+        review.status, review.answer = "answered", answer
+        return review
+
+    def claim_answered(self) -> list:
+        """
+        Marks the answered reviews as being resumed and returns them. The status check in the update
+        makes each review go to exactly one caller when several workers share the file.
+        """
+        claimed = []
+        due = "WHERE status = 'answered' AND (retry_at IS NULL OR retry_at <= ?) ORDER BY answered_at"
+        for review in self.query(due, (time.time(),)):
+            if self.set_status(review, "resuming", "answered"):
+                claimed.append(review)
+        return claimed
+
+    def resumed(self, review: Review) -> None:
+        """The run of a claimed review was resumed with its answer."""
+        self.set_status(review, "resumed", "resuming")
+
+    def release(self, review: Review) -> None:
+        """The resume of a claimed review was interrupted: it goes back to the answered ones, to be claimed again."""
+        self.set_status(review, "answered", "resuming")
+
+    def fail(self, review: Review, error: str) -> None:
+        """
+        The resume of a claimed review failed: it is retried after a backoff, or marked failed
+        once it has failed `max_attempts` times.
+        """
+        attempts = review.attempts + 1
+        if attempts >= self.max_attempts:
+            status, retry_at = "failed", None
+        else:
+            status = "answered"
+            retry_at = time.time() + min(self.max_retry_delay, self.retry_delay * 2 ** (attempts - 1))
+        with self.lock, self.conn:
+            cursor = self.conn.execute(
+                "UPDATE reviews SET status = ?, attempts = ?, retry_at = ?, error = ? "
+                "WHERE thread_id = ? AND interrupt_id = ? AND status = 'resuming'",
+                (status, attempts, retry_at, error, review.thread_id, review.interrupt_id),
+            )
+        if cursor.rowcount:
+            review.status, review.attempts, review.retry_at, review.error = status, attempts, retry_at, error
+
+    def retry(self, thread_id: str) -> list:
+        """Hands the failed reviews of `thread_id` back to the worker, with their attempts reset."""
+        reviews = self.failed(thread_id)
+        with self.lock, self.conn:
+            self.conn.execute(
+                "UPDATE reviews SET status = 'answered', attempts = 0, retry_at = NULL "
+                "WHERE thread_id = ? AND status = 'failed'",
+                (thread_id,),
+            )
+        return reviews
+
+    def set_status(self, review: Review, status: str, current: str) -> bool:
+        with self.lock, self.conn:
+            cursor = self.conn.execute(
+                "UPDATE reviews SET status = ? WHERE thread_id = ? AND interrupt_id = ? AND status = ?",
+                (status, review.thread_id, review.interrupt_id, current),
+            )
+        if cursor.rowcount:
+            review.status = status
+        return bool(cursor.rowcount)
+
+    def counts(self) -> dict:
+        with self.lock:
+            return dict(self.conn.execute("SELECT status, COUNT(*) FROM reviews GROUP BY status").fetchall())
+
+    def close(self) -> None:
+        self.conn.close()
@@ -0,0 +1,258 @@
+"""
+Speculative execution of the stage after a human review.
+
+Most reviews end in 'Accepted', so while a reviewer reads the user stories (or the design
+documents) the next stage can already run on them in the background. When the review is
+accepted, the next stage finds a speculation whose inputs match its own state and commits
+that result instead of calling the model. A rejection changes the inputs (the artifact is
+regenerated), so the speculation is discarded and the tokens of its model calls (input and
+output, as the provider reports them or estimated, src/LLMS/telemetry.py) are counted as
+wasted. An async speculation is cancelled; a thread one cannot be interrupted, so it runs to
+its end and the calls it makes after the discard are charged too.
+
+Speculations are keyed by thread_id and a hash of the state keys the stage reads, so a hit
+returns exactly what the stage would have been asked to compute.
+"""
+import asyncio
+import contextvars
+import hashlib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from langgraph.config import get_config
+from src.LLMS.telemetry import InstrumentedChatModel, observe_calls
+
+
+@dataclass
+class SpeculativeStage:
+    name: str
+    # Review node during which the stage runs speculatively
+    after: str
+    # State keys the stage reads; equal values mean the speculative result can be committed
+    inputs: tuple
+    compute: object = None
+    acompute: object = None
+
+
+@dataclass
+class Speculation:
+    stage: str
+    fingerprint: str
+    started: float
+    finished: float = None
+    future: object = None
+    task: object = None
+    # Usage of its model calls so far; once discarded, later calls are charged as they finish
+    model_calls: int = 0
+    tokens: int = 0
+    discarded: bool = False
+
+    def done(self) -> bool:
+        return (self.task or self.future).done()
+
+    def cancel(self) -> None:
+        (self.task or self.future).cancel()
+
+
+def thread_id() -> str:
+    try:
+        return str(get_config()["configurable"].get("thread_id", ""))
+    except RuntimeError:
+        return ""
+
+
+class Speculator:
+    """
+    Starts registered stages in the background while a review is pending and hands their
+    results to the stage when it runs on the same inputs. Sync graphs use a thread pool,
+    async graphs an event loop task; both run outside the graph's run context, so the
+    speculative calls do not stream into the run that started them. The stages' models must
+    report their calls (`wrap_model`, or Instrumentation's wrapper) for the wasted tokens to count.
+    """
+    def __init__(self, max_workers=4):
+        self.executor = ThreadPoolExecutor(max_workers, thread_name_prefix="speculation")
+        self.stages = {}
+        self.speculations = {}
+        self.stats = {}
+        self.models = {}
+        self.lock = threading.Lock()
+
+    def wrap_model(self, model):
+        """`model` reporting its calls, for graphs without Instrumentation; one wrapper per model."""
+        if model is None:
+            return None
+        with self.lock:
+            if id(model) not in self.models:
+                self.models[id(model)] = (model, InstrumentedChatModel(model, lambda call: None))
+            return self.models[id(model)][1]
+
+    def record_call(self, speculation: Speculation, call) -> None:
+        """Adds a model call made by `speculation`; charged as waste right away when it was discarded."""
+        tokens = call.input_tokens + call.output_tokens
+        with self.lock:
+            speculation.model_calls += 1
+            speculation.tokens += tokens
+            if speculation.discarded:
+                self.stats[speculation.stage]["wasted_tokens"] += tokens
+
+    def add_stage(self, name: str, after: str, inputs) -> None:
+        """Runs the node `name` speculatively while the review node `after` waits for the reviewer."""
+        self.stages[name] = SpeculativeStage(name, after, tuple(inputs))
+        self.stats[name] = {"started": 0, "hits": 0, "misses": 0, "discarded": 0, "wasted_tokens": 0, "saved_s": 0.0}
+
+    def fingerprint(self, stage: SpeculativeStage, state) -> str:
+        inputs = "\0".join(repr(state.get(key)) for key in stage.inputs)
+        return hashlib.sha256(inputs.encode("utf-8")).hexdigest()
+
+    def discard(self, speculation: Speculation, stage: str) -> None:
+        """Drops a speculation whose inputs went stale, charging its tokens; called with the lock held."""
+        stats = self.stats[stage]
+        stats["discarded"] += 1
+        speculation.discarded = True
+        stats["wasted_tokens"] += speculation.tokens
+        if not speculation.done():
+            # Stops an async speculation; a running thread one goes on and record_call charges the rest
+            speculation.cancel()
+
+    def claim(self, name: str, state):
+        """A new speculation of stage `name` on `state`, or None when one with the same inputs exists."""
+        stage = self.stages[name]
+        key, fingerprint = (thread_id(), name), self.fingerprint(stage, state)
+        with self.lock:
+            current = self.speculations.get(key)
+            if current is not None and current.fingerprint == fingerprint:
+                # The review node runs again when an interrupted run resumes
+                return None
+            if current is not None:
+                self.discard(current, name)
+            speculation = self.speculations[key] = Speculation(name, fingerprint, time.perf_counter())
+            self.stats[name]["started"] += 1
+        return speculation
+
+    def run(self, speculation: Speculation, compute, state):
+        observe_calls(lambda call: self.record_call(speculation, call))
+        try:
+            return compute(state)
+        finally:
+            speculation.finished = time.perf_counter()
+
+    async def arun(self, speculation: Speculation, acompute, state):
+        observe_calls(lambda call: self.record_call(speculation, call))
+        try:
+            return await acompute(state)
+        finally:
+            speculation.finished = time.perf_counter()
+
+    def start(self, name: str, state) -> None:
+        speculation = self.claim(name, state)
+        if speculation is not None:
+            # A fresh context keeps the speculative calls out of the run that started them
+            speculation.future = self.executor.submit(
+                contextvars.Context().run, self.run, speculation, self.stages[name].compute, dict(state)
+            )
+
+    def astart(self, name: str, state) -> None:
+        speculation = self.claim(name, state)
+        if speculation is not None:
+            speculation.task = asyncio.create_task(
+                self.arun(speculation, self.stages[name].acompute, dict(state)), context=contextvars.Context()
+            )
+
+    def take(self, name: str, state):
+        """The matching speculation of stage `name` for `state`, or None (a miss)."""
+        stage = self.stages[name]
+        with self.lock:
+            speculation = self.speculations.pop((thread_id(), name), None)
+            if speculation is not None and speculation.fingerprint != self.fingerprint(stage, state):
+                self.discard(speculation, name)
+                speculation = None
+            if speculation is None:
+                self.stats[name]["misses"] += 1
+            else:
+                self.stats[name]["hits"] += 1
+        return speculation
+
+    def committed(self, speculation: Speculation, name: str, started: float) -> None:
+        """Records the time a hit saved: how long the speculation had run when the stage was reached."""
+        with self.lock:
+            self.stats[name]["saved_s"] += max(0.0, min(started, speculation.finished or started) - speculation.started)
+
+    def wrap(self, name: str, node, anode) -> tuple:
+        """(sync, async) variants of the graph node `name`: a speculative stage, a review it runs during, or as is."""
+        for stage in self.stages.values():
+            if stage.name == name:
+                stage.compute, stage.acompute = node, anode
+                return self.commit(name)
+            if stage.after == name:
+                return self.during(stage.name, node, anode)
+        return node, anode
+
+    def during(self, stage: str, node, anode) -> tuple:
+        """(sync, async) variants of the review node `node` that speculate on `stage` meanwhile."""
+        def speculating(state):
+            self.start(stage, state)
+            return node(state)
+
+        async def aspeculating(state):
+            self.astart(stage, state)
+            return await anode(state)
+
+        return speculating, aspeculating
+
+    def commit(self, stage: str) -> tuple:
+        """(sync, async) variants of `stage` that use a matching speculation when there is one."""
+        compute, acompute = self.stages[stage].compute, self.stages[stage].acompute
+        if compute is None:
+            raise ValueError(f"Speculative stage {stage} has no node")
+
+        def committing(state):
+            started = time.perf_counter()
+            speculation = self.take(stage, state)
+            if speculation is None or speculation.future is None:
+                return compute(state)
+            try:
+                result = speculation.future.result()
+            except Exception as e:
+                print(f"Speculative {stage} failed ({type(e).__name__}: {e}), running it again")
+                return compute(state)
+            self.committed(speculation, stage, started)
+            return result
+
+        async def acommitting(state):
+            started = time.perf_counter()
+            speculation = self.take(stage, state)
+            if speculation is None:
+                return await acompute(state)
+            try:
+                result = await (speculation.task or asyncio.wrap_future(speculation.future))
+            except Exception as e:
+                print(f"Speculative {stage} failed ({type(e).__name__}: {e}), running it again")
+                return await acompute(state)
+            self.committed(speculation, stage, started)
+            return result
+
+        return committing, acommitting
+
+    def close(self) -> None:
+        """Discards the speculations no stage took (e.g. the run ended or was rejected)."""
+        with self.lock:
+            for (_, name), speculation in self.speculations.items():
+                self.discard(speculation, name)
+            self.speculations.clear()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def report(self) -> str:
+        lines = []
+        with self.lock:
+            for name, stats in self.stats.items():
+                decided = stats["hits"] + stats["misses"]
+                rate = stats["hits"] / decided if decided else 0.0
+                lines.append(
+                    f"  {name:<20} started {stats['started']:>4}  hits {stats['hits']:>4}  misses {stats['misses']:>4}"
+                    f"  hit rate {rate:.0%}  discarded {stats['discarded']:>4}  wasted tokens {stats['wasted_tokens']:>7}"
+                    f"  time saved {stats['saved_s']:.1f} s"
+                )
+        lines.append("  (wasted tokens: input and output of discarded speculations; thread-mode speculations "
+                     "cannot be interrupted and are charged until they end)")
+        return "Speculation:\n" + "\n".join(lines)
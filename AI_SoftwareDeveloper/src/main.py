@@ -1,10 +1,17 @@
-from src.LLMS.llm import GroqLLM, OpenAILLM
+from src.LLMS.llm import load_model, rate_limits_from_env
 from src.graph.graph_builder import GraphBuilder
-from langgraph.checkpoint.memory import MemorySaver
+from src.LLMS.router import ModelRouter
+from src.graph.checkpoint import make_checkpointer, resume_input
 from langchain_core.messages import HumanMessage
 from src.tools.createproject import create_project, GeneratedCode
+from src.state.serializer import StateStore
+from src.graph.diagram import draw_graph
+from src.graph.instrumentation import Instrumentation
+from src.nodes.prompts import PROMPTS
+from src.stream_runner import run_streaming
 import os
 import json
+import uuid
 from dotenv import load_dotenv
 load_dotenv()
 
@@ -13,29 +20,65 @@ os.environ["GROQ_API_KEY"] = os.getenv("GROQ_API_KEY")
 os.environ["OPENAI_API_KEY"] = os.getenv("OPENAI_API_KEY")
 
 selected_model = 'openai'
+# Responses are cached on disk so reruns of the same requirement do not pay again; set LLM_CACHE_PATH='' to disable.
+cache_path = os.getenv("LLM_CACHE_PATH", ".llm_cache.sqlite")
+# Generate the file manifest first and then every file concurrently (CODE_FAN_OUT=1)
+code_fan_out = os.getenv("CODE_FAN_OUT", "0") == "1"
+# Stream whole-project answers and parse them file by file, resuming truncated ones (STREAM_PROJECTS=1)
+stream_projects = os.getenv("STREAM_PROJECTS", "0") == "1"
+# Review and fix nodes read only the code relevant to their task (RETRIEVAL=hash or RETRIEVAL=huggingface)
+retrieval = os.getenv("RETRIEVAL", "")
+if retrieval:
+    # faiss and numpy are only imported when retrieval is on
+    from src.vectorstore.index import ProjectRetriever, load_embeddings
+    retriever = ProjectRetriever(load_embeddings(retrieval))
+else:
+    retriever = None
+# Reuse the approved artifacts of similar earlier requirements (ARTIFACT_STORE=artifact_store; '' disables)
+artifact_store_path = os.getenv("ARTIFACT_STORE", "")
+if artifact_store_path:
+    from src.vectorstore.artifacts import ArtifactStore
+    from src.vectorstore.index import load_embeddings
+    artifact_store = ArtifactStore(
+        artifact_store_path, load_embeddings(os.getenv("ARTIFACT_EMBEDDINGS", "hash")),
+        threshold=float(os.getenv("ARTIFACT_THRESHOLD", "0.9"))
+    )
+else:
+    artifact_store = None
+# Terminal output: summary (one line per node), tokens (also the model output as it streams) or full (raw updates)
+stream_mode = os.getenv("STREAM_MODE", "summary")
+# Checkpoints are stored in SQLite so an interrupted run resumes from its last step; set CHECKPOINT_PATH='' to keep them in memory.
+checkpoint_path = os.getenv("CHECKPOINT_PATH", "checkpoints.sqlite")
+# Every run gets a new thread; RESUME_THREAD_ID=<thread id printed by an earlier run> resumes that one instead
+resume_thread_id = os.getenv("RESUME_THREAD_ID", "")
+thread_id = resume_thread_id or f"run-{uuid.uuid4().hex}"
+# Start the design documents / code while their input is being reviewed, keep them if it is accepted (SPECULATE=1)
+speculate = os.getenv("SPECULATE", "0") == "1"
+# Graph diagram: none, mermaid (offline, default), ascii, png-local (offline) or png (mermaid.ink); redrawn only when the graph changes
+graph_diagram = os.getenv("GRAPH_DIAGRAM", "mermaid")
+# Node timings and model usage: JSON lines events (EVENTS_PATH), Prometheus metrics (METRICS_PATH), report (PROFILE=1)
+events_path = os.getenv("EVENTS_PATH", "")
+metrics_path = os.getenv("METRICS_PATH", "")
+profile = os.getenv("PROFILE", "0") == "1"
+instrumentation = Instrumentation(events_path, metrics_path) if events_path or metrics_path or profile else None
 
-if selected_model == 'groq':
-    user_input = {
-        'api_key': os.getenv("GROQ_API_KEY"),
-        'selected_model': "qwen-2.5-32b"
-    }
-    obj_llm_config = GroqLLM(user_controls_input=user_input)
-    model = obj_llm_config.get_llm_model()
-
-elif selected_model == 'openai':
-    user_input = {
-        'api_key': os.getenv("OPENAI_API_KEY"),
-        'selected_model': "gpt-4o"
-    }
-    obj_llm_config = OpenAILLM(user_controls_input=user_input)
-    model = obj_llm_config.get_llm_model()
-
-code_developer = GraphBuilder(model)
+# Per-node models, e.g. MODEL_ROUTES='decision_*=groq:llama-3.1-8b-instant' (see ModelRouter.parse_routes)
+model_routes = os.getenv("MODEL_ROUTES", "")
+
+if model_routes:
+    model = ModelRouter.from_config(selected_model, model_routes, cache_path=cache_path, **rate_limits_from_env())
+else:
+    model = load_model(selected_model, cache_path=cache_path, **rate_limits_from_env())
+
+code_developer = GraphBuilder(
+    model, code_fan_out=code_fan_out, retriever=retriever, speculate=speculate, instrumentation=instrumentation,
+    stream_projects=stream_projects, artifact_store=artifact_store
+)
 graph_builder = code_developer.test_code_builder()  
-memory = MemorySaver()
+memory = make_checkpointer(checkpoint_path)
 
 graph = graph_builder.compile(checkpointer=memory)
-graph.get_graph().draw_mermaid_png(output_file_path='agentic_code_builder.png')
+draw_graph(graph, 'agentic_code_builder', renderer=graph_diagram)
 
 
 # Run the graph and get final state
@@ -44,16 +87,29 @@ graph.get_graph().draw_mermaid_png(output_file_path='agentic_code_builder.png')
 
 
 initial_input = {"requirement": HumanMessage(content="Create code for snake game")}
-thread = {"configurable": {"thread_id": "1"}}
-n = 0
-
-for event in graph.stream(initial_input, config={"recursion_limit": 100, "thread_id": "my_thread_1"}):
-    print(f"\n=== run {n} ===")
-    print(event)
-    n+=1
-
-# path_project = '..\final_output_state.json'
-# with open("final_output_state.json", "r") as f:
-#     state = json.load(f)
-# state['generated_project'] = [GeneratedCode.from_dict(item) for item in state['generated_project']]
+config = {"recursion_limit": 100, "configurable": {"thread_id": thread_id}}
+if resume_thread_id and not graph.get_state(config).next:
+    raise SystemExit(f"Thread {thread_id} has nothing to resume in {checkpoint_path or 'memory'}")
+print(f"Thread {thread_id}")
+
+run_streaming(
+    graph, resume_input(graph, config, initial_input) if resume_thread_id else initial_input, config=config, mode=stream_mode,
+    durability="sync" if checkpoint_path else None
+)
+print("\n=== Decision policies ===")
+print(code_developer.decision_engine.report())
+if artifact_store is not None:
+    artifact_store.close()
+    print(artifact_store.report())
+if code_developer.speculator is not None:
+    code_developer.speculator.close()
+    print(code_developer.speculator.report())
+if instrumentation is not None:
+    instrumentation.close()
+    if profile:
+        print(instrumentation.report())
+        print(PROMPTS.report())
+
+# Rebuild the project from the saved final state:
+# state = StateStore().load("final_output_state")
 # create_project(state)
\ No newline at end of file
@@ -0,0 +1,115 @@
+"""
+Async entry point: drives many requirements through the graph concurrently in one event loop.
+
+    python -m src.main_async "Create code for snake game" "Create a todo list REST API" --concurrency 20
+"""
+from src.LLMS.llm import load_model, rate_limits_from_env
+from src.graph.graph_builder import GraphBuilder
+from src.LLMS.router import ModelRouter
+from src.stream_runner import STREAM_MODES, arun_streaming
+from src.graph.checkpoint import amake_checkpointer, aresume_input
+from src.graph.instrumentation import Instrumentation
+from src.nodes.prompts import PROMPTS
+from langchain_core.messages import HumanMessage
+import argparse
+import asyncio
+import os
+from dotenv import load_dotenv
+load_dotenv()
+
+
+async def run_requirement(graph, requirement: str, thread_id: str, semaphore: asyncio.Semaphore,
+                          stream_mode="summary", durability=None) -> dict:
+    """Runs (or resumes) one requirement under its own thread_id and returns its final state."""
+    config = {"recursion_limit": 100, "configurable": {"thread_id": thread_id}}
+    async with semaphore:
+        initial_input = await aresume_input(graph, config, {"requirement": HumanMessage(content=requirement)})
+        await arun_streaming(
+            graph, initial_input, config, mode=stream_mode, prefix=f"[{thread_id}] ", durability=durability
+        )
+    return (await graph.aget_state(config)).values
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Run many requirements concurrently through the code builder graph.")
+    parser.add_argument("requirements", nargs="+", help="One or more project requirements.")
+    parser.add_argument("--provider", default="openai", choices=["openai", "groq"])
+    parser.add_argument("--model", default=None, help="Model name, defaults to the provider's default model.")
+    parser.add_argument("--routes", default=os.getenv("MODEL_ROUTES", ""),
+                        help="Per-node models: 'node_or_glob=provider:model,...', a JSON object or a JSON file.")
+    parser.add_argument("--concurrency", type=int, default=20, help="Maximum number of graphs running at once.")
+    parser.add_argument("--human-review", default=None,
+                        help="Answer every human review with this text instead of prompting, e.g. 'Accepted'.")
+    parser.add_argument("--stream-mode", default="summary", choices=STREAM_MODES,
+                        help="Per-node summaries, summaries plus streamed model output, or raw node updates.")
+    parser.add_argument("--checkpoint", default=None,
+                        help="SQLite file for checkpoints; rerunning with the same file resumes unfinished threads.")
+    parser.add_argument("--speculate", action="store_true",
+                        help="Run the next stage while user stories / design documents are under human review.")
+    parser.add_argument("--events", default=None, help="JSON lines file receiving a record per node run and model call.")
+    parser.add_argument("--metrics", default=None, help="Prometheus text file with per-node counters, updated after every node.")
+    parser.add_argument("--profile", action="store_true", help="Print per-node totals and the critical paths at the end.")
+    parser.add_argument("--artifact-store", default=os.getenv("ARTIFACT_STORE", ""),
+                        help="Folder of approved artifacts reused for similar requirements; empty disables it.")
+    parser.add_argument("--artifact-threshold", type=float, default=0.9,
+                        help="Minimum requirement similarity (cosine) for reusing a stored artifact.")
+    parser.add_argument("--artifact-embeddings", default="hash", choices=["hash", "huggingface"],
+                        help="Embeddings of the artifact store's requirement index.")
+    args = parser.parse_args()
+
+    load_options = dict(cache_path=os.getenv("LLM_CACHE_PATH", ".llm_cache.sqlite"), **rate_limits_from_env())
+    if args.routes:
+        default_spec = f"{args.provider}:{args.model}" if args.model else args.provider
+        model = ModelRouter.from_config(default_spec, args.routes, **load_options)
+    else:
+        model = load_model(args.provider, args.model, **load_options)
+    human_input = input if args.human_review is None else (lambda *_: args.human_review)
+    checkpointer = await amake_checkpointer(args.checkpoint)
+    instrumentation = None
+    if args.events or args.metrics or args.profile:
+        instrumentation = Instrumentation(args.events, args.metrics, keep_spans=args.profile)
+    artifact_store = None
+    if args.artifact_store:
+        # faiss and numpy are only imported when the artifact store is on
+        from src.vectorstore.artifacts import ArtifactStore
+        from src.vectorstore.index import load_embeddings
+        artifact_store = ArtifactStore(args.artifact_store, load_embeddings(args.artifact_embeddings),
+                                       threshold=args.artifact_threshold)
+    builder = GraphBuilder(
+        model, code_fan_out=os.getenv("CODE_FAN_OUT", "0") == "1", human_input=human_input, speculate=args.speculate,
+        instrumentation=instrumentation, stream_projects=os.getenv("STREAM_PROJECTS", "0") == "1",
+        artifact_store=artifact_store
+    )
+    graph = builder.test_code_builder().compile(checkpointer=checkpointer)
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+    final_states = await asyncio.gather(*(
+        run_requirement(graph, requirement, f"thread_{n}", semaphore, args.stream_mode,
+                        "sync" if args.checkpoint else None)
+        for n, requirement in enumerate(args.requirements)
+    ))
+
+    for n, state in enumerate(final_states):
+        print(f"\n=== thread_{n} ===")
+        print(f"Files generated: {len(state.get('generated_project') or [])}")
+        print(f"Test cases decision: {state.get('decision_test_cases_feedback')}")
+    print("\n=== Decision policies ===")
+    print(builder.decision_engine.report())
+    if artifact_store is not None:
+        artifact_store.close()
+        print(artifact_store.report())
+    if builder.speculator is not None:
+        builder.speculator.close()
+        print(builder.speculator.report())
+    if instrumentation is not None:
+        instrumentation.close()
+        if args.profile:
+            print(instrumentation.report())
+            print(PROMPTS.report())
+
+    if args.checkpoint:
+        await checkpointer.conn.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
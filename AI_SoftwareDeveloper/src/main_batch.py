@@ -0,0 +1,223 @@
+"""
+Batch entry point: runs every requirement of a JSONL file through the graph with a pool of
+concurrent workers, writes the artifacts of each one and a summary table.
+
+    python -m src.main_batch requirements.jsonl --workers 16 --output-dir batch_runs
+
+Each line is {"requirement": "...", "id": "optional-name"}. Answers every human review with
+--human-review ('Accepted' by default). With --checkpoint, rerunning the same file resumes
+unfinished requirements and skips the ones already completed. Node timings and model usage
+are written to events.jsonl and metrics.prom in the output directory; --profile also prints
+the per-node totals and the critical paths.
+"""
+from src.LLMS.llm import load_model, rate_limits_from_env
+from src.graph.graph_builder import GraphBuilder
+from src.LLMS.router import ModelRouter
+from src.graph.checkpoint import amake_checkpointer, aresume_input
+from src.graph.instrumentation import Instrumentation
+from src.nodes.prompts import PROMPTS
+from src.stream_runner import STREAM_MODES, arun_streaming
+from src.tools.createproject import create_project
+from src.state.serializer import StateStore
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.messages import HumanMessage
+import argparse
+import asyncio
+import csv
+import json
+import os
+import time
+from dotenv import load_dotenv
+load_dotenv()
+
+SUMMARY_FIELDS = [
+    "id", "status", "duration_s", "llm_calls", "files", "test_files",
+    "decision_po_review", "decision_dd_review", "decision_code_review_feedback", "decision_test_cases_feedback",
+    "times_reject_po", "times_reject_dd", "times_reject_code", "times_reject_tc", "error",
+]
+
+
+class LLMCallCounter(BaseCallbackHandler):
+    """Counts the model calls of one run (cache hits never reach the model and are not counted)."""
+    def __init__(self):
+        self.calls = 0
+
+    def on_chat_model_start(self, serialized, messages, **kwargs):
+        self.calls += 1
+
+    def on_llm_start(self, serialized, prompts, **kwargs):
+        self.calls += 1
+
+
+def read_requirements(path: str) -> list:
+    """Reads the JSONL file into (id, requirement) pairs, skipping blank lines."""
+    requirements = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            requirement_id = str(item.get("id") or f"req_{len(requirements):04d}")
+            requirements.append((requirement_id, item["requirement"]))
+    return requirements
+
+
+def write_artifacts(run_dir: str, state: dict) -> None:
+    """
+    Writes the final state, the generated project and the test files of one requirement. States
+    go to a StateStore shared by the batch, so file bodies common to several runs are stored once.
+    """
+    os.makedirs(run_dir, exist_ok=True)
+    StateStore(os.path.join(os.path.dirname(run_dir), "state_store")).save(state, os.path.basename(run_dir))
+    if state.get("generated_project"):
+        create_project(state, root=os.path.join(run_dir, "project"))
+    for test_case in state.get("test_cases_codes") or []:
+        path = os.path.join(run_dir, "tests", test_case.file_name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(test_case.generated_code)
+
+
+def summary_row(requirement_id: str, state: dict, duration: float, llm_calls: int, error=None) -> dict:
+    row = {
+        "id": requirement_id,
+        "status": "error" if error else "ok",
+        "duration_s": round(duration, 1),
+        "llm_calls": llm_calls,
+        "files": len(state.get("generated_project") or []),
+        "test_files": len(state.get("test_cases_codes") or []),
+        "error": error or "",
+    }
+    for field in SUMMARY_FIELDS:
+        row.setdefault(field, state.get(field, ""))
+    return row
+
+
+async def run_one(graph, requirement_id: str, requirement: str, output_dir: str, args) -> dict:
+    """Runs (or resumes) one requirement and writes its artifacts; failures are reported, not raised."""
+    counter = LLMCallCounter()
+    config = {"recursion_limit": 100, "configurable": {"thread_id": requirement_id}, "callbacks": [counter]}
+    started = time.perf_counter()
+    error = None
+    try:
+        initial_input = await aresume_input(graph, config, {"requirement": HumanMessage(content=requirement)})
+        snapshot = await graph.aget_state(config)
+        if initial_input is not None and snapshot.values:
+            print(f"[{requirement_id}] already completed, skipping")
+        else:
+            await arun_streaming(
+                graph, initial_input, config, mode=args.stream_mode, prefix=f"[{requirement_id}] ",
+                durability="sync" if args.checkpoint else None
+            )
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+        print(f"[{requirement_id}] failed: {error}")
+    state = (await graph.aget_state(config)).values
+    await asyncio.to_thread(write_artifacts, os.path.join(output_dir, requirement_id), state)
+    return summary_row(requirement_id, state, time.perf_counter() - started, counter.calls, error)
+
+
+async def run_batch(graph, requirements: list, output_dir: str, args) -> list:
+    """Feeds the requirements to `args.workers` workers and returns the summary rows in input order."""
+    queue = asyncio.Queue()
+    for n, item in enumerate(requirements):
+        queue.put_nowait((n, *item))
+    rows = [None] * len(requirements)
+
+    async def worker():
+        while not queue.empty():
+            n, requirement_id, requirement = queue.get_nowait()
+            rows[n] = await run_one(graph, requirement_id, requirement, output_dir, args)
+
+    await asyncio.gather(*(worker() for _ in range(min(args.workers, len(requirements)))))
+    return rows
+
+
+def write_summary(rows: list, output_dir: str) -> None:
+    """Writes summary.csv and prints the summary table."""
+    with open(os.path.join(output_dir, "summary.csv"), "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=SUMMARY_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+    columns = [
+        ("id", "id"), ("status", "status"), ("duration_s", "secs"), ("llm_calls", "calls"), ("files", "files"),
+        ("decision_code_review_feedback", "code"), ("decision_test_cases_feedback", "tests"),
+        ("times_reject_po", "po loops"), ("times_reject_dd", "dd loops"),
+        ("times_reject_code", "code loops"), ("times_reject_tc", "tc loops"),
+    ]
+    widths = [max(len(title), *(len(str(row[field])) for row in rows)) for field, title in columns]
+    print("\n" + "  ".join(title.ljust(width) for (_, title), width in zip(columns, widths)))
+    for row in rows:
+        print("  ".join(str(row[field]).ljust(width) for (field, _), width in zip(columns, widths)))
+    failed = sum(row["status"] == "error" for row in rows)
+    print(f"\n{len(rows) - failed} succeeded, {failed} failed. Artifacts in {output_dir}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Run a JSONL file of requirements through the code builder graph.")
+    parser.add_argument("requirements", help="JSONL file, one {\"requirement\": ..., \"id\": ...} object per line.")
+    parser.add_argument("--output-dir", default="batch_runs")
+    parser.add_argument("--workers", type=int, default=8, help="Number of requirements processed concurrently.")
+    parser.add_argument("--provider", default="openai", choices=["openai", "groq"])
+    parser.add_argument("--model", default=None, help="Model name, defaults to the provider's default model.")
+    parser.add_argument("--routes", default=os.getenv("MODEL_ROUTES", ""),
+                        help="Per-node models: 'node_or_glob=provider:model,...', a JSON object or a JSON file.")
+    parser.add_argument("--human-review", default="Accepted", help="Answer given to every human review.")
+    parser.add_argument("--stream-mode", default="summary", choices=STREAM_MODES)
+    parser.add_argument("--checkpoint", default=None,
+                        help="SQLite file for checkpoints; rerunning with the same file resumes unfinished requirements.")
+    parser.add_argument("--profile", action="store_true", help="Print per-node totals and the critical paths at the end.")
+    parser.add_argument("--artifact-store", default=os.getenv("ARTIFACT_STORE", ""),
+                        help="Folder of approved artifacts reused for similar requirements; empty disables it.")
+    parser.add_argument("--artifact-threshold", type=float, default=0.9,
+                        help="Minimum requirement similarity (cosine) for reusing a stored artifact.")
+    parser.add_argument("--artifact-embeddings", default="hash", choices=["hash", "huggingface"],
+                        help="Embeddings of the artifact store's requirement index.")
+    args = parser.parse_args()
+
+    requirements = read_requirements(args.requirements)
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    load_options = dict(cache_path=os.getenv("LLM_CACHE_PATH", ".llm_cache.sqlite"), **rate_limits_from_env())
+    if args.routes:
+        default_spec = f"{args.provider}:{args.model}" if args.model else args.provider
+        model = ModelRouter.from_config(default_spec, args.routes, **load_options)
+    else:
+        model = load_model(args.provider, args.model, **load_options)
+    checkpointer = await amake_checkpointer(args.checkpoint)
+    instrumentation = Instrumentation(
+        os.path.join(args.output_dir, "events.jsonl"), os.path.join(args.output_dir, "metrics.prom"),
+        keep_spans=args.profile
+    )
+    artifact_store = None
+    if args.artifact_store:
+        # faiss and numpy are only imported when the artifact store is on
+        from src.vectorstore.artifacts import ArtifactStore
+        from src.vectorstore.index import load_embeddings
+        artifact_store = ArtifactStore(args.artifact_store, load_embeddings(args.artifact_embeddings),
+                                       threshold=args.artifact_threshold)
+    builder = GraphBuilder(
+        model, code_fan_out=os.getenv("CODE_FAN_OUT", "0") == "1", human_input=lambda *_: args.human_review,
+        instrumentation=instrumentation, stream_projects=os.getenv("STREAM_PROJECTS", "0") == "1",
+        artifact_store=artifact_store
+    )
+    graph = builder.test_code_builder().compile(checkpointer=checkpointer)
+
+    rows = await run_batch(graph, requirements, args.output_dir, args)
+    write_summary(rows, args.output_dir)
+    print(builder.decision_engine.report())
+    if artifact_store is not None:
+        artifact_store.close()
+        print(artifact_store.report())
+    instrumentation.close()
+    if args.profile:
+        print(instrumentation.report())
+        print(PROMPTS.report())
+
+    if args.checkpoint:
+        await checkpointer.conn.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
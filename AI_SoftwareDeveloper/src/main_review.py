@@ -0,0 +1,238 @@
+"""
+Non-blocking human review: a worker that parks runs at their review points, and a CLI
+to answer the reviews they are waiting for.
+
+    python -m src.main_review worker requirements.jsonl --workers 8
+    python -m src.main_review list
+    python -m src.main_review show req_0003
+    python -m src.main_review submit req_0003 "Accepted"
+    python -m src.main_review submit req_0003 --file feedback.txt
+    python -m src.main_review retry req_0003
+
+The worker builds the graph with `human_input=None`, so every human review node suspends its
+run with an interrupt. The run is checkpointed, the review is queued (src/graph/review_queue.py)
+and the worker slot is freed; hundreds of runs can wait for reviewers without holding anything
+but their checkpoint. The worker polls the queue and resumes each run once its review is answered.
+Reviews can also be answered in the Streamlit app: streamlit run src/ui/app.py
+
+The graph, the providers and langgraph are only imported by the worker, so `list`, `show`
+and `submit` start in a fraction of a second.
+"""
+from src.graph.review_queue import MAX_ATTEMPTS, ReviewQueue
+from src.stream_runner import STREAM_MODES, arun_streaming
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+from dotenv import load_dotenv
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+
+def thread_config(thread_id: str) -> dict:
+    return {"recursion_limit": 100, "configurable": {"thread_id": thread_id}}
+
+
+async def advance(graph, queue: ReviewQueue, thread_id: str, graph_input, slots: asyncio.Semaphore, args,
+                  review=None) -> None:
+    """
+    Runs a thread until it finishes or parks at a review, then queues the review and frees the slot.
+    `review` is the claimed review the run resumes from: marked resumed once the run went on, or
+    handed back to the queue, to be retried with backoff, when it failed.
+    """
+    config = thread_config(thread_id)
+    async with slots:
+        try:
+            await arun_streaming(graph, graph_input, config, mode=args.stream_mode, prefix=f"[{thread_id}] ",
+                                 durability="sync")
+        except Exception as e:
+            logger.exception("[%s] run failed", thread_id)
+            if review is not None:
+                queue.fail(review, f"{type(e).__name__}: {e}")
+                if review.status == "failed":
+                    logger.error("[%s] %s failed %d times; not retried", thread_id, review.review, review.attempts)
+            return
+        except BaseException:
+            # Cancelled, e.g. the worker is stopping: the review is resumed by the next worker
+            if review is not None:
+                queue.release(review)
+            raise
+    if review is not None:
+        queue.resumed(review)
+    snapshot = await graph.aget_state(config)
+    if snapshot.interrupts:
+        queue.add(thread_id, snapshot.interrupts)
+    elif not snapshot.next:
+        print(f"[{thread_id}] completed")
+
+
+async def serve(graph, queue: ReviewQueue, requirements: list, args) -> None:
+    """Starts the new requirements, then resumes runs as their reviews are answered."""
+    from langchain_core.messages import HumanMessage
+    from langgraph.types import Command
+    slots = asyncio.Semaphore(args.workers)
+    running = set()
+
+    def spawn(thread_id, graph_input, review=None):
+        task = asyncio.create_task(advance(graph, queue, thread_id, graph_input, slots, args, review))
+        running.add(task)
+        task.add_done_callback(running.discard)
+
+    for thread_id, requirement in requirements:
+        snapshot = await graph.aget_state(thread_config(thread_id))
+        if snapshot.interrupts:
+            # Parked by an earlier worker: make sure its review is queued and leave it parked
+            queue.add(thread_id, snapshot.interrupts)
+        elif snapshot.next:
+            spawn(thread_id, None)
+        elif not snapshot.values:
+            spawn(thread_id, {"requirement": HumanMessage(content=requirement)})
+
+    while True:
+        for review in queue.claim_answered():
+            print(f"[{review.thread_id}] resuming with the answer to {review.review}")
+            spawn(review.thread_id, Command(resume={review.interrupt_id: review.answer}), review)
+        if args.until_idle and not running:
+            break
+        await asyncio.sleep(args.poll_interval)
+
+
+async def run_worker(args) -> None:
+    from src.LLMS.llm import load_model, rate_limits_from_env
+    from src.LLMS.router import ModelRouter
+    from src.graph.checkpoint import amake_checkpointer
+    from src.graph.graph_builder import GraphBuilder
+    from src.main_batch import read_requirements
+    load_options = dict(cache_path=os.getenv("LLM_CACHE_PATH", ".llm_cache.sqlite"), **rate_limits_from_env())
+    if args.routes:
+        default_spec = f"{args.provider}:{args.model}" if args.model else args.provider
+        model = ModelRouter.from_config(default_spec, args.routes, **load_options)
+    else:
+        model = load_model(args.provider, args.model, **load_options)
+    checkpointer = await amake_checkpointer(args.checkpoint)
+    artifact_store = None
+    if args.artifact_store:
+        # faiss and numpy are only imported when the artifact store is on
+        from src.vectorstore.artifacts import ArtifactStore
+        from src.vectorstore.index import load_embeddings
+        artifact_store = ArtifactStore(args.artifact_store, load_embeddings(args.artifact_embeddings),
+                                       threshold=args.artifact_threshold)
+    builder = GraphBuilder(
+        model, code_fan_out=os.getenv("CODE_FAN_OUT", "0") == "1", human_input=None, speculate=args.speculate,
+        stream_projects=os.getenv("STREAM_PROJECTS", "0") == "1", artifact_store=artifact_store
+    )
+    graph = builder.test_code_builder().compile(checkpointer=checkpointer)
+    queue = ReviewQueue(args.checkpoint, max_attempts=args.max_attempts)
+
+    try:
+        await serve(graph, queue, read_requirements(args.requirements) if args.requirements else [], args)
+    finally:
+        print(f"Reviews: {queue.counts()}")
+        print(builder.decision_engine.report())
+        if artifact_store is not None:
+            artifact_store.close()
+            print(artifact_store.report())
+        if builder.speculator is not None:
+            builder.speculator.close()
+            print(builder.speculator.report())
+        queue.close()
+        await checkpointer.conn.close()
+
+
+def print_review(review, full=False) -> None:
+    waited = time.time() - review.created_at
+    if review.status == "failed":
+        print(f"{review.thread_id}  {review.review}  failed after {review.attempts} attempts: {review.error}")
+    else:
+        print(f"{review.thread_id}  {review.review}  waiting {waited / 60:.0f} min")
+    if full:
+        payload = review.payload
+        for title, key in (("AI review", "feedback"), ("Artifact", "artifact")):
+            if payload.get(key):
+                print(f"\n--- {title} ---\n{payload[key]}")
+        print(f"\n--- Question ---\n{payload.get('prompt', '')}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Park runs at human reviews and answer them asynchronously.")
+    parser.add_argument("--checkpoint", default=os.getenv("CHECKPOINT_PATH", "checkpoints.sqlite"),
+                        help="SQLite file holding the checkpoints and the review queue.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    worker = commands.add_parser("worker", help="Run requirements and resume them as their reviews are answered.")
+    worker.add_argument("requirements", nargs="?", help="JSONL file, one {\"requirement\": ..., \"id\": ...} per line.")
+    worker.add_argument("--workers", type=int, default=8, help="Number of runs advanced concurrently.")
+    worker.add_argument("--poll-interval", type=float, default=2.0, help="Seconds between review queue checks.")
+    worker.add_argument("--max-attempts", type=int, default=MAX_ATTEMPTS,
+                        help="Failed resumes of a review, retried with backoff, before it is marked failed.")
+    worker.add_argument("--until-idle", action="store_true",
+                        help="Exit once every run is completed or parked instead of waiting for answers.")
+    worker.add_argument("--provider", default="openai", choices=["openai", "groq"])
+    worker.add_argument("--model", default=None, help="Model name, defaults to the provider's default model.")
+    worker.add_argument("--routes", default=os.getenv("MODEL_ROUTES", ""),
+                        help="Per-node models: 'node_or_glob=provider:model,...', a JSON object or a JSON file.")
+    worker.add_argument("--stream-mode", default="summary", choices=STREAM_MODES)
+    worker.add_argument("--artifact-store", default=os.getenv("ARTIFACT_STORE", ""),
+                        help="Folder of approved artifacts reused for similar requirements; empty disables it.")
+    worker.add_argument("--artifact-threshold", type=float, default=0.9,
+                        help="Minimum requirement similarity (cosine) for reusing a stored artifact.")
+    worker.add_argument("--artifact-embeddings", default="hash", choices=["hash", "huggingface"],
+                        help="Embeddings of the artifact store's requirement index.")
+    worker.add_argument("--speculate", action="store_true",
+                        help="Run the next stage while user stories / design documents wait for their review.")
+
+    commands.add_parser("list", help="List the pending and the failed reviews.")
+    show = commands.add_parser("show", help="Show the pending (or failed) review of a thread.")
+    show.add_argument("thread_id")
+    submit = commands.add_parser("submit", help="Answer the pending review of a thread.")
+    submit.add_argument("thread_id")
+    submit.add_argument("answer", nargs="?", help="'Accepted' or the requested changes.")
+    submit.add_argument("--file", help="Read the answer from this file ('-' for stdin).")
+    retry = commands.add_parser("retry", help="Resume the failed reviews of a thread again.")
+    retry.add_argument("thread_id")
+    args = parser.parse_args()
+
+    if args.command == "worker":
+        logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+        asyncio.run(run_worker(args))
+        return
+
+    queue = ReviewQueue(args.checkpoint)
+    try:
+        if args.command == "list":
+            reviews, failed = queue.pending(), queue.failed()
+            for review in reviews + failed:
+                print_review(review)
+            print(f"{len(reviews)} pending reviews, {len(failed)} failed")
+        elif args.command == "show":
+            reviews = queue.pending(args.thread_id) or queue.failed(args.thread_id)
+            if not reviews:
+                sys.exit(f"No pending review for thread {args.thread_id}")
+            print_review(reviews[0], full=True)
+        elif args.command == "retry":
+            reviews = queue.retry(args.thread_id)
+            if not reviews:
+                sys.exit(f"No failed review for thread {args.thread_id}")
+            print(f"Handed {len(reviews)} failed reviews of {args.thread_id} back to the worker")
+        elif args.command == "submit":
+            if args.file:
+                with (sys.stdin if args.file == "-" else open(args.file, encoding="utf-8")) as f:
+                    answer = f.read()
+            elif args.answer is not None:
+                answer = args.answer
+            else:
+                sys.exit("Give the answer as an argument or with --file")
+            try:
+                review = queue.submit(args.thread_id, answer.strip())
+            except KeyError as e:
+                sys.exit(str(e.args[0]))
+            print(f"Answered {review.review} of {review.thread_id}; the worker will resume it")
+    finally:
+        queue.close()
+
+
+if __name__ == "__main__":
+    main()
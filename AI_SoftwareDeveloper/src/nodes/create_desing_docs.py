@@ -1,6 +1,10 @@
+import asyncio
 from src.state.state import State, DesignDocuments, DDReview, DecisionDDReview
-from langchain_core.messages import HumanMessage, SystemMessage
-from langchain.prompts import PromptTemplate
+from src.state.render import render_items, render_text
+from src.nodes.decision_policy import DecisionEngine, REVIEW_LOOPS
+from src.nodes.human_review import REVIEW_CONTEXT_BUDGET, ask_reviewer
+from langchain_core.messages import SystemMessage
+from src.nodes.prompts import PROMPTS, structured_output
 # import json
 
 
@@ -8,45 +12,56 @@ class DocumentsDesigner:
     """
     Node to generate Functional and Technical Design Documents based on user stories.
     """
-    SYSTEM_PROMPT = (
-        "You are an AI expert specializing in software architecture and design documentation. "
-        "Your role is to generate **Functional Design Documents (FDD)** and **Technical Design Documents (TDD)** "
-        "based on the provided user stories. Ensure clarity, completeness, and adherence to industry best practices.\n\n"
-        "**Guidelines:**\n"
-        "- The Functional Design Document (FDD) should focus on user workflows, system interactions, and feature descriptions.\n"
-        "- The Technical Design Document (TDD) should cover system architecture, data structures, APIs, and security considerations.\n"
-        "- Follow standard documentation formats and use clear, structured Markdown output.\n\n"
-        "Now, generate the design documents using the following user stories."
-    )
+    # Token budget for the state artifacts rendered into the prompt
+    CONTEXT_BUDGET = 8000
 
-    def __init__(self, model):
+    def __init__(self, model, artifacts=None):
         self.llm = model
+        # Optional ArtifactStore: the first documents are reused when a similar requirement had them approved on the same user stories
+        self.artifacts = artifacts
+
+    def planner_messages(self, state: State) -> list:
+        """Builds the prompt used to generate the design documents."""
+        return PROMPTS["design_documents"].messages(
+            user_stories=render_items(state.get("user_stories"), self.CONTEXT_BUDGET, "No user stories provided.")
+        )
 
     def design_document_planner(self, state: State) -> dict:
         """Orchestrates the generation of design documents based on user stories."""
-        planner = self.llm.with_structured_output(DesignDocuments)
-        
-        user_stories = state.get("user_stories", "No user stories provided.")
+        if self.artifacts is not None and not state.get("design_documents"):
+            reused = self.artifacts.reuse(state, "design_documents")
+            if reused is not None:
+                return {"design_documents": reused}
+
+        planner = structured_output(self.llm, DesignDocuments)
         
-        project_design_documents = planner.invoke([
-            SystemMessage(content=self.SYSTEM_PROMPT),
-            HumanMessage(content=f"User Stories:\n{user_stories}")
-        ])
+        project_design_documents = planner.invoke(self.planner_messages(state))
         
         return {"design_documents": project_design_documents.design_documents}
+
+    async def adesign_document_planner(self, state: State) -> dict:
+        """Async variant of `design_document_planner`."""
+        if self.artifacts is not None and not state.get("design_documents"):
+            reused = await self.artifacts.areuse(state, "design_documents")
+            if reused is not None:
+                return {"design_documents": reused}
+        planner = structured_output(self.llm, DesignDocuments)
+        project_design_documents = await planner.ainvoke(self.planner_messages(state))
+        return {"design_documents": project_design_documents.design_documents}
     
 # class UserStoriesReview:
     """
     Node to generate design documents based on user stories.
     """
-    def __init__(self, model):
+    def __init__(self, model, artifacts=None):
         self.llm = model
+        self.artifacts = artifacts
 
     def user_stories_reviewer(self, state: State) -> dict:
         """Generates Functional and Technical Design Documents based on user stories."""
 
         # Augment the LLM with a structured output schema
-        planner = self.llm.with_structured_output(DesignDocuments)
+        planner = structured_output(self.llm, DesignDocuments)
 
         # Extract state variables with default values
         user_stories = state.get("user_stories", "No user stories provided.")
@@ -105,48 +120,53 @@ class DesignDocumentReview:
     """
     Node to review design documents for completeness and quality.
     """
-    REVIEW_PROMPT = (
-        "You are an expert software architect reviewing Functional and Technical Design Documents. "
-        "Your goal is to evaluate the documents for completeness, accuracy, and feasibility based on the given user stories. \n\n"
-        "**Review Criteria:**\n"
-        "1. **Completeness**: Are all required features and components documented?\n"
-        "2. **Clarity**: Is the document structured logically and easy to understand?\n"
-        "3. **Technical Feasibility**: Do the proposed solutions align with best practices and technology constraints?\n"
-        "4. **Scalability & Security**: Are performance, security, and maintainability properly addressed?\n"
-        "5. **Consistency**: Do the documents align with the user stories and acceptance criteria?\n\n"
-        "Provide a structured review identifying gaps, inconsistencies, or improvements needed."
-    )
+    CONTEXT_BUDGET = 12000
 
     def __init__(self, model):
         self.llm = model
 
+    def review_messages(self, state: State) -> list:
+        """Builds the design document review prompt."""
+        return PROMPTS["design_review"].messages(
+            design_documents=render_items(state.get('design_documents'), self.CONTEXT_BUDGET, 'No design documents available.')
+        )
+
     def design_document_reviewer(self, state: State) -> dict:
         """AI-assisted review of design documents."""
-        doc_reviewer = self.llm.with_structured_output(DDReview)
+        doc_reviewer = structured_output(self.llm, DDReview)
 
-        review_feedback = doc_reviewer.invoke([
-            SystemMessage(content=self.REVIEW_PROMPT),
-            HumanMessage(content=f"Here are the generated design documents:\n{state.get('design_documents', 'No design documents available.')}")
-        ])
+        review_feedback = doc_reviewer.invoke(self.review_messages(state))
+
+        return {"dd_review": review_feedback.dd_review}
 
+    async def adesign_document_reviewer(self, state: State) -> dict:
+        """Async variant of `design_document_reviewer`."""
+        doc_reviewer = structured_output(self.llm, DDReview)
+        review_feedback = await doc_reviewer.ainvoke(self.review_messages(state))
         return {"dd_review": review_feedback.dd_review}
 
 class HumanLoopDesignDocumentReview:
     """
     Human-in-the-loop product owner review process.
     """
-    @staticmethod
-    def get_human_feedback(state: State) -> dict:
+    def __init__(self, ask=input):
+        # Callable that collects the reviewer's answer, `input` by default; None suspends the run with an interrupt
+        self.ask = ask
+
+    def get_human_feedback(self, state: State) -> dict:
         """Collects human feedback on the Product Owner review."""
         
-        print("\n=== Human Review Required for Design Document ===")
-        print("An AI has suggested changes to the Design Documents.")
-        print(f"\n🔹 Original Design Documents:\n{state['design_documents']}\n")
-        print(f"\n📌 AI Review Feedback:\n{state['dd_review']}\n")
+        if self.ask is not None:
+            print("\n=== Human Review Required for Design Document ===")
+            print("An AI has suggested changes to the Design Documents.")
+            print(f"\n🔹 Original Design Documents:\n{state['design_documents']}\n")
+            print(f"\n📌 AI Review Feedback:\n{state['dd_review']}\n")
         
         # Collect human feedback with a clearer message
-        human_review = input(
-            "Please enter any modifications for the Design Documents, or type 'Accepted' if no changes are needed:\n"
+        human_review = ask_reviewer(
+            self.ask, "human_dd_review",
+            "Please enter any modifications for the Design Documents, or type 'Accepted' if no changes are needed:\n",
+            artifact=render_items(state['design_documents'], REVIEW_CONTEXT_BUDGET), feedback=state['dd_review'],
         ).strip()
         
         # Validate input
@@ -155,39 +175,35 @@ class HumanLoopDesignDocumentReview:
             human_review = "Pending Review"
         
         return {"human_dd_review": human_review}
+
+    async def aget_human_feedback(self, state: State) -> dict:
+        """Async variant of `get_human_feedback`; the blocking prompt runs in a worker thread."""
+        if self.ask is None:
+            # Interrupts suspend the run without holding a thread
+            return self.get_human_feedback(state)
+        return await asyncio.to_thread(self.get_human_feedback, state)
    
 class DecisionDesignDocumentReview:
     """
     Node to approve or reject functional and technical design documents based on review feedback.
     """
-    def __init__(self, model):
-        self.llm = model
+    CONTEXT_BUDGET = 12000
 
-    def decision_review(self, state: State) -> dict:
-        """Checks if review feedback was met and decides to approve or reject the design documents."""
-        
-        evaluator = self.llm.with_structured_output(DecisionDDReview)
-
-        # print("\n=== Input State in Decision Review ===")
-        # print(json.dumps(state, indent=4))  # Print state in readable JSON format
-
-        # Invoke evaluator for the review decision
-        decision_review = evaluator.invoke([
-            SystemMessage(content=(
-                "You are an AI responsible for making the final decision on functional and technical design documents. "
-                "Your task is to determine whether the suggested improvements from the design document review "
-                "and human-in-the-loop review have been properly incorporated."
-            )),
-            HumanMessage(content=(
-                f"**Latest Design Document Review Feedback:**\n{state.get('dd_review', 'No review available')}\n\n"
-                f"**Latest Human Review Feedback:**\n{state.get('human_dd_review', 'No human review available')}\n\n"
-                f"**User Stories:**\n{state.get('user_stories', 'No user stories provided')}\n\n"
-                f"**Design Documents:**\n{state.get('design_documents', 'No design documents available')}\n\n"
-                "Based on the design document review feedback, human review feedback, and user stories, "
-                "determine whether all necessary changes have been incorporated or if the design documents need further updates."
-            )),
-        ])
+    def __init__(self, model, policy=None):
+        self.llm = model
+        self.policy = policy or DecisionEngine()
+
+    def decision_messages(self, state: State) -> list:
+        """Builds the prompt for the final decision on the design documents."""
+        return PROMPTS["design_decision"].messages(
+            user_stories=render_items(state.get('user_stories'), self.CONTEXT_BUDGET // 4, 'No user stories provided'),
+            design_documents=render_items(state.get('design_documents'), self.CONTEXT_BUDGET // 2, 'No design documents available'),
+            dd_review=render_text(state.get('dd_review', 'No review available'), self.CONTEXT_BUDGET // 8),
+            human_dd_review=render_text(state.get('human_dd_review', 'No human review available'), self.CONTEXT_BUDGET // 8),
+        )
 
+    def decision_result(self, decision_review, state: State) -> dict:
+        """Turns the model decision into the state update."""
         # Extract the decision and handle potential errors
         decision = str(decision_review.decision_dd_review).strip() if hasattr(decision_review, "decision_dd_review") else "Rejected"
     
@@ -204,13 +220,32 @@ class DecisionDesignDocumentReview:
             "decision_dd_review": decision,
             "times_reject_dd": state["times_reject_dd"]
         }
+
+    def decision_review(self, state: State) -> dict:
+        """Checks if review feedback was met and decides to approve or reject the design documents."""
+        
+        # print("\n=== Input State in Decision Review ===")
+        # print(json.dumps(state, indent=4))  # Print state in readable JSON format
+
+        # Rule based policies first, the evaluator only when none of them applies
+        decision_review, decided_by = self.policy.settle("design", state, DecisionDDReview)
+        if decision_review is None:
+            evaluator = structured_output(self.llm, DecisionDDReview)
+            decision_review = evaluator.invoke(self.decision_messages(state))
+
+        return self.policy.remember("design", state, self.decision_result(decision_review, state), decided_by)
+
+    async def adecision_review(self, state: State) -> dict:
+        """Async variant of `decision_review`."""
+        decision_review, decided_by = self.policy.settle("design", state, DecisionDDReview)
+        if decision_review is None:
+            evaluator = structured_output(self.llm, DecisionDDReview)
+            decision_review = await evaluator.ainvoke(self.decision_messages(state))
+        return self.policy.remember("design", state, self.decision_result(decision_review, state), decided_by)
     
 def route_document_review(state: State) -> dict:
     """Checks if documents was approved and passes them to the next stage."""
     # print("\n=== Route Design Document Review ===")
     # print(f"decision_dd_review: {state['decision_po_review']}")
-    if state["decision_dd_review"] == "Accepted" or state["times_reject_dd"]>=1:
-        return "Accepted"
-    elif state["decision_dd_review"] == "Rejected":
-        return "Rejected + Feedback"
+    return REVIEW_LOOPS["design"].route(state)
     
\ No newline at end of file
@@ -0,0 +1,237 @@
+"""
+Decision policies for the four review loops.
+
+Each loop ends in a decision node that asks the model for Accepted / Rejected. Rule based
+policies settle the cases that need no model call: the results of running the artifact's
+tests, an explicit human verdict, an empty review, the same inputs as an earlier decision,
+or a loop whose rejection budget is spent (the route accepts whatever the model says).
+The model is only consulted when no rule applies, and every policy keeps hit-rate stats.
+`remember` records who decided: an accept forced by a spent budget is not an approval and is
+never handed to the artifact store.
+"""
+import hashlib
+import re
+import threading
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from src.state.render import as_text
+
+
+@dataclass(frozen=True)
+class ReviewLoop:
+    name: str
+    artifact: str
+    review: str
+    human: str
+    decision: str
+    counter: str
+    max_rejections: int
+    # The route accepts once the counter reaches `max_rejections`: the loop goes back to its generator
+    # max_rejections - 1 times. The test cases counter counts every decision after the first one.
+    counts_every_decision: bool = False
+    # State key of the execution results of the artifact (see src/tools/test_runner.py), if it is run
+    results: str = None
+
+    def counter_after_rejection(self, state) -> int:
+        if self.counts_every_decision:
+            return state[self.counter] + 1 if self.counter in state else 0
+        return state.get(self.counter, 0) + 1
+
+    def route(self, state) -> str:
+        """Accepted once the decision is Accepted or the rejection budget is spent."""
+        if state.get(self.decision) == "Accepted" or state.get(self.counter, 0) >= self.max_rejections:
+            return "Accepted"
+        return "Rejected + Feedback"
+
+
+REVIEW_LOOPS = {
+    "product_owner": ReviewLoop("product_owner", "user_stories", "po_review", "human_po_review",
+                                "decision_po_review", "times_reject_po", 2),
+    "design": ReviewLoop("design", "design_documents", "dd_review", "human_dd_review",
+                         "decision_dd_review", "times_reject_dd", 2),
+    "code": ReviewLoop("code", "generated_project", "code_review_feedback", "human_code_review",
+                       "decision_code_review_feedback", "times_reject_code", 4),
+    "test_cases": ReviewLoop("test_cases", "test_cases_codes", "test_cases_feedback", "human_test_cases_review",
+                             "decision_test_cases_feedback", "times_reject_tc", 1, counts_every_decision=True,
+                             results="test_results"),
+}
+
+ACCEPT_WORDS = {"accepted", "accept", "approved", "approve", "lgtm", "ok", "okay", "yes", "y"}
+REJECT_WORDS = {"rejected", "reject", "no", "n"}
+# A verdict followed by its reasons, e.g. "Rejected: the stories miss the login"
+LEADING_VERDICT = re.compile(r"^(accepted|approved|rejected)\s*[:\-\u2013\u2014]")
+# Deciders of an accept that is not an approval of the artifact
+FORCED = {"loop_budget"}
+
+
+def is_blank(value) -> bool:
+    return value is None or as_text(value) in ("", "None")
+
+
+def fingerprint(loop: ReviewLoop, state) -> str:
+    """Hash of everything the decision of `loop` depends on."""
+    inputs = [repr(state.get(loop.artifact)), as_text(state.get(loop.review)), as_text(state.get(loop.human))]
+    return hashlib.sha256("\0".join(inputs).encode("utf-8")).hexdigest()
+
+
+class DecisionPolicy(ABC):
+    """A rule that settles a decision (Accepted / Rejected) or returns None to pass."""
+    name = "policy"
+
+    def __init__(self):
+        self.calls = 0
+        self.hits = 0
+
+    @abstractmethod
+    def decide(self, loop: ReviewLoop, state):
+        """'Accepted', 'Rejected', or None when the rule does not apply to `state`."""
+
+
+class LoopBudgetPolicy(DecisionPolicy):
+    """
+    The route accepts after this decision even if it is a rejection, so there is nothing to ask.
+    Only applies once the loop went back to its generator: the first decision is always a real one.
+    """
+    name = "loop_budget"
+
+    def decide(self, loop, state):
+        if loop.counter in state and loop.counter_after_rejection(state) >= loop.max_rejections:
+            return "Accepted"
+        return None
+
+
+class TestResultsPolicy(DecisionPolicy):
+    """
+    The artifact's tests were run: any failure, error or timeout rejects it, and a clean run
+    accepts it unless the human asked for changes. When no test ran, the other rules decide.
+    """
+    name = "test_results"
+
+    def decide(self, loop, state):
+        results = state.get(loop.results) if loop.results else None
+        if not results:
+            return None
+        broken = results["failed"] + results["errors"] + results["timeouts"]
+        if broken:
+            return "Rejected"
+        human = state.get(loop.human)
+        if results["passed"] and (is_blank(human) or as_text(human).lower().strip(" .!") in ACCEPT_WORDS):
+            return "Accepted"
+        return None
+
+
+class HumanVerdictPolicy(DecisionPolicy):
+    """The human reviewer answered with an explicit verdict ('Accepted', 'reject', 'lgtm', ...)."""
+    name = "human_verdict"
+
+    def decide(self, loop, state):
+        answer = as_text(state.get(loop.human)).lower().strip(" .!")
+        leading = LEADING_VERDICT.match(answer)
+        if leading is not None:
+            answer = leading.group(1)
+        if answer in ACCEPT_WORDS:
+            return "Accepted"
+        if answer in REJECT_WORDS:
+            return "Rejected"
+        return None
+
+
+class EmptyFeedbackPolicy(DecisionPolicy):
+    """Neither the reviewer nor the human asked for anything."""
+    name = "empty_feedback"
+
+    def decide(self, loop, state):
+        if is_blank(state.get(loop.review)) and is_blank(state.get(loop.human)):
+            return "Accepted"
+        return None
+
+
+class UnchangedArtifactPolicy(DecisionPolicy):
+    """The artifact and both reviews are the same as at an earlier decision: repeat it."""
+    name = "unchanged_artifact"
+
+    def decide(self, loop, state):
+        previous = (state.get("decision_fingerprints") or {}).get(loop.name)
+        if previous and previous[0] == fingerprint(loop, state):
+            return previous[1]
+        return None
+
+
+class DecisionEngine:
+    """
+    Runs the policies in order; the first one that decides settles the decision. Shared by
+    all decision nodes of a graph, so `stats()` shows how many model calls each rule saved.
+    """
+    def __init__(self, policies=None, artifacts=None):
+        self.policies = policies if policies is not None else [
+            LoopBudgetPolicy(), TestResultsPolicy(), HumanVerdictPolicy(), EmptyFeedbackPolicy(),
+            UnchangedArtifactPolicy(),
+        ]
+        # Optional ArtifactStore (src/vectorstore/artifacts.py) receiving every accepted artifact
+        self.artifacts = artifacts
+        self.model_calls = 0
+        self.lock = threading.Lock()
+
+    def decide(self, loop_name: str, state) -> tuple:
+        """(decision, name of the policy that settled it), or (None, 'model') when the model has to decide."""
+        loop = REVIEW_LOOPS[loop_name]
+        for policy in self.policies:
+            decision = policy.decide(loop, state)
+            with self.lock:
+                policy.calls += 1
+                policy.hits += decision is not None
+            if decision is not None:
+                print(f"Decision settled by the {policy.name} policy: {decision}")
+                return decision, policy.name
+        with self.lock:
+            self.model_calls += 1
+        return None, "model"
+
+    def settle(self, loop_name: str, state, schema) -> tuple:
+        """(the settled decision as an instance of the node's decision `schema` or None, who decided)."""
+        decision, decided_by = self.decide(loop_name, state)
+        if decision is None:
+            return None, decided_by
+        return schema(**{next(iter(schema.model_fields)): decision}), decided_by
+
+    def remember(self, loop_name: str, state, update: dict, decided_by="model") -> dict:
+        """
+        State update recording the inputs, outcome and decider of a decision, for UnchangedArtifactPolicy.
+        Accepted artifacts are handed to the artifact store, if there is one, unless the accept was forced.
+        """
+        loop = REVIEW_LOOPS[loop_name]
+        fingerprints = dict(state.get("decision_fingerprints") or {})
+        previous = fingerprints.get(loop_name)
+        if decided_by == UnchangedArtifactPolicy.name and previous and len(previous) > 2:
+            # A repeated decision was made by whoever made the original one
+            decided_by = previous[2]
+        if self.artifacts is not None and update[loop.decision] == "Accepted" and decided_by not in FORCED:
+            self.artifacts.record(state, loop.artifact)
+        fingerprints[loop_name] = [fingerprint(loop, state), update[loop.decision], decided_by]
+        return {**update, "decision_fingerprints": fingerprints}
+
+    def stats(self) -> dict:
+        with self.lock:
+            settled = sum(policy.hits for policy in self.policies)
+            total = settled + self.model_calls
+            return {
+                "decisions": total,
+                "model_calls": self.model_calls,
+                "model_calls_saved": settled,
+                "policies": {
+                    policy.name: {
+                        "calls": policy.calls,
+                        "hits": policy.hits,
+                        "hit_rate": round(policy.hits / policy.calls, 3) if policy.calls else 0.0,
+                    }
+                    for policy in self.policies
+                },
+            }
+
+    def report(self) -> str:
+        stats = self.stats()
+        lines = [f"Decisions: {stats['decisions']}, settled by policies: {stats['model_calls_saved']}, "
+                 f"model calls: {stats['model_calls']}"]
+        for name, policy in stats["policies"].items():
+            lines.append(f"  {name:<20} {policy['hits']:>4} / {policy['calls']:<4} hit rate {policy['hit_rate']:.0%}")
+        return "\n".join(lines)
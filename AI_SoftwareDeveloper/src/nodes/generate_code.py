@@ -1,209 +1,431 @@
-from src.state.state import State, CodReview, DecisionCodReview, GeneratedProject
-from langchain_core.messages import HumanMessage, SystemMessage
-from langchain.prompts import PromptTemplate
+from src.state.state import State, CodReview, DecisionCodReview, GeneratedProject, GeneratedCode, ProjectManifest, RevisionPlan
+from src.state.render import file_key, render_items, render_project, render_text
+from src.nodes.decision_policy import DecisionEngine, REVIEW_LOOPS
+from src.nodes.human_review import REVIEW_CONTEXT_BUDGET, ask_reviewer
+from src.nodes.prompts import PROMPTS, structured_output
+from src.LLMS.structured_stream import astream_project, stream_project
+from src.tools.security_scan import prescan
+from langchain_core.runnables.config import ContextThreadPoolExecutor
+import asyncio
 
 
 class CodeGenerator:
     """
     Node to generate or refine code based on design documents and feedback.
     """
-    SYSTEM_PROMPT = (
-        "You are an expert AI Software Engineer. Your task is to generate or improve a full-stack project "
-        "based on the provided Functional and Technical Design Documents. If previous code was rejected, "
-        "use the feedback to improve it.\n\n"
-        "### Objectives:\n"
-        "1. Follow best coding practices.\n"
-        "2. Ensure the code matches the system architecture in the design documents.\n"
-        "3. Address all code review and human feedback comments.\n"
-        "4. Reuse and improve upon any previous code if available.\n"
-        "5. Include project setup files and documentation.\n\n"
-        "### Inputs:\n"
-        "- Design Documents: {design_documents}\n"
-        "- Code Review Feedback: {code_review_feedback}\n"
-        "- Human Feedback: {human_code_review}\n"
-        "- Previous Project Code (if any): {previous_code_summary}\n\n"
-        "### Output:\n"
-        "- Improved or newly generated project code\n"
-        "- Updated folder structure, APIs, models, configurations, and documentation\n\n"
-        "Act like a senior engineer iterating after a rejected pull request. Be adaptive and precise."
-    )
-
-    def __init__(self, model):
-        self.llm = model
+    # Token budget for the state artifacts rendered into the prompt
+    CONTEXT_BUDGET = 16000
 
-    def summarize_code(self, generated_project: dict) -> str:
+    def __init__(self, model, fan_out=False, max_workers=8, retriever=None, stream=False, artifacts=None):
+        self.llm = model
+        # Optional ProjectRetriever used to pull related code into per-file revisions
+        self.retriever = retriever
+        # Plan-then-fan-out: one call for the file manifest, then one concurrent call per file
+        self.fan_out = fan_out
+        self.max_workers = max_workers
+        # Single-call projects are streamed and parsed file by file (src/LLMS/structured_stream.py)
+        self.stream = stream
+        # Optional ArtifactStore: the first project is reused when a similar requirement had it approved on the same documents
+        self.artifacts = artifacts
+
+    file_key = staticmethod(file_key)
+
+    def summarize_code(self, generated_project: list) -> str:
         """Create a brief summary of the previously generated project."""
         if not generated_project:
             return "No previous code available."
 
-        # Try to extract main parts: modules, files, or components
-        try:
-            modules = list(generated_project.keys())  # If it's a dict with top-level parts
-            summary = f"Previous project contained: {', '.join(modules[:10])}."
-            if len(modules) > 10:
-                summary += f" (and {len(modules) - 10} more modules)"
-        except Exception:
-            summary = "Previous code was available but could not be summarized."
+        # List the files of the previous project
+        modules = [self.file_key(item) for item in generated_project]
+        summary = f"Previous project contained: {', '.join(modules[:10])}."
+        if len(modules) > 10:
+            summary += f" (and {len(modules) - 10} more modules)"
 
         summary += " Reviewers requested changes to improve functionality or structure."
         return summary
 
-    def code_developer(self, state: State) -> dict:
-        """Orchestrates code generation or refinement based on design documents and feedback."""
-        planner = self.llm.with_structured_output(GeneratedProject)
-
-        # Retrieve state values
-        design_docs = state.get("design_documents", [])
-        code_review_feedback = state.get("code_review_feedback", "")
-        human_code_review = state.get("human_code_review", "")
-        previous_code = state.get("generated_project", None)
+    def revision_messages(self, generated_project: list, code_review_feedback, human_code_review) -> list:
+        """Builds the prompt that plans which files a rejected project changes and adds."""
+        return PROMPTS["code_revision_plan"].messages(
+            code_review_feedback=code_review_feedback,
+            human_code_review=human_code_review,
+            project_files="\n".join(f"- {self.file_key(item)}" for item in generated_project),
+        )
 
-        previous_code_summary = self.summarize_code(previous_code)
+    def revision_targets(self, generated_project: list, plan: RevisionPlan) -> tuple:
+        """The existing files to revise and the planned files to add; a planned path that exists is revised."""
+        existing = {self.file_key(item): item for item in generated_project}
+        targets, additions = {}, {}
+        for planned in [*plan.change, *plan.add]:
+            key = self.file_key(planned)
+            if key in existing:
+                targets.setdefault(key, existing[key])
+            else:
+                additions.setdefault(key, planned)
+        return list(targets.values()), list(additions.values())
+
+    def plan_revision(self, state: State, code_review_feedback, human_code_review) -> tuple:
+        """
+        After a rejection, asks which files the feedback is about: (files to revise, files to add).
+        Both are empty on the first pass and when the feedback asks for a rewrite of the project.
+        """
+        previous_code = state.get("generated_project") or []
+        if not previous_code or not (state.get("code_review_feedback") or state.get("human_code_review")):
+            return [], []
+        planner = structured_output(self.llm, RevisionPlan)
+        plan = planner.invoke(self.revision_messages(previous_code, code_review_feedback, human_code_review))
+        return self.revision_targets(previous_code, plan)
+
+    async def aplan_revision(self, state: State, code_review_feedback, human_code_review) -> tuple:
+        """Async variant of `plan_revision`."""
+        previous_code = state.get("generated_project") or []
+        if not previous_code or not (state.get("code_review_feedback") or state.get("human_code_review")):
+            return [], []
+        planner = structured_output(self.llm, RevisionPlan)
+        plan = await planner.ainvoke(self.revision_messages(previous_code, code_review_feedback, human_code_review))
+        return self.revision_targets(previous_code, plan)
+
+    def revision_manifest(self, generated_project: list, additions: list) -> str:
+        """The files of the revised project: the existing ones, then the planned additions with their purpose."""
+        return "\n".join(
+            [f"- {self.file_key(item)}" for item in generated_project] + self.manifest_text(additions).splitlines()
+        )
 
-        # Construct prompt
-        prompt = self.SYSTEM_PROMPT.format(
+    def related_code(self, item, state: State, code_review_feedback) -> str:
+        """Top-k chunks of the other files that relate to the file being revised and its feedback."""
+        if self.retriever is None:
+            return "None"
+        chunks = [
+            chunk for chunk in self.retriever.search(state, f"{self.file_key(item)}\n{code_review_feedback}", kind="code")
+            if chunk.source != self.file_key(item)
+        ]
+        return "\n\n".join(f"### {chunk.source} (from line {chunk.start_line})\n{chunk.text}" for chunk in chunks) or "None"
+
+    def revise_messages(self, item, state: State, project_files, design_docs, code_review_feedback, human_code_review) -> list:
+        """Builds the prompt that revises a single file of the previous project."""
+        # Every revised file gets the same project listing, so the calls share their prefix up to the file
+        return PROMPTS["code_revise"].messages(
             design_documents=design_docs,
             code_review_feedback=code_review_feedback,
             human_code_review=human_code_review,
-            previous_code_summary=previous_code_summary
+            project_files=project_files or "None",
+            parent_folder=item.parent_folder,
+            file_path=item.file_path,
+            related_code=self.related_code(item, state, code_review_feedback),
+            current_code=item.generated_code,
         )
 
-        # Invoke the model
-        generated_project = planner.invoke([SystemMessage(content=prompt)])
+    def merge_revised(self, generated_project: list, revised: list, added=()) -> list:
+        """Replaces the revised files in place, carries every other file forward verbatim and appends the added ones."""
+        revised_by_key = {self.file_key(item): item for item in revised}
+        print(f"Regenerated {len(revised)} of {len(generated_project)} files: {', '.join(revised_by_key) or 'none'}; "
+              f"added {len(added)}: {', '.join(self.file_key(item) for item in added) or 'none'}")
+        return [revised_by_key.get(self.file_key(item), item) for item in generated_project] + list(added)
+
+    def selective_code_developer(self, state: State, targets, additions, design_docs, code_review_feedback,
+                                 human_code_review) -> list:
+        """Regenerates only the files the feedback is about and writes the files it asks to add."""
+        developer = structured_output(self.llm, GeneratedCode)
+        project_files = self.revision_manifest(state["generated_project"], additions)
+
+        def revise_file(item):
+            generated = developer.invoke(
+                self.revise_messages(item, state, project_files, design_docs, code_review_feedback, human_code_review)
+            )
+            return self.placed_file(item, generated)
+
+        def add_file(planned):
+            return self.generate_file(planned, project_files, design_docs, code_review_feedback, human_code_review)
+
+        with ContextThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            revised = pool.map(revise_file, targets)
+            added = pool.map(add_file, additions)
+            return self.merge_revised(state["generated_project"], list(revised), list(added))
+
+    async def aselective_code_developer(self, state: State, targets, additions, design_docs, code_review_feedback,
+                                        human_code_review) -> list:
+        """Async variant of `selective_code_developer`."""
+        developer = structured_output(self.llm, GeneratedCode)
+        project_files = self.revision_manifest(state["generated_project"], additions)
+        semaphore = asyncio.Semaphore(self.max_workers)
+
+        async def revise_file(item):
+            async with semaphore:
+                generated = await developer.ainvoke(
+                    self.revise_messages(item, state, project_files, design_docs, code_review_feedback, human_code_review)
+                )
+            return self.placed_file(item, generated)
+
+        async def add_file(planned):
+            async with semaphore:
+                generated = await developer.ainvoke(
+                    self.file_messages(planned, project_files, design_docs, code_review_feedback, human_code_review)
+                )
+            return self.placed_file(planned, generated)
+
+        revised = asyncio.gather(*(revise_file(item) for item in targets))
+        added = asyncio.gather(*(add_file(planned) for planned in additions))
+        revised, added = await asyncio.gather(revised, added)
+        return self.merge_revised(state["generated_project"], list(revised), list(added))
+
+    def manifest_messages(self, design_docs, code_review_feedback, human_code_review) -> list:
+        """Builds the prompt that asks for the file manifest of the project."""
+        return PROMPTS["code_manifest"].messages(
+            design_documents=design_docs,
+            code_review_feedback=code_review_feedback,
+            human_code_review=human_code_review
+        )
 
-        return {"generated_project": generated_project.generated_project}
-    
-# class CodeGenerator:
-    """
-    Node to generate code based on functional and technical documents.
-    """
-    SYSTEM_PROMPT = (
-        "You are an expert AI Software Engineer specializing in full-stack development. Your task is to generate fully functional, end-to-end project code based on the provided **Functional Design Document (FDD)** and **Technical Design Document (TDD)**. The generated code must:\n"
-        "1. **Follow Best Practices** - Ensure modularity, scalability, maintainability, and security.\n"
-        "2. **Be Complete & Functional** - Each part of the code should integrate seamlessly, forming a fully operational project.\n"
-        "3. **Match the Provided Architecture** - The system should align with the documented backend, frontend, database, and API structure.\n"
-        "4. **Include Dependencies & Configuration** - Generate appropriate package dependencies (`package.json`, `requirements.txt`, `Dockerfile`, `config.yaml`, `.env`, etc.).\n"
-        "5. **Ensure Code Readability & Documentation** - Provide inline comments and relevant README instructions.\n"
-        "6. **Implement Security Measures** - Follow secure coding practices, including authentication, authorization, and encryption where necessary.\n"
-        "7. **Follow CI/CD and Deployment Guidelines** - If applicable, generate scripts for testing, building, and deploying the application.\n\n"
-        "### Provided Inputs:\n"
-        "- **Functional & Technical Design Documents:** {design_documents}\n"
-        "- **Code Review Feedback:** {code_review_feedback}\n"
-        "- **Human Review Feedback:** {human_code_review}\n\n"
-        "### Expected Output:\n"
-        "- **Project Structure** (e.g., backend, frontend, config, dependencies, API, services).\n"
-        "- **Fully Implemented Source Code** for backend and frontend.\n"
-        "- **API Endpoints & Database Models** matching the design.\n"
-        "- **Configuration & Setup Files** for easy deployment.\n"
-        "Ensure that the generated code is **ready for execution** with minimal modifications."
-    )
-
-    def __init__(self, model):
-        self.llm = model
+    @staticmethod
+    def unique_files(manifest) -> list:
+        """Drops duplicated manifest entries, keeping the first occurrence."""
+        planned_files = {}
+        for planned in manifest.files:
+            planned_files.setdefault((planned.parent_folder, planned.file_path), planned)
+        return list(planned_files.values())
 
-    def code_developer(self, state: State) -> dict:
-        """Orchestrates the generation of code based on functional and technical documents."""
-        planner = self.llm.with_structured_output(GeneratedProject)
+    @staticmethod
+    def manifest_text(planned_files) -> str:
+        return "\n".join(f"- {planned.parent_folder}/{planned.file_path}: {planned.purpose}" for planned in planned_files)
+
+    def file_messages(self, planned, manifest_text, design_docs, code_review_feedback, human_code_review) -> list:
+        """Builds the prompt that asks for the content of a single planned file."""
+        return PROMPTS["code_file"].messages(
+            design_documents=design_docs,
+            code_review_feedback=code_review_feedback,
+            human_code_review=human_code_review,
+            manifest=manifest_text,
+            parent_folder=planned.parent_folder,
+            file_path=planned.file_path,
+            purpose=planned.purpose,
+        )
+
+    @staticmethod
+    def placed_file(planned, generated) -> GeneratedCode:
+        # The manifest (or the previous file) is the source of truth for where the file lives
+        return GeneratedCode(
+            parent_folder=planned.parent_folder,
+            file_path=planned.file_path,
+            generated_code=generated.generated_code
+        )
 
-        # Safely retrieve design documents and other inputs from state
-        design_docs = state.get("design_documents", [])
-        code_review_feedback = state.get("code_review_fedback", "")
-        human_code_review = state.get("human_code_review", "")
+    def plan_files(self, design_docs, code_review_feedback, human_code_review) -> list:
+        """Asks for the file manifest of the project, without file contents."""
+        planner = structured_output(self.llm, ProjectManifest)
+        manifest = planner.invoke(self.manifest_messages(design_docs, code_review_feedback, human_code_review))
+        return self.unique_files(manifest)
+
+    def generate_file(self, planned, manifest_text, design_docs, code_review_feedback, human_code_review) -> GeneratedCode:
+        """Generates the content of a single planned file."""
+        developer = structured_output(self.llm, GeneratedCode)
+        generated = developer.invoke(
+            self.file_messages(planned, manifest_text, design_docs, code_review_feedback, human_code_review)
+        )
+        return self.placed_file(planned, generated)
+
+    def fan_out_code_developer(self, design_docs, code_review_feedback, human_code_review) -> list:
+        """Plans the file manifest and generates every file concurrently with bounded parallelism."""
+        planned_files = self.plan_files(design_docs, code_review_feedback, human_code_review)
+        manifest_text = self.manifest_text(planned_files)
+
+        with ContextThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            return list(pool.map(
+                lambda planned: self.generate_file(
+                    planned, manifest_text, design_docs, code_review_feedback, human_code_review
+                ),
+                planned_files
+            ))
 
-        # Create the prompt
-        prompt = self.SYSTEM_PROMPT.format(
+    async def afan_out_code_developer(self, design_docs, code_review_feedback, human_code_review) -> list:
+        """Async variant of `fan_out_code_developer`, bounded by a semaphore instead of a thread pool."""
+        planner = structured_output(self.llm, ProjectManifest)
+        manifest = await planner.ainvoke(self.manifest_messages(design_docs, code_review_feedback, human_code_review))
+        planned_files = self.unique_files(manifest)
+        manifest_text = self.manifest_text(planned_files)
+
+        developer = structured_output(self.llm, GeneratedCode)
+        semaphore = asyncio.Semaphore(self.max_workers)
+
+        async def generate_file(planned):
+            async with semaphore:
+                generated = await developer.ainvoke(
+                    self.file_messages(planned, manifest_text, design_docs, code_review_feedback, human_code_review)
+                )
+            return self.placed_file(planned, generated)
+
+        return list(await asyncio.gather(*(generate_file(planned) for planned in planned_files)))
+
+    def developer_inputs(self, state: State) -> tuple:
+        """Safely retrieves design documents and other inputs from state, rendered for the prompt."""
+        design_docs = render_items(state.get("design_documents"), self.CONTEXT_BUDGET // 2)
+        code_review_feedback = render_text(state.get("code_review_feedback", ""), self.CONTEXT_BUDGET // 8)
+        human_code_review = render_text(state.get("human_code_review", ""), self.CONTEXT_BUDGET // 8)
+        return design_docs, code_review_feedback, human_code_review
+
+    def developer_messages(self, previous_code, design_docs, code_review_feedback, human_code_review) -> list:
+        """Builds the single-call prompt for the whole project."""
+        return PROMPTS["code_project"].messages(
             design_documents=design_docs,
             code_review_feedback=code_review_feedback,
-            human_code_review=human_code_review
+            human_code_review=human_code_review,
+            previous_code_summary=self.summarize_code(previous_code)
         )
 
+    def code_developer(self, state: State) -> dict:
+        """Orchestrates the generation of code based on functional and technical documents."""
+        inputs = self.developer_inputs(state)
+        previous_code = state.get("generated_project") or []
+        if self.artifacts is not None and not previous_code:
+            reused = self.artifacts.reuse(state, "generated_project")
+            if reused is not None:
+                return {"generated_project": reused}
+
+        # After a rejection, only regenerate the files the reviewers asked to change, and add the ones they asked for
+        targets, additions = self.plan_revision(state, *inputs[1:])
+        if targets or additions:
+            return {"generated_project": self.selective_code_developer(state, targets, additions, *inputs)}
+
+        if self.fan_out:
+            return {"generated_project": self.fan_out_code_developer(*inputs)}
+
+        if self.stream:
+            # Every file is security scanned as soon as it arrives, ahead of the security review
+            return {"generated_project": stream_project(
+                self.llm, self.developer_messages(previous_code, *inputs), on_file=prescan
+            )}
+
+        planner = structured_output(self.llm, GeneratedProject)
+
         # Generate the code
-        generated_project = planner.invoke([SystemMessage(content=prompt)])
+        generated_project = planner.invoke(self.developer_messages(previous_code, *inputs))
 
         return {"generated_project": generated_project.generated_project}   
+
+    async def acode_developer(self, state: State) -> dict:
+        """Async variant of `code_developer`."""
+        inputs = self.developer_inputs(state)
+        previous_code = state.get("generated_project") or []
+        if self.artifacts is not None and not previous_code:
+            reused = await self.artifacts.areuse(state, "generated_project")
+            if reused is not None:
+                return {"generated_project": reused}
+
+        targets, additions = await self.aplan_revision(state, *inputs[1:])
+        if targets or additions:
+            return {"generated_project": await self.aselective_code_developer(state, targets, additions, *inputs)}
+
+        if self.fan_out:
+            return {"generated_project": await self.afan_out_code_developer(*inputs)}
+
+        if self.stream:
+            return {"generated_project": await astream_project(
+                self.llm, self.developer_messages(previous_code, *inputs), on_file=prescan
+            )}
+
+        planner = structured_output(self.llm, GeneratedProject)
+        generated_project = await planner.ainvoke(self.developer_messages(previous_code, *inputs))
+        return {"generated_project": generated_project.generated_project}
     
 class CodeReview:
     """
     Node to review generated code before approval.
     """
-    REVIEW_PROMPT = (
-        "You are an AI **Full-Stack Software Engineer & Code Reviewer**. Your role is to **critically analyze** the generated project code **end-to-end** "
-        "and provide **detailed, actionable feedback** to ensure that the software is **functional, maintainable, scalable, and secure**.\n\n"
-        "## 🔍 Your Review Focus:\n"
-        "1. **Completeness** - Ensure all required features, modules, and integrations are implemented.\n"
-        "2. **Code Quality** - Evaluate maintainability, modularity, and adherence to best practices.\n"
-        "3. **Functionality** - Verify that the code achieves its intended purpose and is executable.\n"
-        "4. **Security & Performance** - Identify vulnerabilities and potential performance bottlenecks.\n"
-        "5. **Architectural Consistency** - Ensure adherence to the proposed design documents and technology stack.\n"
-        "6. **API & Database Design** - Validate endpoints, request-response formats, and database schema.\n"
-        "7. **Scalability & Deployment Readiness** - Suggest improvements for handling high loads and CI/CD readiness.\n\n"
-        "**Instructions:**\n"
-        "Provide **specific** observations and examples where the code needs improvement.\n"
-        "Suggest **refinements** and optimizations with precise recommendations.\n"
-        "Highlight **potential risks** and how to mitigate them.\n"
-        "Ensure that all components **align with the functional and technical design documents**."
-    )
-
-    def __init__(self, model):
+    CONTEXT_BUDGET = 24000
+
+    def __init__(self, model, retriever=None):
         self.llm = model
+        # Optional ProjectRetriever: review the code relevant to the design instead of the whole project
+        self.retriever = retriever
+
+    def review_messages(self, state: State) -> list:
+        """Builds the code review prompt."""
+        # Safely retrieve relevant inputs from state
+        design_documents = render_items(state.get("design_documents"), self.CONTEXT_BUDGET // 4, "No design documents provided.")
+        if self.retriever is not None and state.get("generated_project"):
+            generated_project = self.retriever.render_project_context(state, design_documents, self.CONTEXT_BUDGET * 3 // 4)
+        else:
+            generated_project = render_project(state.get("generated_project"), self.CONTEXT_BUDGET * 3 // 4)
+
+        return PROMPTS["code_review"].messages(design_documents=design_documents, generated_project=generated_project)
 
     def ai_code_reviewer(self, state: State) -> dict:
         """AI-assisted review of generated project code."""
-        reviewer = self.llm.with_structured_output(CodeReview)
+        reviewer = structured_output(self.llm, CodReview)
 
-        # Safely retrieve relevant inputs from state
-        generated_project = state.get("generated_project", "No generated project found.")
-        design_documents = state.get("design_documents", "No design documents provided.")
+        review_feedback = reviewer.invoke(self.review_messages(state))
 
-        review_feedback = reviewer.invoke([
-            SystemMessage(content=self.REVIEW_PROMPT),
-            HumanMessage(content=f"**Generated Project Code:** {generated_project}\n**Functional and Technical Design Documents:** {design_documents}\nReview the code based on the above focus areas and provide structured feedback with actionable recommendations.")
-        ])
+        return {"code_review_feedback": review_feedback.code_review_fedback}
 
-        return {"code_review_feedback": review_feedback}
+    async def aai_code_reviewer(self, state: State) -> dict:
+        """Async variant of `ai_code_reviewer`."""
+        reviewer = structured_output(self.llm, CodReview)
+        review_feedback = await reviewer.ainvoke(self.review_messages(state))
+        return {"code_review_feedback": review_feedback.code_review_fedback}
 
 class HumanCodeOwnerReview:
     """
     Human-in-the-loop code review process.
     """
-    @staticmethod
-    def get_human_feedback(state: State) -> dict:
+    def __init__(self, ask=input):
+        # Callable that collects the reviewer's answer, `input` by default; None suspends the run with an interrupt
+        self.ask = ask
+
+    def get_human_feedback(self, state: State) -> dict:
         """Collects human feedback on the Code Project."""
-        print("\n=== Human Review Required ===")
-        print(f"Here is the code project:\n{state.get('generated_project', 'No generated project found.')}")
-        print(f"Here is the code review feedback:\n{state.get('code_review_feedback', 'No feedback provided.')}")
+        if self.ask is not None:
+            print("\n=== Human Review Required ===")
+            print(f"Here is the code project:\n{state.get('generated_project', 'No generated project found.')}")
+            print(f"Here is the code review feedback:\n{state.get('code_review_feedback', 'No feedback provided.')}")
         
-        human_review = input("Please enter any modification required for code project or type 'Accepted' if no changes are needed:\n")
+        human_review = ask_reviewer(
+            self.ask, "human_code_review",
+            "Please enter any modification required for code project or type 'Accepted' if no changes are needed:\n",
+            artifact=render_project(state.get('generated_project'), REVIEW_CONTEXT_BUDGET),
+            feedback=state.get('code_review_feedback'),
+        )
 
         return {"human_code_review": human_review}
+
+    async def aget_human_feedback(self, state: State) -> dict:
+        """Async variant of `get_human_feedback`; the blocking prompt runs in a worker thread."""
+        if self.ask is None:
+            # Interrupts suspend the run without holding a thread
+            return self.get_human_feedback(state)
+        return await asyncio.to_thread(self.get_human_feedback, state)
    
 class DecisionCodeReview:
     """
     Node to generate approve or reject decision based on review feedback.
     """
-    def __init__(self, model):
-        self.llm = model
+    CONTEXT_BUDGET = 12000
 
-    def ai_decision_reviewer(self, state: State) -> dict:
-        """Decides whether to approve or reject the project code based on review feedback."""
-        evaluator = self.llm.with_structured_output(DecisionCodReview)
+    def __init__(self, model, retriever=None, policy=None):
+        self.llm = model
+        # Optional ProjectRetriever: check the code the feedback is about instead of the whole project
+        self.retriever = retriever
+        self.policy = policy or DecisionEngine()
 
+    def decision_messages(self, state: State) -> list:
+        """Builds the prompt for the final decision on the project code."""
         # Safely retrieve relevant inputs from state
-        code_review_feedback = state.get("code_review_feedback", "No review feedback available.")
-        human_code_review = state.get("human_code_review", "No human review available.")
-        generated_project = state.get("generated_project", "No generated project found.")
+        code_review_feedback = render_text(state.get("code_review_feedback", "No review feedback available."), self.CONTEXT_BUDGET // 4)
+        human_code_review = render_text(state.get("human_code_review", "No human review available."), self.CONTEXT_BUDGET // 8)
+        if self.retriever is not None and state.get("generated_project"):
+            generated_project = self.retriever.render_project_context(
+                state, f"{code_review_feedback}\n{human_code_review}", self.CONTEXT_BUDGET * 5 // 8
+            )
+        else:
+            generated_project = render_project(state.get("generated_project"), self.CONTEXT_BUDGET * 5 // 8)
 
         # Evaluation prompt
-        decision_review = evaluator.invoke([
-            SystemMessage(content="You are an AI responsible for making the final decision on user stories. Your task is to determine whether the suggested improvements from the product owner review and human-in-the-loop review have been incorporated properly."),
-            HumanMessage(content=(
-                f"Here is the latest code review feedback:\n{code_review_feedback}\n\n"
-                f"Here is the latest human review feedback:\n{human_code_review}\n\n"
-                f"Here are the code:\n{generated_project}\n\n"
-                "Evaluate the review feedback, human review feedback with the generated_project and decide if all necessary changes are incorporated or generated_project needs to be updated."
-            ))
-        ])
+        return PROMPTS["code_decision"].messages(
+            generated_project=generated_project,
+            code_review_feedback=code_review_feedback,
+            human_code_review=human_code_review,
+        )
 
+    def decision_result(self, decision_review, state: State) -> dict:
+        """Turns the model decision into the state update."""
         decision = getattr(decision_review, "decision_code_review", "Rejected").strip()
 
         # Track rejection count
@@ -215,11 +437,25 @@ class DecisionCodeReview:
 
         return {"decision_code_review_feedback": decision, "times_reject_code": state["times_reject_code"]}
 
+    def ai_decision_reviewer(self, state: State) -> dict:
+        """Decides whether to approve or reject the project code based on review feedback."""
+        decision_review, decided_by = self.policy.settle("code", state, DecisionCodReview)
+        if decision_review is None:
+            evaluator = structured_output(self.llm, DecisionCodReview)
+            decision_review = evaluator.invoke(self.decision_messages(state))
+
+        return self.policy.remember("code", state, self.decision_result(decision_review, state), decided_by)
+
+    async def aai_decision_reviewer(self, state: State) -> dict:
+        """Async variant of `ai_decision_reviewer`."""
+        decision_review, decided_by = self.policy.settle("code", state, DecisionCodReview)
+        if decision_review is None:
+            evaluator = structured_output(self.llm, DecisionCodReview)
+            decision_review = await evaluator.ainvoke(self.decision_messages(state))
+        return self.policy.remember("code", state, self.decision_result(decision_review, state), decided_by)
+
     
 def route_code_review(state: State) -> dict:
     """Route code for approval or rejection."""
-    if state.get("decision_code_review_feedback", "") == "Accepted" or state.get("times_reject_code", 0) >= 4:
-        return "Accepted"
-    elif state.get("decision_code_review_feedback", "") == "Rejected":
-        return "Rejected + Feedback"
+    return REVIEW_LOOPS["code"].route(state)
         
\ No newline at end of file
@@ -1,125 +1,138 @@
+import asyncio
 from src.state.state import State, UserStories,POReview, DecisionPOReview
-from langchain_core.messages import HumanMessage, SystemMessage
-from langchain.prompts import PromptTemplate
+from src.state.render import as_text, render_items, render_text
+from src.nodes.decision_policy import DecisionEngine, REVIEW_LOOPS
+from src.nodes.human_review import REVIEW_CONTEXT_BUDGET, ask_reviewer
+from src.nodes.prompts import PROMPTS, structured_output
 
 class CreateUserStories:
     """
     Node to generate user stories based on project requirements.
     """
-    def __init__(self, model):
+    # Token budget for the state artifacts rendered into the prompt
+    CONTEXT_BUDGET = 6000
+
+    def __init__(self, model, artifacts=None):
         self.llm = model
+        # Optional ArtifactStore: the first user stories are reused from a similar approved requirement
+        self.artifacts = artifacts
+
+    def planner_messages(self, state: State) -> list:
+        """Builds the prompt used to generate the user stories."""
+        return PROMPTS["user_stories"].messages(
+            requirement=as_text(state['requirement']),
+            user_stories=render_items(state.get('user_stories'), self.CONTEXT_BUDGET // 2),
+            po_review=render_text(state.get('po_review'), self.CONTEXT_BUDGET // 4),
+            human_po_review=render_text(state.get('human_po_review'), self.CONTEXT_BUDGET // 4)
+        )
 
     def user_story_planner(self, state: State) -> dict:
         """Generates user stories based on the provided requirements and feedback."""
+        if self.artifacts is not None and not state.get("user_stories"):
+            reused = self.artifacts.reuse(state, "user_stories")
+            if reused is not None:
+                return {"user_stories": reused}
 
         # Augment LLM with structured schema output
-        planner = self.llm.with_structured_output(UserStories)
-
-        prompt_template = PromptTemplate(
-            input_variables=["requirement", "user_stories", "po_review", "human_po_review"],
-            template="""
-            You are an AI-driven **Agile Product Manager** responsible for writing clear, well-defined user stories.
-            
-            ---
-            **Project Requirement:** {requirement}
-            **Existing User Stories (if any):** {user_stories}
-            **Product Owner Feedback:** {po_review}
-            **Human-in-the-Loop Review Feedback:** {human_po_review}
-            ---
-
-            **📌 User Story Format:**
-            - **Title:** A short, descriptive title.
-            - **User Story:** "As a [role], I want to [action], so that [benefit]."
-            - **Acceptance Criteria:** Clear, testable conditions for completion.
-            - **Priority:** Must-have, should-have, or nice-to-have.
-            - **Dependencies:** Any related stories or technical constraints.
-
-            Ensure user stories are **concise, actionable, and adhere to Agile best practices**.
-            """
-        )
+        planner = structured_output(self.llm, UserStories)
 
         # Generate user stories based on the review decision
-        project_user_stories = planner.invoke([
-            SystemMessage(content=prompt_template.format(
-                requirement=state['requirement'],
-                user_stories=state.get('user_stories', "None"),
-                po_review=state.get('po_review', "None"),
-                human_po_review=state.get('human_po_review', "None")
-            ))
-        ])
+        project_user_stories = planner.invoke(self.planner_messages(state))
 
-        return {"user_stories": project_user_stories.user_stories}     
+        return {"user_stories": project_user_stories.user_stories}
+
+    async def auser_story_planner(self, state: State) -> dict:
+        """Async variant of `user_story_planner`."""
+        if self.artifacts is not None and not state.get("user_stories"):
+            reused = await self.artifacts.areuse(state, "user_stories")
+            if reused is not None:
+                return {"user_stories": reused}
+        planner = structured_output(self.llm, UserStories)
+        project_user_stories = await planner.ainvoke(self.planner_messages(state))
+        return {"user_stories": project_user_stories.user_stories}
 
 class ProductOwnerReview:
     """
     Node to review generated user stories before approval.
     """
+    CONTEXT_BUDGET = 6000
+
     def __init__(self, model):
         self.llm = model
 
+    def review_messages(self, state: State) -> list:
+        """Builds the product owner review prompt."""
+        return PROMPTS["product_owner_review"].messages(
+            user_stories=render_items(state['user_stories'], self.CONTEXT_BUDGET)
+        )
+
     def review_user_stories(self, state: State) -> dict:
         """Performs an AI-assisted product owner review of user stories."""
 
-        reviewer = self.llm.with_structured_output(POReview)
+        reviewer = structured_output(self.llm, POReview)
+
+        review_feedback = reviewer.invoke(self.review_messages(state))
 
-        review_feedback = reviewer.invoke([
-            SystemMessage(content=(
-                "You are a critical product owner reviewing user stories. "
-                "Analyze them for completeness, clarity, feasibility, and adherence to Agile principles. "
-                "Identify missing elements, suggest improvements, and flag any inconsistencies."
-            )),
-            HumanMessage(content=(
-                f"Here are the generated user stories:\n{state['user_stories']}\n\n"
-                "Identify any missing requirements, feasibility issues, vague descriptions, or areas for improvement."
-            )),
-        ])
+        return {"po_review": review_feedback.po_review}
 
+    async def areview_user_stories(self, state: State) -> dict:
+        """Async variant of `review_user_stories`."""
+        reviewer = structured_output(self.llm, POReview)
+        review_feedback = await reviewer.ainvoke(self.review_messages(state))
         return {"po_review": review_feedback.po_review}
 
 class HumanLoopProductOwnerReview:
     """
     Human-in-the-loop product owner review process.
     """
-    @staticmethod
-    def get_human_feedback(state: State) -> dict:
+    def __init__(self, ask=input):
+        # Callable that collects the reviewer's answer, `input` by default; None suspends the run with an interrupt
+        self.ask = ask
+
+    def get_human_feedback(self, state: State) -> dict:
         """Collects human feedback on the Product Owner review."""
 
-        print("\n=== Human Review Required ===")
-        print("A Product Owner has suggested changes to the user stories.")
-        print(f"Original User Stories:\n{state['user_stories']}\n")
-        print(f"Product Owner's Review Feedback:\n{state['po_review']}\n")
+        if self.ask is not None:
+            print("\n=== Human Review Required ===")
+            print("A Product Owner has suggested changes to the user stories.")
+            print(f"Original User Stories:\n{state['user_stories']}\n")
+            print(f"Product Owner's Review Feedback:\n{state['po_review']}\n")
 
         # Simulate human feedback collection (replace with actual UI input in production)
-        human_review = input("Enter modifications or type 'Accepted' if no changes are needed:\n").strip()
+        human_review = ask_reviewer(
+            self.ask, "human_po_review", "Enter modifications or type 'Accepted' if no changes are needed:\n",
+            artifact=render_items(state['user_stories'], REVIEW_CONTEXT_BUDGET), feedback=state['po_review'],
+        ).strip()
 
         return {"human_po_review": human_review}
-   
+
+    async def aget_human_feedback(self, state: State) -> dict:
+        """Async variant of `get_human_feedback`; the blocking prompt runs in a worker thread."""
+        if self.ask is None:
+            # Interrupts suspend the run without holding a thread
+            return self.get_human_feedback(state)
+        return await asyncio.to_thread(self.get_human_feedback, state)
+
 class DecisionProductOwnerReview:
     """
     Node to decide whether to approve or reject the user stories.
     """
-    def __init__(self, model):
-        self.llm = model
-
-    def decision_review(self, state: State) -> dict:
-        """Evaluates feedback and determines whether to approve or request changes to user stories."""
+    CONTEXT_BUDGET = 6000
 
-        evaluator = self.llm.with_structured_output(DecisionPOReview)
-
-        decision_review_feedback = evaluator.invoke([
-            SystemMessage(content=(
-                "You are an AI responsible for the final decision on user stories. "
-                "Your task is to ensure that the feedback from the product owner and human review has been properly implemented."
-            )),
-            HumanMessage(content=(
-                f"Latest Product Owner Review Feedback:\n{state['po_review']}\n\n"
-                f"Latest Human Review Feedback:\n{state['human_po_review']}\n\n"
-                f"Updated User Stories:\n{state['user_stories']}\n\n"
-                "Evaluate whether all necessary improvements have been incorporated."
-                "If issues remain, request revisions. Otherwise, approve the user stories."
-            )),
-        ])
+    def __init__(self, model, policy=None):
+        self.llm = model
+        self.policy = policy or DecisionEngine()
+
+    def decision_messages(self, state: State) -> list:
+        """Builds the prompt for the final decision on the user stories."""
+        return PROMPTS["product_owner_decision"].messages(
+            user_stories=render_items(state['user_stories'], self.CONTEXT_BUDGET // 2),
+            po_review=render_text(state['po_review'], self.CONTEXT_BUDGET // 4),
+            human_po_review=render_text(state['human_po_review'], self.CONTEXT_BUDGET // 4),
+        )
 
+    def decision_result(self, decision_review_feedback, state: State) -> dict:
+        """Turns the model decision into the state update."""
         # Track rejection count to avoid infinite loops
         state.setdefault("times_reject_po", 0)
         if decision_review_feedback.decision_po_review == "Rejected":
@@ -129,10 +142,27 @@ class DecisionProductOwnerReview:
         print(f"Updated Rejection Count: {state['times_reject_po']}")
 
         return {"decision_po_review": str(decision_review_feedback.decision_po_review), "times_reject_po": state["times_reject_po"]}
-    
+
+    def decision_review(self, state: State) -> dict:
+        """Evaluates feedback and determines whether to approve or request changes to user stories."""
+
+        # Explicit verdicts, empty feedback, unchanged inputs and spent budgets need no model call
+        decision_review_feedback, decided_by = self.policy.settle("product_owner", state, DecisionPOReview)
+        if decision_review_feedback is None:
+            evaluator = structured_output(self.llm, DecisionPOReview)
+            decision_review_feedback = evaluator.invoke(self.decision_messages(state))
+
+        return self.policy.remember("product_owner", state, self.decision_result(decision_review_feedback, state), decided_by)
+
+    async def adecision_review(self, state: State) -> dict:
+        """Async variant of `decision_review`."""
+        decision_review_feedback, decided_by = self.policy.settle("product_owner", state, DecisionPOReview)
+        if decision_review_feedback is None:
+            evaluator = structured_output(self.llm, DecisionPOReview)
+            decision_review_feedback = await evaluator.ainvoke(self.decision_messages(state))
+        return self.policy.remember("product_owner", state, self.decision_result(decision_review_feedback, state), decided_by)
+
 def route_product_owner_review(state: State) -> str:
     """Routes user stories based on approval or rejection feedback."""
-    
-    if state["decision_po_review"] == "Accepted" or state["times_reject_po"] >= 1:
-        return "Accepted"
-    return "Rejected + Feedback"
+
+    return REVIEW_LOOPS["product_owner"].route(state)
@@ -0,0 +1,30 @@
+"""
+Answers of the human review nodes.
+
+A node with an `ask` callable (`input` by default) blocks until the reviewer answers. A node
+built with `ask=None` suspends the run with a LangGraph interrupt instead: the checkpointer
+keeps the run parked at the review point, the interrupt payload carries what the reviewer
+needs to answer from another process (see src/graph/review_queue.py), and the run resumes
+with `Command(resume=answer)`, which makes the node return that answer.
+"""
+from langgraph.types import interrupt
+from src.state.render import as_text
+
+# Characters of each artifact put in the interrupt payload (it is stored with the checkpoint)
+REVIEW_CONTEXT_BUDGET = 20000
+
+
+def ask_reviewer(ask, review: str, prompt: str, artifact: str = "", feedback=None) -> str:
+    """
+    The reviewer's answer to `prompt`, for the state key `review`. `artifact` and `feedback`
+    (the rendered artifact and the AI review) are only used by interrupts.
+    """
+    if ask is not None:
+        return ask(prompt)
+    answer = interrupt({
+        "review": review,
+        "prompt": prompt.strip(),
+        "artifact": artifact,
+        "feedback": as_text(feedback)[:REVIEW_CONTEXT_BUDGET],
+    })
+    return str(answer)
@@ -0,0 +1,150 @@
+from src.state.state import State, GeneratedCode
+from src.state.render import file_key
+from src.nodes.generate_code import route_code_review
+from src.nodes.prompts import PROMPTS, structured_output
+from langchain_core.runnables.config import ContextThreadPoolExecutor
+from difflib import SequenceMatcher
+import asyncio
+
+
+def merge_text(base: str, ours: str, theirs: str):
+    """
+    Three-way line merge of two edits of `base`. Returns the merged text, or None when
+    both edits change the same lines differently.
+    """
+    if ours == theirs or theirs == base:
+        return ours
+    if ours == base:
+        return theirs
+
+    base_lines = base.splitlines(keepends=True)
+    hunks = []
+    for edited in (ours, theirs):
+        lines = edited.splitlines(keepends=True)
+        for tag, i1, i2, j1, j2 in SequenceMatcher(None, base_lines, lines, autojunk=False).get_opcodes():
+            if tag != "equal":
+                hunks.append((i1, i2, lines[j1:j2]))
+
+    hunks.sort(key=lambda hunk: (hunk[0], hunk[1]))
+    merged, position, previous = [], 0, None
+    for hunk in hunks:
+        if hunk == previous:
+            # Both edits made the same change
+            continue
+        if previous is not None and (hunk[0] < previous[1] or hunk[0] == previous[0]):
+            return None
+        merged.extend(base_lines[position:hunk[0]])
+        merged.extend(hunk[2])
+        position, previous = hunk[1], hunk
+    merged.extend(base_lines[position:])
+    return "".join(merged)
+
+
+def merge_projects(base: list, ours: list, theirs: list, ours_deleted=(), theirs_deleted=()) -> tuple:
+    """
+    Merges two edits of the project file by file against `base`. A branch lists the files
+    it changed or added; a file it does not list is unchanged, and a file is only deleted
+    when its key is in the branch's `*_deleted` keys.
+    Returns the merged files and the conflicts as (key, base, ours, theirs) items, where
+    a missing file is None.
+    """
+    def by_key(files):
+        return {file_key(item): item for item in files or []}
+
+    base_files, our_files, their_files = by_key(base), by_key(ours), by_key(theirs)
+    ours_deleted, theirs_deleted = set(ours_deleted), set(theirs_deleted)
+    code = lambda item: None if item is None else item.generated_code
+
+    def version(files, deleted, key):
+        return None if key in deleted else files.get(key, base_files.get(key))
+
+    merged, conflicts = [], []
+    for key in dict.fromkeys([*base_files, *our_files, *their_files]):
+        b = base_files.get(key)
+        o, t = version(our_files, ours_deleted, key), version(their_files, theirs_deleted, key)
+        if code(o) == code(t) or code(t) == code(b):
+            result = o
+        elif code(o) == code(b):
+            result = t
+        elif None not in (b, o, t) and (text := merge_text(b.generated_code, o.generated_code, t.generated_code)) is not None:
+            result = GeneratedCode(parent_folder=o.parent_folder, file_path=o.file_path, generated_code=text)
+        else:
+            conflicts.append((key, b, o, t))
+            continue
+        if result is not None:
+            merged.append(result)
+    return merged, conflicts
+
+
+class PostReviewMerger:
+    """
+    Join node of the post-acceptance branches: reconciles the functional and the security
+    fixes, both made on the accepted project, into a single generated project.
+    """
+    def __init__(self, model, max_workers=8):
+        self.llm = model
+        self.max_workers = max_workers
+
+    @staticmethod
+    def version(item) -> str:
+        return "(file absent)" if item is None else item.generated_code
+
+    def resolve_messages(self, key, base, ours, theirs) -> list:
+        """Builds the prompt that resolves a conflicting file."""
+        return PROMPTS["merge_resolve"].messages(
+            key=key, base=self.version(base), ours=self.version(ours), theirs=self.version(theirs)
+        )
+
+    @staticmethod
+    def placed_file(base, ours, theirs, generated) -> GeneratedCode:
+        # Keep the file where the branches put it
+        item = theirs or ours or base
+        return GeneratedCode(parent_folder=item.parent_folder, file_path=item.file_path, generated_code=generated.generated_code)
+
+    def merge_inputs(self, state: State) -> tuple:
+        """Three-way merge of the files the branches changed; branches that did not run changed nothing."""
+        return merge_projects(
+            state.get("generated_project"), state.get("functional_fix_project"), state.get("security_fix_project")
+        )
+
+    def merge_result(self, merged: list, conflicts: list, resolved: list) -> dict:
+        print("\n=== Merge Post Review ===")
+        print(f"Merged {len(merged) + len(resolved)} files, {len(conflicts)} resolved by the model")
+        return {
+            "generated_project": merged + resolved,
+            "functional_fix_project": None,
+            "security_fix_project": None,
+        }
+
+    def merge_post_review(self, state: State) -> dict:
+        """Merges the functional and security fixes, asking the model only for conflicting files."""
+        merged, conflicts = self.merge_inputs(state)
+        resolver = structured_output(self.llm, GeneratedCode)
+
+        def resolve(conflict):
+            return self.placed_file(*conflict[1:], resolver.invoke(self.resolve_messages(*conflict)))
+
+        with ContextThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            resolved = list(pool.map(resolve, conflicts))
+        return self.merge_result(merged, conflicts, resolved)
+
+    async def amerge_post_review(self, state: State) -> dict:
+        """Async variant of `merge_post_review`."""
+        merged, conflicts = self.merge_inputs(state)
+        resolver = structured_output(self.llm, GeneratedCode)
+        semaphore = asyncio.Semaphore(self.max_workers)
+
+        async def resolve(conflict):
+            async with semaphore:
+                generated = await resolver.ainvoke(self.resolve_messages(*conflict))
+            return self.placed_file(*conflict[1:], generated)
+
+        resolved = await asyncio.gather(*(resolve(conflict) for conflict in conflicts))
+        return self.merge_result(merged, conflicts, list(resolved))
+
+
+def route_post_review(state: State) -> list:
+    """Fans out to the independent post-acceptance branches once the code is accepted."""
+    if route_code_review(state) == "Accepted":
+        return ["Security review", "Functional fixes", "Test cases"]
+    return ["Rejected + Feedback"]
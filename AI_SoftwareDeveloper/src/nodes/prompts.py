@@ -0,0 +1,411 @@
+"""
+Registry of the prompts sent by the nodes.
+
+Providers cache prompt prefixes: a call whose first tokens are byte-identical to a recent
+call's is billed and served faster for that part (OpenAI does it automatically from 1024
+tokens on). Every prompt is therefore sent as
+
+    system message   the static instructions of the prompt, identical on every call
+    human message    the variable inputs, one '### Title:' section each, then a static request
+
+with the sections ordered from the inputs shared by most calls to the most specific ones: the
+per-file calls of a fan-out share everything up to the file they are about. Values are the
+text rendered by src/state/render.py; anything else is serialized deterministically (sorted
+JSON), so equal inputs always produce equal prompts.
+
+Prompts are compiled once at import, and `structured_output` builds the structured output
+runnable of a model and schema once instead of on every node call. `PROMPTS.report()` shows
+per prompt the share sent as a static prefix and the share that repeated the previous call's
+prefix, an offline estimate of what a prefix cache can serve; the tokens providers actually
+served from their cache are in the instrumentation report (src/graph/instrumentation.py).
+"""
+import json
+import os
+import threading
+from langchain_core.messages import HumanMessage, SystemMessage
+from pydantic import BaseModel
+from src.state.render import count_tokens
+
+
+def serialize(value) -> str:
+    """Deterministic text of a prompt value."""
+    if isinstance(value, str):
+        return value
+    if hasattr(value, "model_dump"):
+        value = value.model_dump()
+    return json.dumps(value, sort_keys=True, default=str, ensure_ascii=False)
+
+
+class Prompt:
+    """
+    Static `instructions`, the variable `sections` as (key, title) pairs and a static closing
+    `request`. A section whose value is None is left out.
+    """
+    def __init__(self, registry, name: str, instructions: str, sections, request: str = ""):
+        self.registry = registry
+        self.name = name
+        self.instructions = instructions.strip()
+        self.keys = tuple(key for key, _ in sections)
+        self.headers = tuple(f"### {title}:\n" for _, title in sections)
+        self.request = request.strip()
+
+    def render(self, **values) -> str:
+        missing = [key for key in self.keys if key not in values]
+        unknown = [key for key in values if key not in self.keys]
+        if missing or unknown:
+            raise KeyError(f"Prompt {self.name}: missing values {missing}, unknown values {unknown}")
+        blocks = [
+            header + serialize(values[key])
+            for key, header in zip(self.keys, self.headers) if values[key] is not None
+        ]
+        if self.request:
+            blocks.append(self.request)
+        return "\n\n".join(blocks)
+
+    def messages(self, **values) -> list:
+        """[system instructions, human inputs] for the given section values."""
+        inputs = self.render(**values)
+        self.registry.record(self, inputs)
+        return [SystemMessage(content=self.instructions), HumanMessage(content=inputs)]
+
+
+class PromptRegistry:
+    def __init__(self):
+        self.prompts = {}
+        self.lock = threading.Lock()
+        # Prompt name -> sent characters, static prefix characters, characters repeating the previous prefix
+        self.stats = {}
+        self.last = {}
+
+    def register(self, name: str, instructions: str, sections=(), request: str = "") -> Prompt:
+        if name in self.prompts:
+            raise ValueError(f"Prompt {name} is already registered")
+        self.prompts[name] = Prompt(self, name, instructions, sections, request)
+        return self.prompts[name]
+
+    def __getitem__(self, name: str) -> Prompt:
+        return self.prompts[name]
+
+    def record(self, prompt: Prompt, inputs: str) -> None:
+        with self.lock:
+            stats = self.stats.setdefault(prompt.name, {"calls": 0, "chars": 0, "static_chars": 0, "repeated_chars": 0})
+            previous = self.last.get(prompt.name)
+            stats["calls"] += 1
+            stats["chars"] += len(prompt.instructions) + len(inputs)
+            stats["static_chars"] += len(prompt.instructions)
+            if previous is not None:
+                stats["repeated_chars"] += len(prompt.instructions) + len(os.path.commonprefix([previous, inputs]))
+            self.last[prompt.name] = inputs
+
+    def report(self) -> str:
+        lines = [f"  {'prompt':<26}{'calls':>6}{'KB sent':>9}{'static':>8}{'repeated prefix':>17}"]
+        with self.lock:
+            for name, stats in sorted(self.stats.items()):
+                chars = stats["chars"] or 1
+                lines.append(
+                    f"  {name:<26}{stats['calls']:>6}{stats['chars'] / 1024:>9.1f}"
+                    f"{stats['static_chars'] / chars:>8.0%}{stats['repeated_chars'] / chars:>17.0%}"
+                )
+        return "Prompts (repeated prefix: shared with the previous call of the same prompt):\n" + "\n".join(lines)
+
+    def static_tokens(self) -> dict:
+        """Tokens of the static instructions of every prompt; providers only cache prefixes past a minimum size."""
+        return {name: count_tokens(prompt.instructions) for name, prompt in self.prompts.items()}
+
+
+_runnables_lock = threading.Lock()
+
+
+def structured_output(llm, schema):
+    """
+    `llm.with_structured_output(schema)`, built once per model and schema. The runnables are
+    kept on the model itself, so they are freed with it. Pydantic models (provider clients
+    used without a wrapper) cannot take extra attributes and build theirs on every call.
+    """
+    if isinstance(llm, BaseModel) or not hasattr(llm, "__dict__"):
+        return llm.with_structured_output(schema)
+    with _runnables_lock:
+        # vars(): the wrappers forward unknown attributes to the model they wrap
+        runnables = vars(llm).setdefault("_structured_outputs", {})
+        runnable = runnables.get(schema)
+        if runnable is None:
+            runnable = runnables[schema] = llm.with_structured_output(schema)
+        return runnable
+
+
+PROMPTS = PromptRegistry()
+
+# User stories
+
+PROMPTS.register(
+    "user_stories",
+    """
+You are an AI-driven **Agile Product Manager** responsible for writing clear, well-defined user stories
+for the project requirement below, taking the existing user stories and the review feedback into account.
+
+**📌 User Story Format:**
+- **Title:** A short, descriptive title.
+- **User Story:** "As a [role], I want to [action], so that [benefit]."
+- **Acceptance Criteria:** Clear, testable conditions for completion.
+- **Priority:** Must-have, should-have, or nice-to-have.
+- **Dependencies:** Any related stories or technical constraints.
+
+Ensure user stories are **concise, actionable, and adhere to Agile best practices**.
+""",
+    [("requirement", "Project Requirement"), ("user_stories", "Existing User Stories (if any)"),
+     ("po_review", "Product Owner Feedback"), ("human_po_review", "Human-in-the-Loop Review Feedback")],
+)
+
+PROMPTS.register(
+    "product_owner_review",
+    "You are a critical product owner reviewing user stories. "
+    "Analyze them for completeness, clarity, feasibility, and adherence to Agile principles. "
+    "Identify missing elements, suggest improvements, and flag any inconsistencies.",
+    [("user_stories", "Generated user stories")],
+    "Identify any missing requirements, feasibility issues, vague descriptions, or areas for improvement.",
+)
+
+PROMPTS.register(
+    "product_owner_decision",
+    "You are an AI responsible for the final decision on user stories. "
+    "Your task is to ensure that the feedback from the product owner and human review has been properly implemented.",
+    [("user_stories", "Updated User Stories"), ("po_review", "Latest Product Owner Review Feedback"),
+     ("human_po_review", "Latest Human Review Feedback")],
+    "Evaluate whether all necessary improvements have been incorporated. "
+    "If issues remain, request revisions. Otherwise, approve the user stories.",
+)
+
+# Design documents
+
+PROMPTS.register(
+    "design_documents",
+    "You are an AI expert specializing in software architecture and design documentation. "
+    "Your role is to generate **Functional Design Documents (FDD)** and **Technical Design Documents (TDD)** "
+    "based on the provided user stories. Ensure clarity, completeness, and adherence to industry best practices.\n\n"
+    "**Guidelines:**\n"
+    "- The Functional Design Document (FDD) should focus on user workflows, system interactions, and feature descriptions.\n"
+    "- The Technical Design Document (TDD) should cover system architecture, data structures, APIs, and security considerations.\n"
+    "- Follow standard documentation formats and use clear, structured Markdown output.",
+    [("user_stories", "User Stories")],
+    "Now, generate the design documents using the user stories above.",
+)
+
+PROMPTS.register(
+    "design_review",
+    "You are an expert software architect reviewing Functional and Technical Design Documents. "
+    "Your goal is to evaluate the documents for completeness, accuracy, and feasibility based on the given user stories. \n\n"
+    "**Review Criteria:**\n"
+    "1. **Completeness**: Are all required features and components documented?\n"
+    "2. **Clarity**: Is the document structured logically and easy to understand?\n"
+    "3. **Technical Feasibility**: Do the proposed solutions align with best practices and technology constraints?\n"
+    "4. **Scalability & Security**: Are performance, security, and maintainability properly addressed?\n"
+    "5. **Consistency**: Do the documents align with the user stories and acceptance criteria?\n\n"
+    "Provide a structured review identifying gaps, inconsistencies, or improvements needed.",
+    [("design_documents", "Generated design documents")],
+)
+
+PROMPTS.register(
+    "design_decision",
+    "You are an AI responsible for making the final decision on functional and technical design documents. "
+    "Your task is to determine whether the suggested improvements from the design document review "
+    "and human-in-the-loop review have been properly incorporated.",
+    [("user_stories", "User Stories"), ("design_documents", "Design Documents"),
+     ("dd_review", "Latest Design Document Review Feedback"), ("human_dd_review", "Latest Human Review Feedback")],
+    "Based on the design document review feedback, human review feedback, and user stories, "
+    "determine whether all necessary changes have been incorporated or if the design documents need further updates.",
+)
+
+# Code
+
+PROMPTS.register(
+    "code_project",
+    "You are an expert AI Software Engineer specializing in full-stack development. Your task is to generate fully functional, end-to-end project code based on the provided **Functional Design Document (FDD)** and **Technical Design Document (TDD)**. The generated code must:\n"
+    "1. **Follow Best Practices** - Ensure modularity, scalability, maintainability, and security.\n"
+    "2. **Be Complete & Functional** - Each part of the code should integrate seamlessly, forming a fully operational project.\n"
+    "3. **Match the Provided Architecture** - The system should align with the documented backend, frontend, database, and API structure.\n"
+    "4. **Include Dependencies & Configuration** - Generate appropriate package dependencies (`package.json`, `requirements.txt`, `Dockerfile`, `config.yaml`, `.env`, etc.).\n"
+    "5. **Ensure Code Readability & Documentation** - Provide inline comments and relevant README instructions.\n"
+    "6. **Implement Security Measures** - Follow secure coding practices, including authentication, authorization, and encryption where necessary.\n"
+    "7. **Follow CI/CD and Deployment Guidelines** - If applicable, generate scripts for testing, building, and deploying the application.\n\n"
+    "### Expected Output:\n"
+    "- **Project Structure** (e.g., backend, frontend, config, dependencies, API, services).\n"
+    "- **Fully Implemented Source Code** for backend and frontend.\n"
+    "- **API Endpoints & Database Models** matching the design.\n"
+    "- **Configuration & Setup Files** for easy deployment.\n"
+    "Ensure that the generated code is **ready for execution** with minimal modifications.",
+    [("design_documents", "Functional & Technical Design Documents"), ("code_review_feedback", "Code Review Feedback"),
+     ("human_code_review", "Human Review Feedback"), ("previous_code_summary", "Previous Project Code (if any)")],
+)
+
+PROMPTS.register(
+    "code_manifest",
+    "You are an expert AI Software Architect. Plan the file structure of a fully functional, end-to-end project "
+    "based on the provided **Functional Design Document (FDD)** and **Technical Design Document (TDD)**. "
+    "Do not write any code yet: list every source, configuration, dependency and documentation file the project "
+    "needs, with its parent folder, its path and a short description of its purpose and of the files it uses.",
+    [("design_documents", "Functional & Technical Design Documents"), ("code_review_feedback", "Code Review Feedback"),
+     ("human_code_review", "Human Review Feedback")],
+)
+
+PROMPTS.register(
+    "code_file",
+    "You are an expert AI Software Engineer specializing in full-stack development. Write the complete content of "
+    "**one file** of a project whose full file manifest is given. Follow best practices, include inline comments, "
+    "and make sure the file integrates with the other files of the manifest (imports, names, APIs).",
+    [("design_documents", "Functional & Technical Design Documents"), ("code_review_feedback", "Code Review Feedback"),
+     ("human_code_review", "Human Review Feedback"), ("manifest", "Project manifest"),
+     ("parent_folder", "Parent folder of the file to write"), ("file_path", "Path of the file to write"),
+     ("purpose", "Purpose of the file to write")],
+    "Return only this file, ready for execution.",
+)
+
+PROMPTS.register(
+    "code_revision_plan",
+    "You are an expert AI Software Engineer planning the next iteration of a rejected pull request. From the review "
+    "feedback, list the existing project files that must change to address it and the new files it asks for "
+    "(missing modules, tests, configuration or dependency files), each with a short description of what to do. "
+    "Leave out the files the feedback does not ask to change, including the ones it only praises. Return two "
+    "empty lists when the feedback asks to rewrite the project as a whole.",
+    [("code_review_feedback", "Code Review Feedback"), ("human_code_review", "Human Review Feedback"),
+     ("project_files", "Project files")],
+)
+
+PROMPTS.register(
+    "code_revise",
+    "You are an expert AI Software Engineer iterating after a rejected pull request. Revise **one file** of the "
+    "project so that it addresses every review comment that concerns it. Keep everything that was not criticized, "
+    "preserve the public names used by the other files, and return the complete new content of the file. "
+    "The other project files are kept unchanged.",
+    [("design_documents", "Functional & Technical Design Documents"), ("code_review_feedback", "Code Review Feedback"),
+     ("human_code_review", "Human Review Feedback"), ("project_files", "Project files"),
+     ("parent_folder", "Parent folder of the file to revise"), ("file_path", "Path of the file to revise"),
+     ("related_code", "Related code from other files"), ("current_code", "Current content")],
+)
+
+PROMPTS.register(
+    "code_review",
+    "You are an AI **Full-Stack Software Engineer & Code Reviewer**. Your role is to **critically analyze** the generated project code **end-to-end** "
+    "and provide **detailed, actionable feedback** to ensure that the software is **functional, maintainable, scalable, and secure**.\n\n"
+    "## 🔍 Your Review Focus:\n"
+    "1. **Completeness** - Ensure all required features, modules, and integrations are implemented.\n"
+    "2. **Code Quality** - Evaluate maintainability, modularity, and adherence to best practices.\n"
+    "3. **Functionality** - Verify that the code achieves its intended purpose and is executable.\n"
+    "4. **Security & Performance** - Identify vulnerabilities and potential performance bottlenecks.\n"
+    "5. **Architectural Consistency** - Ensure adherence to the proposed design documents and technology stack.\n"
+    "6. **API & Database Design** - Validate endpoints, request-response formats, and database schema.\n"
+    "7. **Scalability & Deployment Readiness** - Suggest improvements for handling high loads and CI/CD readiness.\n\n"
+    "**Instructions:**\n"
+    "Provide **specific** observations and examples where the code needs improvement.\n"
+    "Suggest **refinements** and optimizations with precise recommendations.\n"
+    "Highlight **potential risks** and how to mitigate them.\n"
+    "Ensure that all components **align with the functional and technical design documents**.",
+    [("design_documents", "Functional and Technical Design Documents"), ("generated_project", "Generated Project Code")],
+    "Review the code based on the above focus areas and provide structured feedback with actionable recommendations.",
+)
+
+PROMPTS.register(
+    "code_decision",
+    "You are an AI responsible for making the final decision on the project code. Your task is to determine whether "
+    "the suggested improvements from the code review and human-in-the-loop review have been incorporated properly.",
+    [("generated_project", "Project code"), ("code_review_feedback", "Latest code review feedback"),
+     ("human_code_review", "Latest human review feedback")],
+    "Evaluate the review feedback, human review feedback with the generated_project and decide if all necessary "
+    "changes are incorporated or generated_project needs to be updated.",
+)
+
+PROMPTS.register(
+    "merge_resolve",
+    "You are an expert AI Software Engineer resolving a merge conflict. Two engineers edited the same file "
+    "of an accepted project in parallel: one applied functional and maintainability fixes, the other applied "
+    "security fixes. Write the complete final content of the file, keeping **every** change from both versions; "
+    "when they touch the same code, keep the security fix and re-apply the functional improvement on top of it.",
+    [("key", "File"), ("base", "Accepted version"), ("ours", "Version with functional fixes"),
+     ("theirs", "Version with security fixes")],
+)
+
+# Security and test cases
+
+PROMPTS.register(
+    "security_review",
+    "A static analysis of the codebase reported the findings given below. Confirm or dismiss each finding, "
+    "then audit the listed files for other vulnerabilities such as:\n"
+    "- Injection attacks (SQL, NoSQL, Command, LDAP)\n"
+    "- Cross-Site Scripting (XSS), CSRF\n"
+    "- Broken Authentication & Weak Access Controls\n"
+    "- Security Misconfiguration\n"
+    "- Insufficient Logging & Monitoring\n"
+    "- Server-Side Request Forgery (SSRF)\n"
+    "- Hardcoded secrets and insufficient encryption\n"
+    "Follow OWASP guidelines and industry best practices. Provide a structured report with:\n"
+    "- Confirmed vulnerabilities, with file and line\n"
+    "- Risk levels (Critical, High, Medium, Low)\n"
+    "- Suggested fixes with example code",
+    [("generated_project", "Files"), ("findings", "Static analysis findings")],
+)
+
+PROMPTS.register(
+    "functional_fixes",
+    "Apply necessary functionality fixes to enhance readability, maintainability, and efficiency "
+    "while ensuring compliance with coding standards and best practices. "
+    "Refactor and reduce complex or redundant code or scripts, improve documentation, and optimize "
+    "performance where necessary. Address all identified issues while preserving the intended functionality.\n"
+    "Return the full content of the given files that you change, with the same parent_folder and file_path.",
+    [("generated_project", "Codebase")],
+)
+
+PROMPTS.register(
+    "security_fixes",
+    "Apply necessary security fixes to address vulnerabilities found in the security review while also improving "
+    "readability, maintainability, and efficiency. Implement safeguards such as input validation, encryption, and "
+    "secure API calls while ensuring the code adheres to industry best practices. Refactor any unclear or inefficient "
+    "portions of the code to enhance overall quality before proceeding to deployment.\n"
+    "Return the full content of the given files that you change, with the same parent_folder and file_path.",
+    [("generated_project", "Codebase"), ("findings", "Static analysis findings"),
+     ("security_review_feedback", "Security review")],
+)
+
+PROMPTS.register(
+    "test_cases",
+    "Given the following code, generate comprehensive test cases to ensure its correctness, reliability, and edge case "
+    "handling. Follow these guidelines:\n"
+    "- Use unit testing best practices (e.g., pytest, JUnit, unittest, etc., based on the language).\n"
+    "- Cover both typical and edge cases.\n"
+    "- Ensure tests validate functionality, performance, and error handling.\n"
+    "- Maintain readability, maintainability, and efficiency in test structure.\n"
+    "- Take into account the name of the input files of generated_project to create the test cases.",
+    [("generated_project", "generated_project"),
+     ("test_results", "Results of running the previous test cases, fix the failing ones")],
+)
+
+PROMPTS.register(
+    "test_cases_review",
+    "Given the generated test cases, perform a detailed review to ensure they meet the following criteria:\n"
+    "- Adherence to unit testing best practices (e.g., pytest, JUnit, unittest, etc.).\n"
+    "- Comprehensive coverage of typical and edge cases.\n"
+    "- Proper validation of functionality, performance, and error handling.\n"
+    "- Readability, maintainability, and efficiency of test structures.\n\n"
+    "Identify any missing cases, incorrect assertions, or areas for improvement.\n"
+    "Provide a structured review with suggested corrections or enhancements.",
+    [("test_cases_codes", "Test Cases"), ("test_results", "Execution results")],
+)
+
+PROMPTS.register(
+    "test_cases_decision",
+    "Based on the automated and human reviews of the test cases, make a final decision:\n"
+    "- Approve the test cases if they meet all quality criteria.\n"
+    "- Request improvements if issues remain (specify the required changes).",
+    [("generated_project", "Generated project code"), ("test_cases_feedback", "Test cases feedback"),
+     ("human_test_cases_review", "Human test cases review")],
+    "Evaluate the test cases review feedback, human test cases review feedback and "
+    "generated project code to decide if test cases needs to be updated.",
+)
+
+PROMPTS.register(
+    "fix_test_cases",
+    "Revise and improve the given test cases based on the feedback provided in the review. Ensure:\n"
+    "- Coverage of all required scenarios, including edge cases.\n"
+    "- Proper validation of functionality, performance, and error handling.\n"
+    "- Readability, maintainability, and efficiency in test structure.\n\n"
+    "Provide an updated version of the test cases incorporating the necessary fixes.",
+    [("test_cases_codes", "Test Cases"), ("test_cases_feedback", "Review feedback")],
+)
@@ -0,0 +1,30 @@
+from src.state.state import State
+from src.state.render import render_test_results
+from src.tools.test_runner import TestRunner
+import asyncio
+
+
+class TestCasesRunner:
+    """
+    Runs the generated test cases against the generated project (see src/tools/test_runner.py).
+    The results go to `test_results`, where the test cases review, the human reviewer and the
+    test cases decision (TestResultsPolicy) read them.
+    """
+    __test__ = False
+
+    def __init__(self, runner=None):
+        self.runner = runner or TestRunner()
+
+    def run_test_cases(self, state: State) -> dict:
+        """Executes test_cases_codes in a sandbox and stores the structured results."""
+        if not state.get('test_cases_codes'):
+            return {"test_results": None}
+        results = self.runner.run(state.get('generated_project'), state['test_cases_codes'])
+
+        print("\n=== Test Cases Execution ===")
+        print(render_test_results(results, 500).splitlines()[0])
+        return {"test_results": results}
+
+    async def arun_test_cases(self, state: State) -> dict:
+        """Async variant of `run_test_cases`; the test processes are awaited in a worker thread."""
+        return await asyncio.to_thread(self.run_test_cases, state)
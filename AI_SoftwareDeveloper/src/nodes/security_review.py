@@ -1,126 +1,194 @@
 from src.state.state import State, GeneratedProject, TestCasesCodes,DecisionTestCases
-from langchain_core.messages import HumanMessage, SystemMessage
-from langchain.prompts import PromptTemplate
-import json
+from src.nodes.prompts import PROMPTS, structured_output
+from src.LLMS.structured_stream import astream_project, stream_project
+from src.state.render import as_text, file_key, render_project, render_test_cases, render_test_results, render_text
+from src.tools.security_scan import SecurityScanner, flagged_files, render_findings, scan_report
+from src.nodes.decision_policy import DecisionEngine, REVIEW_LOOPS
+from src.nodes.human_review import REVIEW_CONTEXT_BUDGET, ask_reviewer
+from src.state.serializer import StateStore
+import asyncio
 
 class SecurityReviewer:
     """
     Class to perform security review and improve code security.
     """
-    def __init__(self,model):
+    # Token budgets for the state artifacts rendered into the prompts. The fix nodes read the
+    # files they may change (and return only the changed ones), so they get a larger budget.
+    REVIEW_BUDGET = 24000
+    FIX_BUDGET = 100000
+    def __init__(self,model, ask=input, retriever=None, policy=None, scanner=None, stream=False):
         self.llm = model
+        # Callable that collects the test cases reviewer's answer, `input` by default; None suspends the run with an interrupt
+        self.ask = ask
+        # Optional ProjectRetriever used to pick the code relevant to each review or fix
+        self.retriever = retriever
+        # Rule based policies that settle the test cases decision without the model when they can
+        self.policy = policy or DecisionEngine()
+        # Static analysis picking the files and findings the security audit and fixes are about
+        self.scanner = scanner or SecurityScanner()
+        # Fixed projects are streamed and parsed file by file (src/LLMS/structured_stream.py)
+        self.stream = stream
+
+    def project_context(self, state: State, query: str, budget: int) -> str:
+        """Renders the code relevant to `query` when a retriever is set, otherwise the project within `budget`."""
+        if self.retriever is not None and state.get('generated_project'):
+            return self.retriever.render_project_context(state, query, budget)
+        return render_project(state.get('generated_project'), budget)
+
+    def focus_files(self, state: State, query) -> list:
+        """Files the fix prompts should show in full first: the ones most relevant to the feedback."""
+        if self.retriever is None or not state.get('generated_project'):
+            return []
+        return self.retriever.relevant_files(state, as_text(query))
     
 
+    def scan(self, state: State) -> dict:
+        """Static security findings of the project (src/tools/security_scan.py)."""
+        return scan_report(self.scanner.scan(state.get('generated_project')))
+
+    def flagged_project(self, state: State, report: dict) -> list:
+        """Project files with findings or that the static analysis could not check."""
+        flagged = flagged_files(report)
+        return [item for item in state.get('generated_project') or [] if file_key(item) in flagged]
+
+    def security_review_messages(self, state: State, report: dict, flagged: list) -> list:
+        """Builds the security audit prompt for the files flagged by the static analysis."""
+        return PROMPTS["security_review"].messages(
+            generated_project=render_project(flagged, self.REVIEW_BUDGET),
+            findings=render_text(render_findings(report), self.REVIEW_BUDGET // 4),
+        )
+
+    def security_review_result(self, state: State, report: dict, flagged: list):
+        """State update when the static analysis flagged nothing, or None when the model has to audit."""
+        print(f"\n=== Security Pre-scan ===\n{len(report['findings'])} findings, "
+              f"{len(flagged)} of {report['files']} files sent to the security audit")
+        if flagged:
+            return None
+        return {
+            "security_scan": report,
+            "security_review_feedback": f"The static analysis found no security issues in the {report['files']} files.",
+        }
+
     def make_security_review(self, state: State) -> dict:
         """Evaluate the code project to find security vulnerabilities."""
-        
-        prompt_template = PromptTemplate(
-            input_variables=["generated_project"],
-            template="""
-            Perform a comprehensive security audit of the given codebase. Identify vulnerabilities such as:
-            - Injection attacks (SQL, NoSQL, Command, LDAP)
-            - Cross-Site Scripting (XSS), CSRF
-            - Broken Authentication & Weak Access Controls
-            - Security Misconfiguration
-            - Insufficient Logging & Monitoring
-            - Server-Side Request Forgery (SSRF)
-            - Hardcoded secrets and insufficient encryption
-            Follow OWASP guidelines and industry best practices. Provide a structured report with:
-            - Identified vulnerabilities
-            - Risk levels (Critical, High, Medium, Low)
-            - Suggested fixes with example code
-            """
-        )
+        report = self.scan(state)
+        flagged = self.flagged_project(state, report)
+        settled = self.security_review_result(state, report, flagged)
+        if settled is not None:
+            return settled
+        review_feedback = self.llm.invoke(self.security_review_messages(state, report, flagged))
+        return {"security_scan": report, "security_review_feedback": review_feedback}
 
-        review_feedback = self.llm.invoke([
-            SystemMessage(content=prompt_template.format(
-                generated_project=state.get('generated_project')
-            )),
-        ])   
-        return {"security_review_feedback": review_feedback}
+    async def amake_security_review(self, state: State) -> dict:
+        """Async variant of `make_security_review`."""
+        report = await asyncio.to_thread(self.scan, state)
+        flagged = self.flagged_project(state, report)
+        settled = self.security_review_result(state, report, flagged)
+        if settled is not None:
+            return settled
+        review_feedback = await self.llm.ainvoke(self.security_review_messages(state, report, flagged))
+        return {"security_scan": report, "security_review_feedback": review_feedback}
     
+    def improve_code_messages(self, state: State) -> list:
+        """Builds the functional fixes prompt."""
+        return PROMPTS["functional_fixes"].messages(
+            generated_project=render_project(
+                state.get('generated_project'), self.FIX_BUDGET,
+                focus=self.focus_files(state, f"{as_text(state.get('code_review_feedback'))}\n{as_text(state.get('human_code_review'))}")
+            )
+        )
+
     def improve_code_project(self, state: State)-> dict:
-        """evaluate the code project in order to fix and ensure functionality and efficiency"""    
+        """evaluate the code project in order to fix and ensure functionality and efficiency; returns the changed files only"""    
+        if self.stream:
+            return {"functional_fix_project": stream_project(
+                self.llm, self.improve_code_messages(state), allow_empty=True
+            )}
         
-        code_developer = self.llm.with_structured_output(GeneratedProject)
-
-        prompt_template = PromptTemplate(
-            input_variables=["generated_project"],
-            template="""
-            Apply necessary funcionability fixes to enhance readability, maintainability, and efficiency\n
-            while ensuring compliance with coding standards and best practices. \n
-            Refactor and reduce complex or redundant code or scripts, improve documentation, and optimize \n
-            performance where necessary. Address all identified issues while preserving \n
-            the intended functionality.
-            """
-        )
+        code_developer = structured_output(self.llm, GeneratedProject)
 
         # Generate user stories
-        review_generated_project = code_developer.invoke(
-            [
-                SystemMessage(content=prompt_template.format(
-                    generated_project=state.get('generated_project')
-                )),
-            ]
-        )   
-        return {"generated_project": review_generated_project} 
+        review_generated_project = code_developer.invoke(self.improve_code_messages(state))
+        return {"functional_fix_project": review_generated_project.generated_project} 
+
+    async def aimprove_code_project(self, state: State)-> dict:
+        """Async variant of `improve_code_project`."""
+        if self.stream:
+            return {"functional_fix_project": await astream_project(
+                self.llm, self.improve_code_messages(state), allow_empty=True
+            )}
+        code_developer = structured_output(self.llm, GeneratedProject)
+        review_generated_project = await code_developer.ainvoke(self.improve_code_messages(state))
+        return {"functional_fix_project": review_generated_project.generated_project}
     
+    def improve_security_messages(self, state: State, flagged: list) -> list:
+        """Builds the security fixes prompt for the flagged files."""
+        return PROMPTS["security_fixes"].messages(
+            generated_project=render_project(flagged, self.FIX_BUDGET),
+            findings=render_text(render_findings(state['security_scan']), self.REVIEW_BUDGET // 4),
+            security_review_feedback=render_text(state.get('security_review_feedback'), self.REVIEW_BUDGET // 4),
+        )
+
     def improve_security(self, state: State)-> dict:
         """evaluate the code project in order to fix security vulnerabilities"""    
-        
-        code_developer = self.llm.with_structured_output(GeneratedProject)
-
-        prompt_template = PromptTemplate(
-            input_variables=["generated_project"],
-            template="""
-            Apply necessary security fixes to address vulnerabilities \n
-            found in the security review while also improving readability, \n
-            maintainability, and efficiency. Implement safeguards such as \n
-            input validation, encryption, and secure API calls while \n
-            ensuring the code adheres to industry best practices. \n
-            Refactor any unclear or inefficient portions of the code \n
-            to enhance overall quality before proceeding to deployment.
-            """
-        )
+        flagged = self.flagged_project(state, state['security_scan'])
+        if not flagged:
+            # Nothing to fix: merge_post_review keeps the functional fixes only
+            return {"security_fix_project": None}
+        if self.stream:
+            return {"security_fix_project": stream_project(
+                self.llm, self.improve_security_messages(state, flagged), allow_empty=True
+            )}
+
+        code_developer = structured_output(self.llm, GeneratedProject)
 
         # Generate user stories
-        review_generated_project = code_developer.invoke(
-            [
-                SystemMessage(content=prompt_template.format(
-                    generated_project=state.get('generated_project')
-                )),
-            ]
-        )   
-        return {"generated_project": review_generated_project} 
+        review_generated_project = code_developer.invoke(self.improve_security_messages(state, flagged))
+        return {"security_fix_project": review_generated_project.generated_project}
+
+    async def aimprove_security(self, state: State)-> dict:
+        """Async variant of `improve_security`."""
+        flagged = self.flagged_project(state, state['security_scan'])
+        if not flagged:
+            return {"security_fix_project": None}
+        if self.stream:
+            return {"security_fix_project": await astream_project(
+                self.llm, self.improve_security_messages(state, flagged), allow_empty=True
+            )}
+        code_developer = structured_output(self.llm, GeneratedProject)
+        review_generated_project = await code_developer.ainvoke(self.improve_security_messages(state, flagged))
+        return {"security_fix_project": review_generated_project.generated_project}
     
+    def test_cases_messages(self, state: State) -> list:
+        """Builds the test cases generation prompt."""
+        return PROMPTS["test_cases"].messages(
+            generated_project=render_project(state.get('generated_project'), self.REVIEW_BUDGET),
+            # Rewriting rejected test cases: show how the previous ones ran
+            test_results=render_test_results(state['test_results'], self.REVIEW_BUDGET // 8) if state.get('test_results') else None,
+        )
+
     def write_test_cases(self, state: State)-> dict:
         """Generate test cases for the given project to ensure correctness and security compliance.""" 
         
-        code_developer = self.llm.with_structured_output(TestCasesCodes)
-
-        prompt_template = PromptTemplate(
-            input_variables=["generated_project"],
-            template="""
-            *"Given the following code, generate comprehensive test cases \n
-            to ensure its correctness, reliability, and edge case handling. Follow these guidelines:\n
-            Use unit testing best practices (e.g., pytest, JUnit, unittest, etc., based on the language).\n
-            Cover both typical and edge cases.\n
-            Ensure tests validate functionality, performance, and error handling.\n
-            Maintain readability, maintainability, and efficiency in test structure.\n
-            Take into account the name of the input files of generated_project to create the test cases.
-            """
-        )
+        code_developer = structured_output(self.llm, TestCasesCodes)
 
         # Generate user stories
-        create_test_cases_code = code_developer.invoke(
-            [
-                SystemMessage(content=prompt_template.format(
-                    generated_project=state.get('generated_project')
-                )),
-            ]
-        )   
+        create_test_cases_code = code_developer.invoke(self.test_cases_messages(state))
+        return {"test_cases_codes": create_test_cases_code.test_cases_codes}
+
+    async def awrite_test_cases(self, state: State)-> dict:
+        """Async variant of `write_test_cases`."""
+        code_developer = structured_output(self.llm, TestCasesCodes)
+        create_test_cases_code = await code_developer.ainvoke(self.test_cases_messages(state))
         return {"test_cases_codes": create_test_cases_code.test_cases_codes}
     
+    def test_cases_review_messages(self, test_cases_codes, test_results=None) -> list:
+        """Builds the test cases review prompt."""
+        return PROMPTS["test_cases_review"].messages(
+            test_cases_codes=render_test_cases(test_cases_codes, self.REVIEW_BUDGET),
+            test_results=render_test_results(test_results, self.REVIEW_BUDGET // 8),
+        )
+
     def test_cases_review(self, state: State) -> dict:
         """Review test cases to ensure adherence to best practices and completeness."""    
 
@@ -129,75 +197,68 @@ class SecurityReviewer:
         if not test_cases_codes:
             return {"test_cases_feedback": "No test cases provided for review."}
 
-        test_cases_text = "\n\n".join(f"File: {tc.file_name}\n{tc.generated_code}" for tc in test_cases_codes)
+        # Generate test cases review
+        test_cases_feedback = self.llm.invoke(self.test_cases_review_messages(test_cases_codes, state.get('test_results')))
 
-        prompt_template = PromptTemplate(
-            input_variables=["test_cases_codes"],
-            template="""
-            Given the following generated test cases, perform a detailed review to ensure they meet the following criteria:
-            - Adherence to unit testing best practices (e.g., pytest, JUnit, unittest, etc.).
-            - Comprehensive coverage of typical and edge cases.
-            - Proper validation of functionality, performance, and error handling.
-            - Readability, maintainability, and efficiency of test structures.
+        return {"test_cases_feedback": test_cases_feedback}
 
-            Identify any missing cases, incorrect assertions, or areas for improvement.
-            Provide a structured review with suggested corrections or enhancements.
+    async def atest_cases_review(self, state: State) -> dict:
+        """Async variant of `test_cases_review`."""
+        test_cases_codes = state.get('test_cases_codes')
 
-            Test Cases:
-            {test_cases_codes}
-            """
-        )
+        if not test_cases_codes:
+            return {"test_cases_feedback": "No test cases provided for review."}
 
-        # Generate test cases review
-        test_cases_feedback = self.llm.invoke(
-            [
-                HumanMessage(content=prompt_template.format(test_cases_codes=test_cases_text))
-            ]
+        test_cases_feedback = await self.llm.ainvoke(
+            self.test_cases_review_messages(test_cases_codes, state.get('test_results'))
         )
-
         return {"test_cases_feedback": test_cases_feedback}
     
     def human_loop_test_cases_review(self, state: State) -> dict:
         """Collects human feedback on the Code Project."""
         
-        print("\n=== Human Review Required ===")
-        print(" Please review the following test cases and provide feedback based on your expertise. Consider the following aspects:"
-        "- Do the tests cover all necessary scenarios, including edge cases?"
-        "- Are they correctly structured, readable, and maintainable?"
-        "- Do they ensure functionality, performance, and error handling?")
+        if self.ask is not None:
+            print("\n=== Human Review Required ===")
+            print(" Please review the following test cases and provide feedback based on your expertise. Consider the following aspects:"
+            "- Do the tests cover all necessary scenarios, including edge cases?"
+            "- Are they correctly structured, readable, and maintainable?"
+            "- Do they ensure functionality, performance, and error handling?")
         # print(f"Here are the code project:\n{state['generated_project']}\n")
         # print(f"Here is the test cases review feedback feedback:\n{state['test_cases_code']}\n")
         
-        human_review = input("Please enter any modification required for code project or type 'Accepted' if no changes are needed:\n")
+        human_review = ask_reviewer(
+            self.ask, "human_test_cases_review",
+            "Please enter any modification required for code project or type 'Accepted' if no changes are needed:\n",
+            artifact=(
+                f"{render_test_results(state.get('test_results'), REVIEW_CONTEXT_BUDGET // 8)}\n\n"
+                f"{render_test_cases(state.get('test_cases_codes'), REVIEW_CONTEXT_BUDGET)}"
+            ),
+            feedback=state.get('test_cases_feedback'),
+        )
         
         # print("\n=== Human Review Feedback ===")
         # print(f"human_po_review {human_review.strip()}")
         # print(f"state: {state}")
         return {"human_test_cases_review": human_review}
-    
-    def decision_test_cases_review(self, state: State) -> dict:
-        """Determines whether the test cases meet all quality criteria and approves or rejects them accordingly."""
-
-        evaluator = self.llm.with_structured_output(DecisionTestCases)
-        # print("\n=== Input State in test cases review ===")
-        # print(f"State: {state}")
 
+    async def ahuman_loop_test_cases_review(self, state: State) -> dict:
+        """Async variant of `human_loop_test_cases_review`; the blocking prompt runs in a worker thread."""
+        if self.ask is None:
+            # Interrupts suspend the run without holding a thread
+            return self.human_loop_test_cases_review(state)
+        return await asyncio.to_thread(self.human_loop_test_cases_review, state)
+    
+    def decision_test_cases_messages(self, state: State) -> list:
+        """Builds the prompt for the final decision on the test cases."""
+        test_cases_feedback = render_text(state['test_cases_feedback'], self.REVIEW_BUDGET // 4)
+        return PROMPTS["test_cases_decision"].messages(
+            generated_project=self.project_context(state, test_cases_feedback, self.REVIEW_BUDGET // 2),
+            test_cases_feedback=test_cases_feedback,
+            human_test_cases_review=render_text(state['human_test_cases_review'], self.REVIEW_BUDGET // 8),
+        )
 
-        decision_review = evaluator.invoke([
-            SystemMessage(content=(
-                "Based on the automated and human reviews of the test cases, make a final decision:"
-                "- Approve the test cases if they meet all quality criteria."
-                "- Request improvements if issues remain (specify the required changes"
-            )),
-            HumanMessage(content=(
-                f"Here are the test cases feedback:\n{state['test_cases_feedback']}\n\n"
-                f"Here are the human test cases review code:\n{state['human_test_cases_review']}\n\n"
-                f"Here are the genearted project code:\n{state['generated_project']}\n\n"
-                "Evaluate the test cases review feedback, human test cases review feedback and\n"
-                "genearted project code to decide if test cases needs to be updated."
-            )),
-        ])
-        
+    def decision_test_cases_result(self, decision_review, state: State) -> dict:
+        """Turns the model decision into the state update."""
         # print("\n=== Document Review Feedback ===")
         # print(f"decision_test_cases_feedback: {decision_review.decision_test_cases_feedback}")
         if "times_reject_tc" not in state:
@@ -213,48 +274,58 @@ class SecurityReviewer:
 
         return {"decision_test_cases_feedback": str(decision_review.decision_test_cases_feedback), "times_reject_tc": state["times_reject_tc"]}
 
-    def fix_test_cases(self, state: State)-> dict:
-        """create the code project in order to fix security vulnerabilities"""    
-        
-        test_cases_reviewer = self.llm.with_structured_output(TestCasesCodes)
+    def decision_test_cases_review(self, state: State) -> dict:
+        """Determines whether the test cases meet all quality criteria and approves or rejects them accordingly."""
 
-        prompt_template = PromptTemplate(
-            input_variables=["test_cases_code"],
-            template="""
-            Revise and improve the following test cases based on the feedback provided in the review. Ensure:  
-            - Coverage of all required scenarios, including edge cases.  
-            - Proper validation of functionality, performance, and error handling.  
-            - Readability, maintainability, and efficiency in test structure.  
+        # print("\n=== Input State in test cases review ===")
+        # print(f"State: {state}")
 
-            Provide an updated version of the test cases incorporating the necessary fixes."""
-            )
+        decision_review, decided_by = self.policy.settle("test_cases", state, DecisionTestCases)
+        if decision_review is None:
+            evaluator = structured_output(self.llm, DecisionTestCases)
+            decision_review = evaluator.invoke(self.decision_test_cases_messages(state))
 
-        # Generate user stories
-        test_cases_feedback = test_cases_reviewer.invoke(
-            [
-                SystemMessage(content=prompt_template.format(
-                    generated_project=state.get('test_cases_code')
-                )),
-            ]
+        return self.policy.remember("test_cases", state, self.decision_test_cases_result(decision_review, state), decided_by)
+
+    async def adecision_test_cases_review(self, state: State) -> dict:
+        """Async variant of `decision_test_cases_review`."""
+        decision_review, decided_by = self.policy.settle("test_cases", state, DecisionTestCases)
+        if decision_review is None:
+            evaluator = structured_output(self.llm, DecisionTestCases)
+            decision_review = await evaluator.ainvoke(self.decision_test_cases_messages(state))
+        return self.policy.remember("test_cases", state, self.decision_test_cases_result(decision_review, state), decided_by)
+
+    def fix_test_cases_messages(self, state: State) -> list:
+        """Builds the test cases fixes prompt."""
+        return PROMPTS["fix_test_cases"].messages(
+            test_cases_codes=render_test_cases(state.get('test_cases_codes'), self.FIX_BUDGET),
+            test_cases_feedback=render_text(state.get('test_cases_feedback'), self.REVIEW_BUDGET // 4)
         )
-        # Save final state to JSON
+
+    def save_final_state(self, state: State, test_cases_feedback) -> dict:
+        """Stores the fixed test cases and saves the final state as a StateStore snapshot."""
+        # Save final state; StateStore().load("final_output_state") rebuilds it exactly
         state['test_cases_code'] = test_cases_feedback
-        with open("final_output_state.json", "w") as f:
-            json.dump(state, f, indent=2,default=str)
-        
-        # generated_project = state['generated_project']
-        # project_dicts = [item.to_dict() for item in generated_project]
-        # with open("generated_project.json", "w") as f:
-        #     json.dump(project_dicts, f, indent=2, default=str)
+        path = StateStore().save(state, "final_output_state")
 
-        print("✅ Final state saved to final_output_state.json")   
+        print(f"✅ Final state saved to {path}")
         return {"test_cases_code": test_cases_feedback}
 
+    def fix_test_cases(self, state: State)-> dict:
+        """create the code project in order to fix security vulnerabilities"""    
+        
+        test_cases_reviewer = structured_output(self.llm, TestCasesCodes)
+
+        # Generate user stories
+        test_cases_feedback = test_cases_reviewer.invoke(self.fix_test_cases_messages(state))
+        return self.save_final_state(state, test_cases_feedback)
+
+    async def afix_test_cases(self, state: State)-> dict:
+        """Async variant of `fix_test_cases`."""
+        test_cases_reviewer = structured_output(self.llm, TestCasesCodes)
+        test_cases_feedback = await test_cases_reviewer.ainvoke(self.fix_test_cases_messages(state))
+        return await asyncio.to_thread(self.save_final_state, state, test_cases_feedback)
+
 def route_test_cases_review(state: State) -> dict:
     """Checks if test cases are approved and passes them to the next stage."""
-       
-    if state["decision_test_cases_feedback"] == "Accepted" or state["times_reject_tc"]>=1:
-        return "Accepted"
-    
-    elif state["decision_test_cases_feedback"] == "Rejected":
-        return "Rejected + Feedback"
\ No newline at end of file
+    return REVIEW_LOOPS["test_cases"].route(state)
\ No newline at end of file
@@ -0,0 +1,164 @@
+"""
+Compact, stable rendering of state artifacts for prompts.
+
+Nodes use these helpers instead of interpolating the Python repr of the state, so
+prompts contain plain text (no escaped newlines or pydantic noise) and stay within a
+per-node token budget as projects grow: the file manifest and content hashes are
+always included, full file text only while it fits, and summaries beyond it.
+"""
+import hashlib
+import re
+from functools import lru_cache
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+
+@lru_cache(maxsize=1)
+def _encoding():
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        # The encoding file is downloaded on first use; fall back to the estimate when offline
+        return None
+
+
+def count_tokens(text: str) -> int:
+    """Counts tokens with tiktoken when installed, otherwise estimates ~4 characters per token."""
+    encoding = _encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return (len(text) + 3) // 4
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:12]
+
+
+def as_text(value) -> str:
+    """Plain text of a state value: message content, feedback strings or None."""
+    if value is None:
+        return "None"
+    return str(getattr(value, "content", value)).strip()
+
+
+def render_text(value, budget: int) -> str:
+    """Renders free text (feedback, reviews), cut at `budget` tokens."""
+    text = as_text(value)
+    if count_tokens(text) <= budget:
+        return text
+    # Cut proportionally, then trim until it fits
+    cut = text[:max(0, len(text) * budget // max(count_tokens(text), 1))]
+    while cut and count_tokens(cut) > budget:
+        cut = cut[:int(len(cut) * 0.9)]
+    return f"{cut}\n[... truncated, {count_tokens(text) - count_tokens(cut)} more tokens]"
+
+
+def render_items(items, budget: int, empty: str = "None") -> str:
+    """Renders user stories / design documents (dicts with name and description)."""
+    if not items:
+        return empty
+    blocks = []
+    for n, item in enumerate(items, 1):
+        if isinstance(item, dict):
+            name = item.get("name", f"Item {n}")
+            description = item.get("description", "")
+        else:
+            name, description = f"Item {n}", as_text(item)
+        blocks.append(f"### {n}. {name}\n{as_text(description)}")
+    return render_text("\n\n".join(blocks), budget)
+
+
+def file_key(item) -> str:
+    return f"{item.parent_folder}/{item.file_path}"
+
+
+def summarize_source(code: str, max_lines: int = 8) -> str:
+    """Top-level definitions of a file, or its first lines when it has none."""
+    definitions = re.findall(r"^(?:async\s+def|def|class|function|export\s+\w+)\s+[\w$]+.*$", code, re.MULTILINE)
+    lines = definitions or [line for line in code.splitlines() if line.strip()]
+    summary = [line.rstrip().rstrip(":{") for line in lines[:max_lines]]
+    if len(lines) > max_lines:
+        summary.append(f"... {len(lines) - max_lines} more")
+    return "\n".join(f"    {line}" for line in summary)
+
+
+def render_project(files, budget: int, focus=None, manifest_only=False) -> str:
+    """
+    Renders a generated project as a manifest followed by file bodies, within `budget` tokens.
+    Files listed in `focus` (keys 'parent_folder/file_path') are included first; files that no
+    longer fit are replaced by a summary of their definitions, and once summaries do not fit
+    either they are only listed in the manifest (itself capped at a quarter of the budget).
+    With `manifest_only` the manifest alone is rendered, using the whole budget.
+    """
+    if not files:
+        return "No generated project found."
+
+    manifest, remaining = ["## Files"], budget if manifest_only else budget // 4
+    for n, item in enumerate(files):
+        line = (
+            f"- {file_key(item)} (sha {content_hash(item.generated_code)}, "
+            f"{item.generated_code.count(chr(10)) + 1} lines)"
+        )
+        cost = count_tokens(line)
+        if cost > remaining:
+            manifest.append(f"- ... and {len(files) - n} more files")
+            break
+        manifest.append(line)
+        remaining -= cost
+    manifest = "\n".join(manifest)
+    if manifest_only:
+        return manifest
+
+    focus = set(focus or [])
+    ordered = [item for item in files if file_key(item) in focus] + [item for item in files if file_key(item) not in focus]
+
+    remaining = budget - count_tokens(manifest)
+    bodies, summaries, omitted = [], [], 0
+    for item in ordered:
+        body = f"### {file_key(item)}\n```\n{item.generated_code}\n```"
+        summary = f"### {file_key(item)} (summary)\n{summarize_source(item.generated_code)}"
+        if count_tokens(body) <= remaining:
+            bodies.append(body)
+            remaining -= count_tokens(body)
+        elif count_tokens(summary) <= remaining:
+            summaries.append(summary)
+            remaining -= count_tokens(summary)
+        else:
+            omitted += 1
+
+    sections = [manifest]
+    if bodies:
+        sections.append("## Contents\n" + "\n\n".join(bodies))
+    if summaries:
+        sections.append("## Summaries (over the context budget)\n" + "\n\n".join(summaries))
+    if omitted:
+        sections.append(f"[{omitted} more files omitted to stay within the context budget]")
+    return "\n\n".join(sections)
+
+
+def render_test_cases(test_cases, budget: int) -> str:
+    """Renders generated test files with their full text, cut at `budget` tokens."""
+    if not test_cases:
+        return "No test cases provided."
+    blocks = [f"### {tc.file_name}\n```\n{tc.generated_code}\n```" for tc in test_cases]
+    return render_text("\n\n".join(blocks), budget)
+
+
+def render_test_results(results, budget: int) -> str:
+    """Renders the counts of a test run and the tests that did not pass, cut at `budget` tokens."""
+    if not results:
+        return "The test cases were not run."
+    lines = [
+        f"{results['passed']} passed, {results['failed']} failed, {results['errors']} errors, "
+        f"{results['timeouts']} timed out, {results['skipped']} skipped in {results['duration_s']:.1f} s"
+    ]
+    for test in results["tests"]:
+        if test["status"] not in ("passed", "skipped"):
+            name = f"{test['file']}::{test['name']}" if test["name"] else test["file"]
+            lines.append(f"- {test['status'].upper()} {name}: {test['message'].strip()}")
+    return render_text("\n".join(lines), budget)
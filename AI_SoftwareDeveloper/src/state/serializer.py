@@ -0,0 +1,196 @@
+"""
+Round-trippable snapshots of the graph State.
+
+`StateStore.save(state, name)` writes a small zlib-compressed JSON snapshot in which pydantic
+models (GeneratedCode, TestCasesCodes, ...) and LangChain messages keep their type, and every
+long string (file bodies, reviews) is replaced by the hash of a zlib-compressed blob:
+
+    state_store/
+        snapshots/<name>.json.z
+        blobs/<first 2 hex chars>/<sha256 of the text>
+
+Blobs are content-addressed, so a file body that did not change between iterations, or
+between runs, is stored once: many snapshots of a large project cost about the size of
+its unique content. `load(name)` returns a LazyState that decodes a key, and reads its
+blobs, only when the key is accessed. Deleted snapshots leave their blobs behind until
+`prune_blobs()`, which must not run while another thread or process saves to the same root.
+"""
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import zlib
+from collections.abc import Mapping
+from functools import lru_cache
+from pydantic import BaseModel
+from langchain_core.messages import BaseMessage, message_to_dict, messages_from_dict
+from src.state import state as state_schema
+
+# Blob digests inside a snapshot document
+BLOB_REFERENCE = re.compile(r'"\$blob":"([0-9a-f]{64})"')
+
+MODELS = {
+    name: value for name, value in vars(state_schema).items()
+    if isinstance(value, type) and issubclass(value, BaseModel) and value is not BaseModel
+}
+
+
+def write_atomic(path: str, data: bytes) -> None:
+    """Writes `data` to a temporary file next to `path` and renames it over `path`."""
+    folder = os.path.dirname(path)
+    os.makedirs(folder, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=folder, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+class StateStore:
+    """Snapshots of states in `root`; strings of `min_blob_size` characters or more go to blobs."""
+    SNAPSHOT_SUFFIX = ".json.z"
+
+    def __init__(self, root="state_store", min_blob_size=256, level=6):
+        self.root = root
+        self.min_blob_size = min_blob_size
+        self.level = level
+        self.lock = threading.Lock()
+        self.blob = lru_cache(maxsize=4096)(self.read_blob)
+
+    def snapshot_path(self, name: str) -> str:
+        return os.path.join(self.root, "snapshots", f"{name}{self.SNAPSHOT_SUFFIX}")
+
+    def blob_path(self, digest: str) -> str:
+        return os.path.join(self.root, "blobs", digest[:2], digest)
+
+    # Blobs
+
+    def put_blob(self, text: str) -> str:
+        data = text.encode("utf-8")
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.blob_path(digest)
+        if not os.path.exists(path):
+            write_atomic(path, zlib.compress(data, self.level))
+        return digest
+
+    def read_blob(self, digest: str) -> str:
+        with open(self.blob_path(digest), "rb") as f:
+            return zlib.decompress(f.read()).decode("utf-8")
+
+    # Encoding
+
+    def encode(self, value):
+        """JSON-able form of a state value; the inverse of `decode`."""
+        if isinstance(value, str):
+            return {"$blob": self.put_blob(value)} if len(value) >= self.min_blob_size else value
+        if value is None or isinstance(value, (bool, int, float)):
+            return value
+        if isinstance(value, BaseMessage):
+            return {"$message": self.encode(message_to_dict(value))}
+        if isinstance(value, BaseModel):
+            name = type(value).__name__
+            if MODELS.get(name) is not type(value):
+                raise TypeError(f"Cannot serialize {name}: not a model of src.state.state")
+            return {"$model": name, "fields": {key: self.encode(item) for key, item in value}}
+        if isinstance(value, (list, tuple)):
+            return [self.encode(item) for item in value]
+        if isinstance(value, dict):
+            encoded = {str(key): self.encode(item) for key, item in value.items()}
+            # Plain dicts whose keys look like markers are wrapped so they decode as dicts
+            return {"$dict": encoded} if any(str(key).startswith("$") for key in value) else encoded
+        raise TypeError(f"Cannot serialize a {type(value).__name__} in the state")
+
+    def decode(self, value):
+        if isinstance(value, list):
+            return [self.decode(item) for item in value]
+        if not isinstance(value, dict):
+            return value
+        if "$blob" in value:
+            return self.blob(value["$blob"])
+        if "$message" in value:
+            return messages_from_dict([self.decode(value["$message"])])[0]
+        if "$model" in value:
+            fields = {key: self.decode(item) for key, item in value["fields"].items()}
+            return MODELS[value["$model"]].model_validate(fields)
+        if "$dict" in value:
+            value = value["$dict"]
+        return {key: self.decode(item) for key, item in value.items()}
+
+    # Snapshots
+
+    def save(self, state, name: str) -> str:
+        """Writes the snapshot `name` of `state` and returns its path."""
+        document = {"version": 1, "state": {key: self.encode(value) for key, value in dict(state).items()}}
+        path = self.snapshot_path(name)
+        with self.lock:
+            write_atomic(path, zlib.compress(json.dumps(document, separators=(",", ":")).encode("utf-8"), self.level))
+        return path
+
+    def load(self, name: str, lazy=True):
+        """The state of snapshot `name`: a LazyState, or a plain dict with `lazy=False`."""
+        with open(self.snapshot_path(name), "rb") as f:
+            document = json.loads(zlib.decompress(f.read()))
+        state = LazyState(self, document["state"])
+        return state if lazy else dict(state)
+
+    def delete(self, name: str) -> None:
+        """Removes the snapshot `name`; its blobs stay until `prune_blobs`."""
+        try:
+            os.remove(self.snapshot_path(name))
+        except FileNotFoundError:
+            pass
+
+    def prune_blobs(self) -> int:
+        """Deletes the blobs no snapshot refers to any more; returns how many were deleted."""
+        referenced = set()
+        for name in self.snapshots():
+            with open(self.snapshot_path(name), "rb") as f:
+                referenced.update(BLOB_REFERENCE.findall(zlib.decompress(f.read()).decode("utf-8")))
+        deleted = 0
+        for folder, _, files in os.walk(os.path.join(self.root, "blobs")):
+            for entry in files:
+                if entry not in referenced and not entry.startswith(".tmp-"):
+                    os.remove(os.path.join(folder, entry))
+                    deleted += 1
+        return deleted
+
+    def snapshots(self) -> list:
+        folder = os.path.join(self.root, "snapshots")
+        if not os.path.isdir(folder):
+            return []
+        suffix = self.SNAPSHOT_SUFFIX
+        return sorted(entry[:-len(suffix)] for entry in os.listdir(folder) if entry.endswith(suffix))
+
+    def size(self) -> dict:
+        """Bytes used by the snapshots and by the blobs."""
+        totals = {"snapshots": 0, "blobs": 0, "blob_count": 0}
+        for kind in ("snapshots", "blobs"):
+            for folder, _, files in os.walk(os.path.join(self.root, kind)):
+                for entry in files:
+                    totals[kind] += os.path.getsize(os.path.join(folder, entry))
+                    totals["blob_count"] += kind == "blobs"
+        return totals
+
+
+class LazyState(Mapping):
+    """Read-only state whose values are decoded, and their blobs read, on first access."""
+    def __init__(self, store: StateStore, encoded: dict):
+        self.store = store
+        self.encoded = encoded
+        self.decoded = {}
+
+    def __getitem__(self, key):
+        if key not in self.decoded:
+            self.decoded[key] = self.store.decode(self.encoded[key])
+        return self.decoded[key]
+
+    def __iter__(self):
+        return iter(self.encoded)
+
+    def __len__(self):
+        return len(self.encoded)
@@ -34,6 +34,18 @@ class GeneratedCode(BaseModel):
     file_path: str = Field(..., description="Full path relative to parent folder, e.g., 'services/db/db.py'")
     generated_code: str = Field(..., description="Generated code content to be stored in the file")
 
+class PlannedFile(BaseModel):
+    parent_folder: Literal["backend", "frontend", "config", "dependencies", "API", "services"]
+    file_path: str = Field(..., description="Full path relative to parent folder, e.g., 'services/db/db.py'")
+    purpose: str = Field(..., description="What this file is responsible for and which other files it uses")
+
+class ProjectManifest(BaseModel):
+    files: List[PlannedFile] = Field(description="Every file the project needs, without its content")
+
+class RevisionPlan(BaseModel):
+    change: List[PlannedFile] = Field(description="Existing files the review feedback asks to change")
+    add: List[PlannedFile] = Field(description="New files the review feedback asks for, e.g. missing tests or dependencies")
+
 class TestCaseCode(BaseModel):
     file_name: str = Field(..., description="File name with extension (e.g., 'app.py')")
     generated_code: str = Field(..., description="Generated test cases code to evaluate the project")
@@ -55,6 +67,11 @@ class DecisionCodReview(BaseModel):
 class DecisionTestCases(BaseModel):
     decision_test_cases_feedback: Literal["Accepted", "Rejected"] = Field(description="Decide if the test cases are accepted or not.",)
 
+class SecurityBranchOutput(TypedDict, total=False):
+    security_scan: Optional[dict]
+    security_review_feedback: Optional[str]
+    security_fix_project: Optional[List[GeneratedCode]]
+
 class State(TypedDict, total=False):
     requirement: str
 
@@ -80,11 +97,22 @@ class State(TypedDict, total=False):
     times_reject_code: int = 0
 
     # Security Review
+    # Static analysis report: files scanned, findings (rule, severity, file, line, ...), unscanned files
+    security_scan: Optional[dict] = None
     security_review_feedback: Optional[str] = None
 
+    # Files changed (or added) by the parallel post-review branches, merged back into generated_project
+    functional_fix_project: Optional[List[GeneratedCode]] = None
+    security_fix_project: Optional[List[GeneratedCode]] = None
+
     # Test Cases
     test_cases_codes: Optional[List[TestCaseCode]] = None
     test_cases_feedback: Optional[str] = None
+    # Results of running test_cases_codes against generated_project (src/tools/test_runner.py)
+    test_results: Optional[dict] = None
     human_test_cases_review: Optional[str] = None
     decision_test_cases_feedback: Optional[Literal["Accepted", "Rejected"]] = None
-    times_reject_tc: int = 0
\ No newline at end of file
+    times_reject_tc: int = 0
+
+    # Decision policies: [inputs hash, decision, decider] of the last decision of each review loop
+    decision_fingerprints: Optional[dict] = None
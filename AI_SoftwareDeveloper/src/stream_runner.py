@@ -0,0 +1,156 @@
+"""
+Streaming runner for the code builder graph.
+
+Modes:
+    summary  one compact line per finished node: files changed and sizes, decisions, text lengths
+    tokens   as `summary`, plus the model output as it is generated (text tokens are echoed,
+             structured output, streamed projects included, shows a live character counter
+             instead of megabytes of JSON)
+    full     the raw update of every node, as the original runner printed it
+"""
+import sys
+from src.state.render import as_text, file_key
+
+STREAM_MODES = ("summary", "tokens", "full")
+
+
+def size_text(chars: int) -> str:
+    return f"{chars / 1024:.1f} KB" if chars >= 1024 else f"{chars} chars"
+
+
+class StreamPrinter:
+    """Turns graph stream chunks into compact terminal output."""
+    def __init__(self, mode="summary", out=None, prefix=""):
+        if mode not in STREAM_MODES:
+            raise ValueError(f"Unknown stream mode: {mode}")
+        self.mode = mode
+        self.out = out or sys.stdout
+        self.prefix = prefix
+        # Latest content of every generated file, to report which files a node changed
+        self.files = {}
+        # Structured output characters received per node while its tokens stream in
+        self.receiving = {}
+        # Node whose output line is currently open, if any
+        self.current = None
+
+    @property
+    def stream_mode(self) -> list:
+        return ["updates", "messages"] if self.mode == "tokens" else ["updates"]
+
+    def write(self, text: str) -> None:
+        self.out.write(text)
+        self.out.flush()
+
+    def end_line(self) -> None:
+        if self.current is not None:
+            self.write("\n")
+            self.current = None
+
+    def open_line(self, name: str) -> None:
+        """Starts a line for `name` unless its line is the open one (parallel nodes stream interleaved)."""
+        if self.current != name:
+            self.end_line()
+            self.write(f"{self.prefix}[{name}] ")
+            self.current = name
+
+    @staticmethod
+    def node_name(namespace, node: str) -> str:
+        # Subgraph namespaces look like ('security_branch:<task id>',)
+        return "/".join([part.split(":")[0] for part in namespace] + [node])
+
+    def describe_files(self, files, track=True) -> str:
+        """File count, size and changed files, compared with the last generated_project seen."""
+        files = files or []
+        total = sum(len(item.generated_code) for item in files)
+        changed = [
+            file_key(item) for item in files
+            if self.files.get(file_key(item)) != item.generated_code
+        ]
+        if track:
+            self.files = {file_key(item): item.generated_code for item in files}
+        shown = ", ".join(changed[:5]) + (f", ... {len(changed) - 5} more" if len(changed) > 5 else "")
+        return f"{len(files)} files ({size_text(total)}), {len(changed)} changed" + (f": {shown}" if changed else "")
+
+    def describe(self, key: str, value) -> str:
+        """One short description of a state value."""
+        if value is None:
+            return "cleared"
+        if isinstance(value, list):
+            if value and hasattr(value[0], "parent_folder"):
+                # Branch outputs are compared with the project without becoming the new baseline
+                return self.describe_files(value, track=key == "generated_project")
+            if value and hasattr(value[0], "file_name"):
+                total = sum(len(item.generated_code) for item in value)
+                return f"{len(value)} test files ({size_text(total)})"
+            return f"{len(value)} items"
+        if isinstance(value, (int, float)):
+            return str(value)
+        text = as_text(value)
+        if key.startswith("decision") or len(text) <= 40:
+            return text
+        return size_text(len(text))
+
+    def summary(self, node: str, update) -> str:
+        if not isinstance(update, dict) or not update:
+            return f"{self.prefix}[{node}] done"
+        fields = "; ".join(f"{key}: {self.describe(key, value)}" for key, value in update.items())
+        return f"{self.prefix}[{node}] {fields}"
+
+    def on_update(self, namespace, event: dict) -> None:
+        self.end_line()
+        for node, update in event.items():
+            name = self.node_name(namespace, node)
+            self.receiving.pop(name, None)
+            if node == "__interrupt__":
+                # The run is parked until a reviewer answers (see src/graph/review_queue.py)
+                values = [getattr(item, "value", None) for item in update]
+                reviews = ", ".join(value.get("review", "review") if isinstance(value, dict) else "review" for value in values)
+                self.write(f"{self.prefix}[{name}] waiting for {reviews}\n")
+            elif self.mode == "full":
+                self.write(f"{self.prefix}{str({node: update})}\n")
+            else:
+                self.write(self.summary(name, update) + "\n")
+
+    def on_message(self, namespace, message, metadata: dict) -> None:
+        name = self.node_name(namespace, metadata.get("langgraph_node", "?"))
+        content = message.content if isinstance(message.content, str) else ""
+        arguments = "".join(chunk.get("args") or "" for chunk in getattr(message, "tool_call_chunks", None) or [])
+        if "structured_output" in metadata.get("tags", ()):
+            # Projects streamed as JSON text (src/LLMS/structured_stream.py)
+            content, arguments = "", content
+        if content:
+            self.open_line(name)
+            self.write(content)
+        elif arguments:
+            self.receiving[name] = self.receiving.get(name, 0) + len(arguments)
+            self.open_line(name)
+            self.write(f"\r{self.prefix}[{name}] receiving structured output: {size_text(self.receiving[name])}")
+
+    def handle(self, chunk) -> None:
+        """Handles one chunk of `graph.stream(..., stream_mode=self.stream_mode, subgraphs=True)`."""
+        namespace, mode, payload = chunk
+        if mode == "updates":
+            self.on_update(namespace, payload)
+        elif mode == "messages":
+            self.on_message(namespace, *payload)
+
+
+def run_streaming(graph, initial_input, config, mode="summary", out=None, prefix="", durability=None) -> None:
+    """
+    Runs the graph, printing its progress in the selected mode. `durability='sync'` makes
+    every step wait for its checkpoint to be written before the next one starts.
+    """
+    printer = StreamPrinter(mode, out, prefix)
+    for chunk in graph.stream(initial_input, config=config, stream_mode=printer.stream_mode, subgraphs=True,
+                              durability=durability):
+        printer.handle(chunk)
+    printer.end_line()
+
+
+async def arun_streaming(graph, initial_input, config, mode="summary", out=None, prefix="", durability=None) -> None:
+    """Async variant of `run_streaming`."""
+    printer = StreamPrinter(mode, out, prefix)
+    async for chunk in graph.astream(initial_input, config=config, stream_mode=printer.stream_mode, subgraphs=True,
+                                     durability=durability):
+        printer.handle(chunk)
+    printer.end_line()
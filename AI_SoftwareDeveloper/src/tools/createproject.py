@@ -1,5 +1,6 @@
 import os
 from src.state.state import State
+from src.tools.materializer import ProjectMaterializer
 
 from dataclasses import dataclass
 
@@ -25,13 +26,13 @@ class GeneratedCode:
         )
 
 
+_materializer = ProjectMaterializer()
+
+
 # Create project
-def create_project(state: State):
-    generated_project = state['generated_project']
-    for item in generated_project:
-        full_path = os.path.join('AI_GenCode', item.parent_folder, item.file_path)
-        os.makedirs(os.path.dirname(full_path), exist_ok=True)
-        with open(full_path, 'w', encoding='utf-8') as f:
-            f.write(item.generated_code)
-
-    print("✅ Archivos generados exitosamente.")
\ No newline at end of file
+def create_project(state: State, root: str = 'AI_GenCode'):
+    """Writes the generated project to `root`; only new or changed files are written (see ProjectMaterializer)."""
+    result = _materializer.materialize(state['generated_project'], root)
+
+    print(f"✅ Archivos generados exitosamente: {result.written} escritos, {result.unchanged} sin cambios en {result.root}")
+    return result
\ No newline at end of file
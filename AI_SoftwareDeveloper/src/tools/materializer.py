@@ -0,0 +1,227 @@
+"""
+Writes a generated project to disk.
+
+Every run targets its own root. The project is built in a staging directory next to the
+root and swapped in with two renames, so readers never see a half-written project and a
+failed run leaves the previous one in place; the replaced version is deleted in the background.
+The root keeps a manifest of the files it wrote, with their content hash, size and modification
+time: a file whose content did not change and that is still as it was written is hard-linked
+from the previous version instead of being written again; new or changed files, and files
+edited or deleted on disk, are written by a pool of threads.
+
+Only the files of the manifest belong to the materializer. Anything else in the root (files
+the user added, or a whole directory that was never materialized) is carried over to every
+new version; a generated file with the same path replaces it, as create_project always did.
+Paths from the model are validated first; absolute paths and '..' components are rejected.
+"""
+import hashlib
+import json
+import os
+import shutil
+import stat
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import PurePosixPath
+
+MANIFEST = ".materialized.json"
+
+
+class UnsafePathError(ValueError):
+    """A generated file path that would be written outside the project root."""
+
+
+def safe_relative_path(*parts: str) -> str:
+    """Joins path parts into a normalized relative POSIX path, rejecting anything that escapes the root."""
+    parts = [part.replace("\\", "/") for part in parts if part]
+    joined = "/".join(parts)
+    if not joined or "\0" in joined or any(part.startswith("/") for part in parts):
+        raise UnsafePathError(f"Unsafe file path: {joined!r}")
+    path = PurePosixPath(joined)
+    clean = [part for part in path.parts if part not in ("", ".")]
+    if not clean or ".." in clean or any(":" in part for part in clean) or clean[-1] == MANIFEST:
+        raise UnsafePathError(f"Unsafe file path: {joined!r}")
+    return "/".join(clean)
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class MaterializeResult:
+    root: str
+    written: int
+    unchanged: int
+    removed: int
+    seconds: float
+    # Files in the root that the materializer did not write, carried over
+    kept: int = 0
+
+
+class ProjectMaterializer:
+    """Materializes lists of GeneratedCode (or any items with parent_folder / file_path / generated_code)."""
+    def __init__(self, max_workers=16):
+        self.max_workers = max_workers
+        # Replaced versions are deleted after the swap, off the caller's path
+        self.cleaner = ThreadPoolExecutor(1, thread_name_prefix="materializer-cleanup")
+        # One materialization per root at a time within the process
+        self.locks = {}
+        self.locks_lock = threading.Lock()
+
+    def root_lock(self, root: str) -> threading.Lock:
+        with self.locks_lock:
+            return self.locks.setdefault(os.path.abspath(root), threading.Lock())
+
+    @staticmethod
+    def project_files(items) -> dict:
+        """relative path -> content; a later item with the same path replaces an earlier one."""
+        return {
+            safe_relative_path(item.parent_folder, item.file_path): item.generated_code
+            for item in items
+        }
+
+    @staticmethod
+    def read_manifest(root: str) -> dict:
+        """relative path -> [content hash, size, mtime_ns] of the files the last materialization wrote."""
+        try:
+            with open(os.path.join(root, MANIFEST), encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        # Manifests of hashes only cannot tell whether a file was edited: their files are written again
+        return {path: entry if isinstance(entry, list) and len(entry) == 3 else None for path, entry in manifest.items()}
+
+    @staticmethod
+    def intact(root: str, path: str, entry) -> bool:
+        """The file at `path` is still the one the manifest recorded: a regular file of the same size and mtime."""
+        if not entry:
+            return False
+        try:
+            info = os.lstat(os.path.join(root, path))
+        except OSError:
+            return False
+        return stat.S_ISREG(info.st_mode) and [info.st_size, info.st_mtime_ns] == entry[1:]
+
+    @staticmethod
+    def untracked_files(root: str, tracked) -> list:
+        """Relative paths of the files (and empty folders, ending in '/') of `root` that are not in `tracked`."""
+        found = []
+        for folder, dirs, names in os.walk(root):
+            relative = os.path.relpath(folder, root).replace(os.sep, "/")
+            prefix = "" if relative == "." else f"{relative}/"
+            # Symlinked folders are carried as links, not walked
+            links = [name for name in dirs if os.path.islink(os.path.join(folder, name))]
+            dirs[:] = [name for name in dirs if name not in links]
+            if prefix and not dirs and not names and not links:
+                found.append(prefix)
+            for name in names + links:
+                if prefix + name not in tracked and prefix + name != MANIFEST:
+                    found.append(prefix + name)
+        return found
+
+    @staticmethod
+    def keep(staging: str, root: str, path: str) -> None:
+        """Carries an untracked file (or empty folder) of the current version over to the staging directory."""
+        source, target = os.path.join(root, path), os.path.join(staging, path)
+        if os.path.lexists(target) and not path.endswith("/"):
+            # A folder of the generated project has the same path: the project wins
+            return
+        if path.endswith("/"):
+            os.makedirs(target, exist_ok=True)
+            return
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        if os.path.islink(source):
+            os.symlink(os.readlink(source), target)
+            return
+        try:
+            os.link(source, target)
+        except OSError:
+            shutil.copy2(source, target)
+
+    @staticmethod
+    def place(staging: str, root: str, path: str, text: str, reuse: bool) -> bool:
+        """Puts one file in the staging directory; returns True when it had to be written."""
+        target = os.path.join(staging, path)
+        if reuse:
+            try:
+                os.link(os.path.join(root, path), target)
+                return False
+            except OSError:
+                pass
+        with open(target, "w", encoding="utf-8", newline="") as f:
+            f.write(text)
+        return True
+
+    def materialize(self, items, root: str) -> MaterializeResult:
+        """
+        Makes `root` contain the files of `items`, writing only what changed. Files of the previous
+        materialization that are not in `items` are removed; files it did not write are kept.
+        """
+        started = time.perf_counter()
+        files = self.project_files(items or [])
+        hashes = {path: content_hash(text) for path, text in files.items()}
+        root = os.path.normpath(root)
+        parent = os.path.dirname(os.path.abspath(root))
+        os.makedirs(parent, exist_ok=True)
+        if os.path.lexists(root) and not os.path.isdir(root):
+            raise NotADirectoryError(f"Cannot materialize a project over {root!r}: it is not a directory")
+
+        with self.root_lock(root):
+            previous = self.read_manifest(root)
+            reusable = {
+                path for path, entry in previous.items()
+                if path in hashes and entry and entry[0] == hashes[path] and self.intact(root, path, entry)
+            }
+            if os.path.isdir(root) and set(previous) == set(files) == reusable:
+                return MaterializeResult(root, 0, len(files), 0, time.perf_counter() - started)
+            untracked = self.untracked_files(root, set(previous) | set(files)) if os.path.isdir(root) else []
+            staging = tempfile.mkdtemp(dir=parent, prefix=f".{os.path.basename(root)}.staging-")
+            try:
+                for folder in {os.path.dirname(path) for path in files}:
+                    os.makedirs(os.path.join(staging, folder), exist_ok=True)
+                for path in untracked:
+                    self.keep(staging, root, path)
+                with ThreadPoolExecutor(self.max_workers) as pool:
+                    written = sum(pool.map(
+                        lambda path: self.place(staging, root, path, files[path], path in reusable),
+                        files,
+                    ))
+                manifest = {}
+                for path, digest in hashes.items():
+                    info = os.stat(os.path.join(staging, path))
+                    manifest[path] = [digest, info.st_size, info.st_mtime_ns]
+                with open(os.path.join(staging, MANIFEST), "w", encoding="utf-8") as f:
+                    json.dump(manifest, f)
+                retired = self.swap(staging, root)
+            except BaseException:
+                shutil.rmtree(staging, ignore_errors=True)
+                raise
+        if retired is not None:
+            self.cleaner.submit(shutil.rmtree, retired, ignore_errors=True)
+
+        removed = len(set(previous) - set(files))
+        return MaterializeResult(root, written, len(files) - written, removed, time.perf_counter() - started,
+                                 sum(not path.endswith("/") for path in untracked))
+
+    def close(self) -> None:
+        """Waits until the replaced versions are deleted."""
+        self.cleaner.shutdown(wait=True)
+
+    @staticmethod
+    def swap(staging: str, root: str):
+        """Replaces `root` by `staging` with two atomic renames; returns the path of the replaced version, if any."""
+        if not os.path.exists(root):
+            os.rename(staging, root)
+            return None
+        retired = tempfile.mkdtemp(dir=os.path.dirname(staging), prefix=f".{os.path.basename(root)}.old-")
+        os.rmdir(retired)
+        os.rename(root, retired)
+        try:
+            os.rename(staging, root)
+        except OSError:
+            os.rename(retired, root)
+            raise
+        return retired
@@ -0,0 +1,352 @@
+"""
+Static security pre-scan of the generated Python files.
+
+Each rule implements `visit_<NodeType>` handlers and knows the module's imports, so aliases
+like `import subprocess as sp` or `from pickle import loads` resolve to the same dotted name.
+A file is parsed and walked once; every node goes to the handlers of all the rules.
+The rules cover the issues a security audit usually reports in generated code:
+
+    eval_exec                 eval / exec / compile on dynamic input
+    shell_injection           subprocess with shell=True, os.system, os.popen
+    sql_string_building       execute() on a query built with f-strings, %, + or .format
+    hardcoded_secret          password / secret / token / key names bound to string literals
+    weak_hash                 md5 / sha1
+    insecure_deserialization  pickle, marshal, shelve, dill, yaml.load without a safe loader
+
+Files are scanned in parallel in a process pool for large projects, since parsing is CPU
+bound, and inline for small ones. Files that are not Python, or do not parse,
+cannot be checked and are reported as unscanned, so the LLM audit still sees them.
+Scans are cached per path and content, so files that did not change since the last review
+loop, or that were scanned as they streamed in (`prescan`), are not parsed again.
+"""
+import ast
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass, field
+from src.state.render import file_key
+
+SEVERITIES = ("Critical", "High", "Medium", "Low")
+SECRET_NAME = re.compile(r"(pass(word|wd)?|secret|token|api_?key|private_?key|access_?key|credentials?)$", re.IGNORECASE)
+SQL_START = re.compile(r"^\s*(select|insert|update|delete|replace|create|drop|alter)\b", re.IGNORECASE)
+
+
+@dataclass
+class Finding:
+    rule: str
+    severity: str
+    file: str
+    line: int
+    message: str
+    snippet: str = ""
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+@dataclass
+class FileScan:
+    file: str
+    findings: list = field(default_factory=list)
+    # Why the file could not be scanned (not Python, syntax error), or None
+    unscanned: str = None
+
+
+class RuleVisitor:
+    """Base of the rules: resolves call targets through the module's imports and records findings."""
+    NODE_TYPES = ("Call", "Assign", "AnnAssign", "Dict")
+    rule = "rule"
+    severity = "Medium"
+
+    def __init__(self, file: str, lines: list, imports: dict):
+        self.file = file
+        self.lines = lines
+        self.imports = imports
+        self.findings = []
+
+    def report(self, node, message: str) -> None:
+        line = getattr(node, "lineno", 0)
+        snippet = self.lines[line - 1].strip() if 0 < line <= len(self.lines) else ""
+        self.findings.append(Finding(self.rule, self.severity, self.file, line, message, snippet[:200]))
+
+    def dotted(self, node) -> str:
+        """'subprocess.run' for `sp.run` after `import subprocess as sp`, '' when it cannot be resolved."""
+        if isinstance(node, ast.Name):
+            return self.imports.get(node.id, node.id)
+        if isinstance(node, ast.Attribute):
+            base = self.dotted(node.value)
+            return f"{base}.{node.attr}" if base else ""
+        return ""
+
+    @staticmethod
+    def keyword(node: ast.Call, name: str):
+        return next((kw.value for kw in node.keywords if kw.arg == name), None)
+
+
+def is_literal(node) -> bool:
+    return isinstance(node, ast.Constant) or (
+        isinstance(node, (ast.Tuple, ast.List)) and all(is_literal(item) for item in node.elts)
+    )
+
+
+class EvalExecRule(RuleVisitor):
+    rule, severity = "eval_exec", "High"
+
+    def visit_Call(self, node):
+        name = self.dotted(node.func)
+        if name in ("eval", "exec", "compile", "builtins.eval", "builtins.exec") and node.args and not is_literal(node.args[0]):
+            self.report(node, f"{name}() on a dynamic value can execute arbitrary code")
+
+
+class ShellInjectionRule(RuleVisitor):
+    rule, severity = "shell_injection", "High"
+    SUBPROCESS = {"subprocess.run", "subprocess.call", "subprocess.check_call", "subprocess.check_output", "subprocess.Popen"}
+    SHELL = {"os.system", "os.popen", "subprocess.getoutput", "subprocess.getstatusoutput"}
+
+    def visit_Call(self, node):
+        name = self.dotted(node.func)
+        shell = self.keyword(node, "shell")
+        if name in self.SUBPROCESS and isinstance(shell, ast.Constant) and shell.value:
+            self.report(node, f"{name}(shell=True) runs its command through the shell")
+        elif name in self.SHELL and node.args and not is_literal(node.args[0]):
+            self.report(node, f"{name}() runs a dynamic command through the shell")
+
+
+class SqlStringRule(RuleVisitor):
+    rule, severity = "sql_string_building", "High"
+    METHODS = {"execute", "executemany", "executescript", "raw", "text"}
+
+    @staticmethod
+    def built_query(node) -> bool:
+        if isinstance(node, ast.JoinedStr):
+            return any(isinstance(value, ast.FormattedValue) for value in node.values)
+        if isinstance(node, ast.BinOp) and isinstance(node.op, (ast.Mod, ast.Add)):
+            return not (is_literal(node.left) and is_literal(node.right))
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and node.func.attr == "format":
+            return True
+        return False
+
+    @staticmethod
+    def looks_like_sql(node) -> bool:
+        for child in ast.walk(node):
+            if isinstance(child, ast.Constant) and isinstance(child.value, str) and SQL_START.match(child.value):
+                return True
+        return False
+
+    def visit_Call(self, node):
+        method = node.func.attr if isinstance(node.func, ast.Attribute) else getattr(node.func, "id", "")
+        if method in self.METHODS and node.args and self.built_query(node.args[0]):
+            self.report(node, f"{method}() on a query built from strings; use bound parameters")
+
+    def visit_Assign(self, node):
+        # query = f"SELECT ... {value}" followed by execute(query)
+        if self.built_query(node.value) and self.looks_like_sql(node.value):
+            self.report(node, "SQL query built from strings; use bound parameters")
+
+
+class HardcodedSecretRule(RuleVisitor):
+    rule, severity = "hardcoded_secret", "High"
+
+    def check(self, node, target_name: str, value) -> None:
+        if (SECRET_NAME.search(target_name or "") and isinstance(value, ast.Constant)
+                and isinstance(value.value, str) and len(value.value) >= 4):
+            self.report(node, f"'{target_name}' is bound to a hardcoded string")
+
+    @staticmethod
+    def target_name(target) -> str:
+        if isinstance(target, ast.Name):
+            return target.id
+        if isinstance(target, ast.Attribute):
+            return target.attr
+        if isinstance(target, ast.Subscript) and isinstance(target.slice, ast.Constant):
+            return str(target.slice.value)
+        return ""
+
+    def visit_Assign(self, node):
+        for target in node.targets:
+            self.check(node, self.target_name(target), node.value)
+
+    def visit_AnnAssign(self, node):
+        self.check(node, self.target_name(node.target), node.value)
+
+    def visit_Call(self, node):
+        for kw in node.keywords:
+            self.check(node, kw.arg, kw.value)
+
+    def visit_Dict(self, node):
+        for key, value in zip(node.keys, node.values):
+            if isinstance(key, ast.Constant) and isinstance(key.value, str):
+                self.check(node, key.value, value)
+
+
+class WeakHashRule(RuleVisitor):
+    rule, severity = "weak_hash", "Medium"
+    WEAK = {"md5", "sha1"}
+
+    def visit_Call(self, node):
+        name = self.dotted(node.func)
+        algorithm = ""
+        if name in ("hashlib.md5", "hashlib.sha1"):
+            algorithm = name.split(".")[1]
+        elif name == "hashlib.new" and node.args and isinstance(node.args[0], ast.Constant):
+            algorithm = str(node.args[0].value).lower()
+        used_for_security = self.keyword(node, "usedforsecurity")
+        if algorithm in self.WEAK and not (isinstance(used_for_security, ast.Constant) and used_for_security.value is False):
+            self.report(node, f"{algorithm} is not collision resistant; use sha256 (or bcrypt/argon2 for passwords)")
+
+
+class InsecureDeserializationRule(RuleVisitor):
+    rule, severity = "insecure_deserialization", "High"
+    UNSAFE = {"pickle.load", "pickle.loads", "pickle.Unpickler", "cPickle.load", "cPickle.loads", "marshal.load",
+              "marshal.loads", "shelve.open", "dill.load", "dill.loads", "jsonpickle.decode", "yaml.unsafe_load"}
+    SAFE_LOADERS = ("SafeLoader", "CSafeLoader", "BaseLoader")
+
+    def visit_Call(self, node):
+        name = self.dotted(node.func)
+        if name in self.UNSAFE:
+            self.report(node, f"{name}() can execute code embedded in untrusted data")
+        elif name in ("yaml.load", "yaml.load_all"):
+            loader = self.keyword(node, "Loader") or (node.args[1] if len(node.args) > 1 else None)
+            if loader is None or not self.dotted(loader).endswith(self.SAFE_LOADERS):
+                self.report(node, f"{name}() without a safe Loader can build arbitrary objects; use yaml.safe_load")
+
+
+RULES = (EvalExecRule, ShellInjectionRule, SqlStringRule, HardcodedSecretRule, WeakHashRule, InsecureDeserializationRule)
+
+
+def module_imports(nodes) -> dict:
+    """Local name -> dotted name of everything the module imports."""
+    imports = {}
+    for node in nodes:
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                imports[alias.asname or alias.name.split(".")[0]] = alias.name if alias.asname else alias.name.split(".")[0]
+        elif isinstance(node, ast.ImportFrom) and node.module:
+            for alias in node.names:
+                imports[alias.asname or alias.name] = f"{node.module}.{alias.name}"
+    return imports
+
+
+def scan_source(file: str, code: str, rules=RULES) -> FileScan:
+    """Runs every rule over one file."""
+    if not file.endswith(".py"):
+        return FileScan(file, unscanned="not a Python file")
+    try:
+        tree = ast.parse(code, filename=file)
+    except (SyntaxError, ValueError) as e:
+        return FileScan(file, unscanned=f"does not parse: {e}")
+    nodes = list(ast.walk(tree))
+    lines, imports = code.splitlines(), module_imports(nodes)
+    visitors = [rule(file, lines, imports) for rule in rules]
+    handlers = {}
+    for visitor in visitors:
+        for node_type in RuleVisitor.NODE_TYPES:
+            handler = getattr(visitor, f"visit_{node_type}", None)
+            if handler is not None:
+                handlers.setdefault(getattr(ast, node_type), []).append(handler)
+    for node in nodes:
+        for handler in handlers.get(type(node), ()):
+            handler(node)
+    findings = [finding for visitor in visitors for finding in visitor.findings]
+    findings.sort(key=lambda finding: (finding.line, finding.rule))
+    return FileScan(file, findings)
+
+
+def _scan_batch(batch: list) -> list:
+    return [scan_source(file, code) for file, code in batch]
+
+
+# (path, content hash) -> FileScan of the most recently scanned files, shared by the scanners of the process
+SCAN_CACHE_SIZE = 4096
+_scans = OrderedDict()
+_scans_lock = threading.Lock()
+
+
+def scan_key(file: str, code: str) -> tuple:
+    return file, hashlib.sha1(code.encode("utf-8", "surrogatepass")).hexdigest()
+
+
+def cached_scan(key: tuple):
+    with _scans_lock:
+        scan = _scans.get(key)
+        if scan is not None:
+            _scans.move_to_end(key)
+        return scan
+
+
+def clear_scan_cache() -> None:
+    with _scans_lock:
+        _scans.clear()
+
+
+def store_scan(key: tuple, scan: FileScan) -> None:
+    with _scans_lock:
+        _scans[key] = scan
+        _scans.move_to_end(key)
+        while len(_scans) > SCAN_CACHE_SIZE:
+            _scans.popitem(last=False)
+
+
+class SecurityScanner:
+    """Scans projects (lists of GeneratedCode) with RULES; large projects are split across processes."""
+    def __init__(self, max_workers=None, min_parallel_files=200):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        # Below this many Python files, the process pool start up costs more than the scan
+        self.min_parallel_files = min_parallel_files
+
+    def scan(self, files) -> list:
+        """One FileScan per file, in project order."""
+        sources = [(file_key(item), item.generated_code) for item in files or []]
+        keys = [scan_key(file, code) for file, code in sources]
+        scans = {key: cached_scan(key) for key in keys}
+        missing = list({key: source for key, source in zip(keys, sources) if scans[key] is None}.items())
+        for (key, _), scan in zip(missing, self.scan_sources([source for _, source in missing])):
+            scans[key] = scan
+            store_scan(key, scan)
+        return [scans[key] for key in keys]
+
+    def scan_sources(self, sources: list) -> list:
+        python = sum(file.endswith(".py") for file, _ in sources)
+        if self.max_workers <= 1 or python < self.min_parallel_files:
+            return _scan_batch(sources)
+        size = -(-len(sources) // (self.max_workers * 4))
+        batches = [sources[start:start + size] for start in range(0, len(sources), size)]
+        with ProcessPoolExecutor(self.max_workers) as pool:
+            return [scan for batch in pool.map(_scan_batch, batches) for scan in batch]
+
+
+def prescan(item) -> None:
+    """Scans one file as soon as it is generated; the security review then finds it in the cache."""
+    key = scan_key(file_key(item), item.generated_code)
+    if cached_scan(key) is None:
+        store_scan(key, scan_source(key[0], item.generated_code))
+
+
+def scan_report(scans: list) -> dict:
+    """JSON-able summary of a scan, as stored in the state's `security_scan`."""
+    return {
+        "files": len(scans),
+        "findings": [finding.to_dict() for scan in scans for finding in scan.findings],
+        "unscanned": {scan.file: scan.unscanned for scan in scans if scan.unscanned},
+    }
+
+
+def flagged_files(report: dict) -> set:
+    """Files the LLM audit has to see: the ones with findings and the ones the scan could not check."""
+    return {finding["file"] for finding in report["findings"]} | set(report["unscanned"])
+
+
+def render_findings(report: dict) -> str:
+    """Findings grouped by file, most severe first, and the files that could not be scanned."""
+    lines = []
+    findings = sorted(report["findings"], key=lambda finding: (finding["file"], SEVERITIES.index(finding["severity"])))
+    for finding in findings:
+        lines.append(f"- [{finding['severity']}] {finding['file']}:{finding['line']} {finding['rule']}: {finding['message']}"
+                     + (f"\n    {finding['snippet']}" if finding["snippet"] else ""))
+    if report["unscanned"]:
+        lines.append("Not checked by the static analysis:")
+        lines.extend(f"- {file} ({reason})" for file, reason in report["unscanned"].items())
+    return "\n".join(lines) or "No findings."
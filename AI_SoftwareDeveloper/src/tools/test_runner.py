@@ -0,0 +1,184 @@
+"""
+Runs the generated test cases against the generated project.
+
+The project and the test files are materialized in a fresh temporary directory and every
+Python test file runs in its own pytest process, several at a time. Each process gets a
+minimal environment, the sandbox as cwd and HOME, a wall-clock timeout and, on POSIX,
+CPU / memory / file size limits set by a small wrapper before pytest starts (no preexec_fn:
+the processes are started from worker threads). The timeout and the limits apply to a test
+file as a whole, not to each of its tests: a file that times out is killed with its
+children and reported as one timeout entry, its finished tests included.
+This isolates runs from each other and from the repository, it is not a security
+boundary: generated tests can still reach the network and the rest of the filesystem.
+
+Results come from pytest's JUnit XML report and are returned as plain dicts, so they can
+be stored in the state:
+
+    {"passed": 3, "failed": 1, "errors": 0, "skipped": 0, "timeouts": 0, "duration_s": 1.2,
+     "tests": [{"file": "test_app.py", "name": "test_add", "status": "passed", "duration_s": 0.01, "message": ""}]}
+"""
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import xml.etree.ElementTree as ET
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from src.tools.materializer import ProjectMaterializer, UnsafePathError, safe_relative_path
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+TESTS_FOLDER = "tests"
+STATUSES = ("passed", "failed", "errors", "skipped", "timeouts")
+OUTPUT_LIMIT = 2000
+# Sets the CPU seconds, address space and file size limits given as its first arguments, then runs pytest
+LIMITED_PYTEST = (
+    "import resource, runpy, sys\n"
+    "limits = (resource.RLIMIT_CPU, resource.RLIMIT_AS, resource.RLIMIT_FSIZE)\n"
+    "for limit, value in zip(limits, map(int, sys.argv[1:4])):\n"
+    "    if value:\n"
+    "        resource.setrlimit(limit, (value, value))\n"
+    "sys.argv = sys.argv[:1] + sys.argv[4:]\n"
+    "runpy.run_module('pytest', run_name='__main__', alter_sys=True)\n"
+)
+
+SandboxFile = namedtuple("SandboxFile", "parent_folder file_path generated_code")
+
+
+def test_entry(file: str, name: str, status: str, duration: float, message: str = "") -> dict:
+    return {"file": file, "name": name, "status": status, "duration_s": round(duration, 3), "message": message[-OUTPUT_LIMIT:]}
+
+
+def parse_junit(path: str, file: str) -> list:
+    """Test entries of a pytest JUnit XML report."""
+    entries = []
+    for case in ET.parse(path).getroot().iter("testcase"):
+        status, message = "passed", ""
+        for child, outcome in (("failure", "failed"), ("error", "error"), ("skipped", "skipped")):
+            element = case.find(child)
+            if element is not None:
+                status, message = outcome, element.get("message") or element.text or ""
+                break
+        entries.append(test_entry(file, case.get("name", ""), status, float(case.get("time") or 0), message))
+    return entries
+
+
+class TestRunner:
+    """Runs test files with pytest in a sandbox, `max_workers` processes at a time."""
+    __test__ = False
+
+    def __init__(self, max_workers=None, timeout=60, cpu_seconds=60, memory_mb=1024, max_file_mb=64):
+        self.max_workers = max_workers or min(8, os.cpu_count() or 1)
+        # Wall-clock seconds per test file, shared by all of its tests
+        self.timeout = timeout
+        self.cpu_seconds = cpu_seconds
+        self.memory_mb = memory_mb
+        self.max_file_mb = max_file_mb
+
+    def pytest_command(self) -> list:
+        """The command running pytest, under the resource limits on POSIX."""
+        if resource is None:
+            return [sys.executable, "-m", "pytest"]
+        limits = (self.cpu_seconds, (self.memory_mb or 0) * 1024 * 1024, (self.max_file_mb or 0) * 1024 * 1024)
+        return [sys.executable, "-c", LIMITED_PYTEST, *map(str, limits)]
+
+    @staticmethod
+    def sandbox_files(project, test_cases) -> tuple:
+        """Files to materialize and the relative paths of the runnable test files; unusable tests become entries."""
+        files = [SandboxFile(item.parent_folder, item.file_path, item.generated_code) for item in project or []]
+        runnable, entries = [], []
+        for test_case in test_cases or []:
+            try:
+                path = safe_relative_path(TESTS_FOLDER, test_case.file_name)
+            except UnsafePathError as e:
+                entries.append(test_entry(test_case.file_name, "", "error", 0.0, str(e)))
+                continue
+            files.append(SandboxFile(TESTS_FOLDER, path.split("/", 1)[1], test_case.generated_code))
+            if path.endswith(".py"):
+                runnable.append(path)
+            else:
+                entries.append(test_entry(test_case.file_name, "", "skipped", 0.0, "Only Python test files are run"))
+        return files, runnable, entries
+
+    @staticmethod
+    def python_path(root: str) -> str:
+        """The sandbox and every folder holding Python files, so tests can import modules by name."""
+        folders = [root]
+        for folder, _, entries in os.walk(root):
+            if folder != root and any(entry.endswith(".py") for entry in entries):
+                folders.append(folder)
+        return os.pathsep.join(folders)
+
+    def run_file(self, root: str, path: str, python_path: str) -> list:
+        """Runs one test file in its own pytest process and returns its test entries."""
+        report = os.path.join(root, f".junit-{path.replace('/', '_')}.xml")
+        command = [
+            *self.pytest_command(), path, "-q", "--no-header", "-p", "no:cacheprovider",
+            f"--rootdir={root}", f"--junitxml={report}",
+        ]
+        env = {
+            "PATH": os.environ.get("PATH", ""), "PYTHONPATH": python_path, "HOME": root,
+            "PYTHONDONTWRITEBYTECODE": "1", "PYTHONHASHSEED": "0",
+            # Plugins installed next to the app (langsmith, anyio, ...) only slow the start up
+            "PYTEST_DISABLE_PLUGIN_AUTOLOAD": "1",
+        }
+        posix = resource is not None
+        started = time.perf_counter()
+        process = subprocess.Popen(
+            command, cwd=root, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True,
+            errors="replace", start_new_session=posix,
+        )
+        try:
+            output, _ = process.communicate(timeout=self.timeout)
+        except subprocess.TimeoutExpired:
+            if posix:
+                os.killpg(process.pid, signal.SIGKILL)
+            else:
+                process.kill()
+            output, _ = process.communicate()
+            return [test_entry(path, "", "timeout", time.perf_counter() - started,
+                               f"Timed out after {self.timeout} s\n{output}")]
+        duration = time.perf_counter() - started
+
+        entries = parse_junit(report, path) if os.path.exists(report) else []
+        if not entries:
+            # Nothing collected (exit code 5) or pytest failed before writing the report
+            status = "skipped" if process.returncode == 5 else "error"
+            entries = [test_entry(path, "", status, duration, output)]
+        elif process.returncode not in (0, 1) and all(entry["status"] != "error" for entry in entries):
+            entries.append(test_entry(path, "", "error", duration, output))
+        return entries
+
+    def run(self, project, test_cases) -> dict:
+        """Runs `test_cases` (TestCaseCode items) against `project` (GeneratedCode items)."""
+        started = time.perf_counter()
+        files, runnable, entries = self.sandbox_files(project, test_cases)
+        with tempfile.TemporaryDirectory(prefix="test_run-") as sandbox:
+            root = os.path.join(sandbox, "project")
+            materializer = ProjectMaterializer(self.max_workers)
+            try:
+                materializer.materialize(files, root)
+            except UnsafePathError as e:
+                # A project file outside the sandbox: nothing can run
+                entries.append(test_entry("", "", "error", 0.0, str(e)))
+                return self.summarize(entries, time.perf_counter() - started)
+            finally:
+                materializer.close()
+            python_path = self.python_path(root)
+            with ThreadPoolExecutor(self.max_workers) as pool:
+                for file_entries in pool.map(lambda path: self.run_file(root, path, python_path), runnable):
+                    entries.extend(file_entries)
+        return self.summarize(entries, time.perf_counter() - started)
+
+    @staticmethod
+    def summarize(entries: list, duration: float) -> dict:
+        keys = {"passed": "passed", "failed": "failed", "error": "errors", "skipped": "skipped", "timeout": "timeouts"}
+        results = dict.fromkeys(STATUSES, 0)
+        for entry in entries:
+            results[keys[entry["status"]]] += 1
+        return {**results, "duration_s": round(duration, 3), "tests": entries}
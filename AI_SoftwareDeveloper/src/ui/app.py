@@ -0,0 +1,76 @@
+"""
+Streamlit review inbox: lists the reviews parked runs are waiting for and submits answers.
+The worker of src/main_review.py resumes each run once its review is answered.
+
+    cd AI_SoftwareDeveloper
+    streamlit run src/ui/app.py -- --checkpoint checkpoints.sqlite
+"""
+import argparse
+import os
+import sys
+import time
+
+# `streamlit run` puts the script's folder on sys.path, not the project root
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+import streamlit as st
+from src.graph.review_queue import ReviewQueue
+
+
+def checkpoint_path() -> str:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--checkpoint", default=os.getenv("CHECKPOINT_PATH", "checkpoints.sqlite"))
+    return parser.parse_known_args()[0].checkpoint
+
+
+@st.cache_resource
+def review_queue(path: str) -> ReviewQueue:
+    return ReviewQueue(path)
+
+
+def show_review(queue: ReviewQueue, review) -> None:
+    payload = review.payload
+    st.subheader(f"{review.thread_id} · {review.review}")
+    st.caption(f"Waiting for {(time.time() - review.created_at) / 60:.0f} min")
+    if payload.get("feedback"):
+        with st.expander("AI review", expanded=True):
+            st.markdown(payload["feedback"])
+    if payload.get("artifact"):
+        with st.expander("Artifact"):
+            st.code(payload["artifact"])
+
+    with st.form(f"answer-{review.thread_id}-{review.interrupt_id}"):
+        answer = st.text_area(payload.get("prompt", "Answer"), placeholder="Requested changes")
+        accept, send = st.columns(2)
+        if accept.form_submit_button("Accept"):
+            answer = "Accepted"
+        elif not send.form_submit_button("Send feedback") or not answer.strip():
+            return
+    try:
+        queue.submit(review.thread_id, answer.strip(), review.interrupt_id)
+    except KeyError as e:
+        st.warning(e.args[0])
+        return
+    st.success("Answer submitted; the worker will resume the run")
+    st.rerun()
+
+
+def main():
+    st.set_page_config(page_title="Review inbox", layout="wide")
+    queue = review_queue(checkpoint_path())
+    reviews = queue.pending()
+
+    st.sidebar.title("Review inbox")
+    st.sidebar.write(f"{len(reviews)} pending reviews")
+    if st.sidebar.button("Refresh"):
+        st.rerun()
+    if not reviews:
+        st.info("No run is waiting for a review.")
+        return
+
+    labels = [f"{review.thread_id} · {review.review}" for review in reviews]
+    selected = st.sidebar.radio("Pending", range(len(reviews)), format_func=labels.__getitem__)
+    show_review(queue, reviews[selected])
+
+
+main()
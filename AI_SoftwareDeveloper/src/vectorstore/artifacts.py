@@ -0,0 +1,300 @@
+"""
+Cross-run store of approved artifacts, looked up by requirement similarity.
+
+Requirements repeat with small variations ("snake game", "simple snake game"), yet every run
+generates its user stories, design documents and project from scratch. ArtifactStore keeps
+the artifacts the model or the human approved (an accept forced by a spent rejection budget
+is not recorded, see DecisionEngine.remember), one entry per requirement, with a FAISS index of the
+normalized requirement embeddings (inner product of unit vectors: cosine similarity). On the
+first pass of a stage, its planner asks `reuse` for the artifact of the most similar stored
+requirement whose similarity reaches `threshold` and skips the model call. The reused
+artifact goes to review like a generated one; a rejection regenerates it from the feedback.
+
+A stage is only reused on top of the upstream artifact it was approved with (the design
+documents of an entry are reused only when the run's user stories are that entry's), so a run
+never mixes documents written for other stories. Past `capacity` entries, the least recently
+used ones are evicted together with their artifacts.
+
+    artifact_store/
+        entries.json         requirements, artifact fingerprints and last use
+        index.faiss          requirement vectors, one id per entry
+        snapshots/, blobs/   the artifacts (StateStore of src/state/serializer.py)
+
+Writes go through one background thread so the decision nodes never wait for the disk; a
+store should be written by one process at a time.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+import faiss
+import numpy as np
+from src.state.render import as_text
+from src.state.serializer import StateStore, write_atomic
+from src.vectorstore.index import HashEmbeddings
+
+# Stages in pipeline order; each one is reused only on top of the stage before it
+STAGES = ("user_stories", "design_documents", "generated_project")
+# Share of `capacity` kept after an eviction, so evictions (and blob pruning) are not run on every write
+EVICTION_RATIO = 0.9
+
+
+def normalize(requirement) -> str:
+    return " ".join(as_text(requirement).lower().split())
+
+
+def artifact_fingerprint(value) -> str:
+    return hashlib.sha256(repr(value).encode("utf-8")).hexdigest()
+
+
+def embeddings_name(embeddings) -> str:
+    """Identifies the embedding space; a stored index built in another one is rebuilt."""
+    return f"{type(embeddings).__name__}:{getattr(embeddings, 'model_name', getattr(embeddings, 'dim', ''))}"
+
+
+@dataclass
+class ArtifactEntry:
+    requirement: str
+    faiss_id: int
+    # Stage -> fingerprint of its approved artifact
+    stages: dict = field(default_factory=dict)
+    used: float = 0.0
+    hits: int = 0
+
+
+class ArtifactStore:
+    """Approved artifacts in `root`, reused for requirements at least `threshold` similar to theirs."""
+    def __init__(self, root="artifact_store", embeddings=None, threshold=0.9, capacity=1000, k=5):
+        self.root = root
+        self.embeddings = embeddings or HashEmbeddings()
+        self.threshold = threshold
+        self.capacity = capacity
+        # Candidates looked at per lookup, most similar first
+        self.k = k
+        self.store = StateStore(root)
+        self.executor = ThreadPoolExecutor(1, thread_name_prefix="artifact-store")
+        self.lock = threading.Lock()
+        # Normalized requirement -> unit vector, the `capacity` most recently used
+        self.vectors = OrderedDict()
+        self.entries = {}
+        # FAISS id -> entry id
+        self.ids = {}
+        self.index = None
+        self.next_id = 0
+        self.lookups = dict.fromkeys(STAGES, 0)
+        self.hits = dict.fromkeys(STAGES, 0)
+        self.recorded = 0
+        self.evicted = 0
+        self.load()
+
+    @property
+    def entries_path(self) -> str:
+        return os.path.join(self.root, "entries.json")
+
+    @property
+    def index_path(self) -> str:
+        return os.path.join(self.root, "index.faiss")
+
+    @staticmethod
+    def entry_id(requirement: str) -> str:
+        return hashlib.sha256(requirement.encode("utf-8")).hexdigest()[:16]
+
+    @staticmethod
+    def snapshot_name(entry_id: str, stage: str) -> str:
+        return f"{entry_id}.{stage}"
+
+    def vector(self, requirement: str):
+        with self.lock:
+            vector = self.vectors.get(requirement)
+            if vector is not None:
+                self.vectors.move_to_end(requirement)
+                return vector
+        # Embedded outside the lock: lookups of other requirements do not wait for it
+        vector = np.asarray(self.embeddings.embed_query(requirement), dtype="float32")
+        norm = np.linalg.norm(vector)
+        vector = vector / norm if norm else vector
+        with self.lock:
+            self.cache_vector(requirement, vector)
+        return vector
+
+    def cache_vector(self, requirement: str, vector) -> None:
+        """Called with the lock held (or while loading); drops the least recently used vectors past `capacity`."""
+        self.vectors[requirement] = vector
+        self.vectors.move_to_end(requirement)
+        while len(self.vectors) > self.capacity:
+            self.vectors.popitem(last=False)
+
+    # Persistence
+
+    def load(self) -> None:
+        if not os.path.exists(self.entries_path):
+            return
+        with open(self.entries_path, encoding="utf-8") as f:
+            document = json.load(f)
+        self.next_id = document["next_id"]
+        self.entries = {entry_id: ArtifactEntry(**entry) for entry_id, entry in document["entries"].items()}
+        self.ids = {entry.faiss_id: entry_id for entry_id, entry in self.entries.items()}
+        if document["embeddings"] == embeddings_name(self.embeddings) and os.path.exists(self.index_path):
+            with open(self.index_path, "rb") as f:
+                self.index = faiss.deserialize_index(np.frombuffer(f.read(), dtype="uint8"))
+            if self.index.ntotal == len(self.entries):
+                return
+        # Other embeddings, or an index written before a crash: embed the stored requirements again
+        self.index = None
+        entries = list(self.entries.values())
+        if entries:
+            vectors = self.embeddings.embed_documents([entry.requirement for entry in entries])
+            for entry, vector in zip(entries, vectors):
+                vector = np.asarray(vector, dtype="float32")
+                norm = np.linalg.norm(vector)
+                vector = vector / norm if norm else vector
+                self.cache_vector(entry.requirement, vector)
+                self.add_vector(entry.faiss_id, vector)
+
+    def save(self) -> None:
+        """Writes the index and then the entries; called with the lock held."""
+        if self.index is not None:
+            write_atomic(self.index_path, faiss.serialize_index(self.index).tobytes())
+        document = {
+            "version": 1, "embeddings": embeddings_name(self.embeddings), "next_id": self.next_id,
+            "entries": {entry_id: asdict(entry) for entry_id, entry in self.entries.items()},
+        }
+        write_atomic(self.entries_path, json.dumps(document, separators=(",", ":")).encode("utf-8"))
+
+    def add_vector(self, faiss_id: int, vector) -> None:
+        if self.index is None:
+            self.index = faiss.IndexIDMap2(faiss.IndexFlatIP(len(vector)))
+        self.index.add_with_ids(vector[None], np.array([faiss_id], dtype="int64"))
+
+    # Lookups
+
+    def reuse(self, state, stage: str):
+        """The approved `stage` artifact of the most similar stored requirement, or None."""
+        requirement = normalize(state.get("requirement"))
+        position = STAGES.index(stage)
+        upstream = artifact_fingerprint(state.get(STAGES[position - 1])) if position else None
+        vector = self.vector(requirement)
+        with self.lock:
+            self.lookups[stage] += 1
+            if self.index is None or not self.entries:
+                return None
+            scores, ids = self.index.search(vector[None], min(self.k, len(self.entries)))
+            for score, faiss_id in zip(scores[0].tolist(), ids[0].tolist()):
+                if score < self.threshold:
+                    break
+                entry_id = self.ids.get(faiss_id)
+                entry = self.entries.get(entry_id)
+                if entry is None or stage not in entry.stages:
+                    continue
+                if position and entry.stages.get(STAGES[position - 1]) != upstream:
+                    continue
+                try:
+                    artifact = self.store.load(self.snapshot_name(entry_id, stage), lazy=False)[stage]
+                except FileNotFoundError:
+                    continue
+                entry.used = time.time()
+                entry.hits += 1
+                self.hits[stage] += 1
+                print("\n=== Artifact Store ===")
+                print(f"Reusing the approved {stage} of '{entry.requirement}' (similarity {score:.2f})")
+                return artifact
+        return None
+
+    async def areuse(self, state, stage: str):
+        """Async variant of `reuse`; the embedding and the snapshot read run in a worker thread."""
+        return await asyncio.to_thread(self.reuse, state, stage)
+
+    # Writes
+
+    def record(self, state, stage: str) -> None:
+        """Stores the approved `stage` artifact of `state` in the background; other stages are ignored."""
+        if stage not in STAGES or not state.get(stage):
+            return
+        # The values are taken now: the state moves on while the write waits
+        values = {key: state.get(key) for key in STAGES[:STAGES.index(stage) + 1]}
+        self.executor.submit(self.write, normalize(state.get("requirement")), stage, values)
+
+    def write(self, requirement: str, stage: str, values: dict) -> None:
+        try:
+            vector = self.vector(requirement)
+            with self.lock:
+                self.write_entry(requirement, stage, values, vector)
+        except Exception as e:
+            print(f"⚠️ Could not store the approved {stage}: {e}")
+
+    def write_entry(self, requirement: str, stage: str, values: dict, vector) -> None:
+        entry_id = self.entry_id(requirement)
+        entry = self.entries.get(entry_id)
+        position = STAGES.index(stage)
+        fingerprints = {key: artifact_fingerprint(value) for key, value in values.items()}
+        if position and (entry is None or entry.stages.get(STAGES[position - 1]) != fingerprints[STAGES[position - 1]]):
+            # Its upstream artifact was never approved (e.g. accepted by a spent rejection budget)
+            return
+        if entry is None:
+            entry = self.entries[entry_id] = ArtifactEntry(requirement, self.next_id)
+            self.ids[entry.faiss_id] = entry_id
+            self.next_id += 1
+            self.add_vector(entry.faiss_id, vector)
+        if entry.stages.get(stage) != fingerprints[stage]:
+            self.store.save({stage: values[stage]}, self.snapshot_name(entry_id, stage))
+            entry.stages[stage] = fingerprints[stage]
+            # The later stages were approved on top of the previous version
+            for later in STAGES[position + 1:]:
+                if entry.stages.pop(later, None) is not None:
+                    self.store.delete(self.snapshot_name(entry_id, later))
+        entry.used = time.time()
+        self.recorded += 1
+        self.evict()
+        self.save()
+
+    def evict(self) -> None:
+        """Drops the least recently used entries down to EVICTION_RATIO of `capacity`."""
+        if len(self.entries) <= self.capacity:
+            return
+        keep = max(int(self.capacity * EVICTION_RATIO), 1)
+        victims = sorted(self.entries, key=lambda entry_id: self.entries[entry_id].used)[:len(self.entries) - keep]
+        self.index.remove_ids(np.array([self.entries[entry_id].faiss_id for entry_id in victims], dtype="int64"))
+        for entry_id in victims:
+            entry = self.entries.pop(entry_id)
+            del self.ids[entry.faiss_id]
+            self.vectors.pop(entry.requirement, None)
+            for stage in entry.stages:
+                self.store.delete(self.snapshot_name(entry_id, stage))
+        self.store.prune_blobs()
+        self.evicted += len(victims)
+
+    def close(self) -> None:
+        """Waits for the pending writes and saves the last uses of the reused entries."""
+        self.executor.shutdown(wait=True)
+        with self.lock:
+            if self.entries:
+                self.save()
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "entries": len(self.entries),
+                "recorded": self.recorded,
+                "evicted": self.evicted,
+                "stages": {
+                    stage: {
+                        "lookups": self.lookups[stage],
+                        "hits": self.hits[stage],
+                        "hit_rate": round(self.hits[stage] / self.lookups[stage], 3) if self.lookups[stage] else 0.0,
+                    }
+                    for stage in STAGES
+                },
+            }
+
+    def report(self) -> str:
+        stats = self.stats()
+        lines = [f"Artifact store: {stats['entries']} entries, {stats['recorded']} approvals recorded, "
+                 f"{stats['evicted']} evicted"]
+        for stage, counts in stats["stages"].items():
+            lines.append(f"  {stage:<20} {counts['hits']:>4} / {counts['lookups']:<4} reused {counts['hit_rate']:.0%}")
+        return "\n".join(lines)
@@ -0,0 +1,209 @@
+"""
+Incremental FAISS retrieval index over generated code and design documents.
+
+Review and fix nodes ask the ProjectRetriever for the top-k chunks relevant to what
+they are doing instead of reading the whole project. Chunks are keyed by content hash,
+so after an edit only the chunks whose content changed are embedded again. The indexes of
+the least recently seen requirements and the least recently used vectors are dropped past
+the retriever's `max_indexes` / `max_vectors`, so a long-lived process does not grow with
+every run.
+"""
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+import faiss
+import numpy as np
+from src.state.render import as_text, count_tokens, file_key, render_project
+
+
+class HashEmbeddings:
+    """
+    Offline, deterministic embeddings: hashed bag of word and identifier-part features.
+    Implements the langchain Embeddings interface (`embed_documents` / `embed_query`).
+    """
+    def __init__(self, dim=512):
+        self.dim = dim
+
+    def embed_query(self, text: str) -> list:
+        vector = np.zeros(self.dim, dtype="float32")
+        for word in re.findall(r"[A-Za-z_][A-Za-z0-9_]*|\d+", text.lower()):
+            for token in {word, *word.split("_")}:
+                if token:
+                    digest = hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest()
+                    bucket = int.from_bytes(digest[:4], "little") % self.dim
+                    vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts: list) -> list:
+        return [self.embed_query(text) for text in texts]
+
+
+def load_embeddings(backend="hash", model_name="sentence-transformers/all-MiniLM-L6-v2"):
+    """Returns the embedding backend: 'hash' (offline) or 'huggingface'."""
+    if backend == "hash":
+        return HashEmbeddings()
+    if backend == "huggingface":
+        from langchain_huggingface import HuggingFaceEmbeddings
+        return HuggingFaceEmbeddings(model_name=model_name)
+    raise ValueError(f"Unknown embedding backend: {backend}")
+
+
+@dataclass(frozen=True)
+class Chunk:
+    source: str
+    kind: str
+    start_line: int
+    text: str
+
+    @property
+    def hash(self) -> str:
+        return hashlib.sha256(f"{self.source}\0{self.text}".encode("utf-8")).hexdigest()
+
+
+def chunk_project(files, max_lines=60) -> list:
+    """Splits every generated file into chunks of at most `max_lines` lines."""
+    chunks = []
+    for item in files or []:
+        lines = item.generated_code.splitlines()
+        for start in range(0, max(len(lines), 1), max_lines):
+            chunks.append(Chunk(file_key(item), "code", start + 1, "\n".join(lines[start:start + max_lines])))
+    return chunks
+
+
+def chunk_documents(documents, max_chars=2000) -> list:
+    """Splits design documents into paragraph-aligned chunks of at most ~`max_chars` characters."""
+    chunks = []
+    for n, document in enumerate(documents or [], 1):
+        name = document.get("name", f"Document {n}") if isinstance(document, dict) else f"Document {n}"
+        text = as_text(document.get("description", "") if isinstance(document, dict) else document)
+        current, start = [], 1
+        for paragraph in text.split("\n\n"):
+            if current and sum(len(p) for p in current) + len(paragraph) > max_chars:
+                chunks.append(Chunk(name, "doc", start, "\n\n".join(current)))
+                start += len(current)
+                current = []
+            current.append(paragraph)
+        if current:
+            chunks.append(Chunk(name, "doc", start, "\n\n".join(current)))
+    return chunks
+
+
+class ChunkIndex:
+    """FAISS inner-product index of chunks, updated incrementally by content hash."""
+    def __init__(self, embeddings, vectors: OrderedDict):
+        self.embeddings = embeddings
+        # Shared content hash -> vector LRU cache, so identical chunks are not embedded twice
+        self.vectors = vectors
+        self.index = None
+        self.chunks = {}
+        self.ids = {}
+        self.next_id = 0
+        self.embedded = 0
+        self.reused = 0
+
+    def update(self, chunks: list) -> None:
+        """Drops chunks that disappeared and embeds only the ones whose content hash is new."""
+        current = {chunk.hash: chunk for chunk in chunks}
+        stale = [self.ids.pop(h) for h in list(self.ids) if h not in current]
+        if stale and self.index is not None:
+            self.index.remove_ids(np.array(stale, dtype="int64"))
+            for chunk_id in stale:
+                del self.chunks[chunk_id]
+
+        new = [chunk for h, chunk in current.items() if h not in self.ids]
+        if not new:
+            return
+        missing = [chunk for chunk in new if chunk.hash not in self.vectors]
+        for chunk in new:
+            if chunk.hash in self.vectors:
+                self.vectors.move_to_end(chunk.hash)
+        if missing:
+            for chunk, vector in zip(missing, self.embeddings.embed_documents([c.text for c in missing])):
+                self.vectors[chunk.hash] = np.asarray(vector, dtype="float32")
+        self.embedded += len(missing)
+        self.reused += len(new) - len(missing)
+
+        matrix = np.stack([self.vectors[chunk.hash] for chunk in new])
+        if self.index is None:
+            self.index = faiss.IndexIDMap2(faiss.IndexFlatIP(matrix.shape[1]))
+        ids = np.arange(self.next_id, self.next_id + len(new), dtype="int64")
+        self.next_id += len(new)
+        self.index.add_with_ids(matrix, ids)
+        for chunk_id, chunk in zip(ids.tolist(), new):
+            self.ids[chunk.hash] = chunk_id
+            self.chunks[chunk_id] = chunk
+
+    def search(self, query: str, k: int, kind=None) -> list:
+        """Returns the `k` chunks most similar to `query`, optionally only of one `kind`."""
+        if self.index is None or not self.chunks:
+            return []
+        vector = np.asarray([self.embeddings.embed_query(query)], dtype="float32")
+        # Over-fetch when filtering by kind
+        _, ids = self.index.search(vector, min(len(self.chunks), k if kind is None else k * 4))
+        found = [self.chunks[chunk_id] for chunk_id in ids[0].tolist() if chunk_id in self.chunks]
+        return [chunk for chunk in found if kind is None or chunk.kind == kind][:k]
+
+
+class ProjectRetriever:
+    """
+    Keeps one ChunkIndex per requirement (so concurrent runs do not evict each other's
+    chunks) and renders the top-k chunks relevant to a query for the prompts. Only the
+    `max_indexes` most recently used indexes and `max_vectors` cached vectors are kept.
+    """
+    def __init__(self, embeddings=None, k=8, max_lines=60, max_indexes=16, max_vectors=50_000):
+        self.embeddings = embeddings or HashEmbeddings()
+        self.k = k
+        self.max_lines = max_lines
+        self.max_indexes = max_indexes
+        self.max_vectors = max_vectors
+        self.vectors = OrderedDict()
+        self.indexes = OrderedDict()
+        self.lock = threading.Lock()
+
+    def index_for(self, state) -> ChunkIndex:
+        """Brings the index of this run up to date with the state and returns it."""
+        namespace = hashlib.sha256(as_text(state.get("requirement")).encode("utf-8")).hexdigest()
+        with self.lock:
+            index = self.indexes.get(namespace)
+            if index is None:
+                index = self.indexes[namespace] = ChunkIndex(self.embeddings, self.vectors)
+            self.indexes.move_to_end(namespace)
+            index.update(
+                chunk_project(state.get("generated_project"), self.max_lines)
+                + chunk_documents(state.get("design_documents"))
+            )
+            while len(self.indexes) > self.max_indexes:
+                self.indexes.popitem(last=False)
+            while len(self.vectors) > self.max_vectors:
+                self.vectors.popitem(last=False)
+        return index
+
+    def search(self, state, query: str, k=None, kind=None) -> list:
+        index = self.index_for(state)
+        with self.lock:
+            return index.search(query, k or self.k, kind)
+
+    def relevant_files(self, state, query: str, k=None) -> list:
+        """Keys ('parent_folder/file_path') of the files holding the top-k code chunks."""
+        return list(dict.fromkeys(chunk.source for chunk in self.search(state, query, k, kind="code")))
+
+    def render_context(self, state, query: str, budget: int, k=None, kind=None) -> str:
+        """Renders the top-k chunks for `query`, most relevant first, within `budget` tokens."""
+        blocks, remaining = [], budget
+        for chunk in self.search(state, query, k, kind):
+            where = f"from line {chunk.start_line}" if chunk.kind == "code" else f"part {chunk.start_line}"
+            block = f"### {chunk.source} ({where})\n```\n{chunk.text}\n```"
+            if count_tokens(block) > remaining:
+                break
+            blocks.append(block)
+            remaining -= count_tokens(block)
+        return "\n\n".join(blocks) if blocks else "No relevant content found."
+
+    def render_project_context(self, state, query: str, budget: int) -> str:
+        """Project manifest followed by the code chunks most relevant to `query`, within `budget` tokens."""
+        manifest = render_project(state.get("generated_project"), budget // 4, manifest_only=True)
+        relevant = self.render_context(state, query, budget - count_tokens(manifest), kind="code")
+        return f"{manifest}\n\n## Relevant code\n{relevant}"